@@ -0,0 +1,88 @@
+import os
+import time
+import shutil
+import socket
+import logging
+import tempfile
+import subprocess
+import psycopg2
+from contextlib import contextmanager
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_ready(params, timeout=60):
+    """
+    Wait until a server accepts connections.
+    :param params: connection parameters
+    :param timeout: seconds to wait
+    :return: None
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            psycopg2.connect(**params).close()
+            return
+        except psycopg2.OperationalError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+@contextmanager
+def temp_cluster():
+    """
+    Run a throwaway PostgreSQL cluster in a temporary directory, with the `initdb` and `pg_ctl` of the PATH or of
+    `pg_config --bindir`. Cannot be run as root.
+    :return: connection parameters of the cluster, as keywords of `psycopg2.connect`
+    """
+    bin_dir = os.path.dirname(shutil.which('initdb') or '')
+    if not bin_dir and shutil.which('pg_config'):
+        bin_dir = subprocess.run(['pg_config', '--bindir'], capture_output=True, text=True, check=True).stdout.strip()
+    if not os.path.isfile(os.path.join(bin_dir, 'initdb')):
+        raise RuntimeError('initdb was not found, add the PostgreSQL binaries to the PATH')
+    with tempfile.TemporaryDirectory(prefix='ghelephant-bench-') as directory:
+        data, port = os.path.join(directory, 'data'), _free_port()
+        subprocess.run([os.path.join(bin_dir, 'initdb'), '-D', data, '-U', 'postgres', '-A', 'trust'],
+                       check=True, capture_output=True)
+        subprocess.run([os.path.join(bin_dir, 'pg_ctl'), '-D', data, '-l', os.path.join(directory, 'log'), '-w',
+                        '-o', f'-p {port} -k {directory} -c listen_addresses=127.0.0.1 -c fsync=off', 'start'],
+                       check=True, capture_output=True)
+        try:
+            params = {'user': 'postgres', 'password': None, 'database': 'postgres', 'host': '127.0.0.1',
+                      'port': port}
+            _wait_until_ready(params)
+            yield params
+        finally:
+            subprocess.run([os.path.join(bin_dir, 'pg_ctl'), '-D', data, '-m', 'immediate', 'stop'],
+                           capture_output=True)
+
+
+@contextmanager
+def docker_container(image='postgres:16'):
+    """
+    Run a throwaway PostgreSQL server in a docker container. The temporary directory is mounted at the same path in
+    the container, so that the server can read the csv files written there.
+    :param image: docker image of the server
+    :return: connection parameters of the server, as keywords of `psycopg2.connect`
+    """
+    port, password = _free_port(), 'benchmark'
+    volume = tempfile.gettempdir()
+    container = subprocess.run(['docker', 'run', '-d', '--rm', '-p', f'127.0.0.1:{port}:5432',
+                                '-e', f'POSTGRES_PASSWORD={password}', '-v', f'{volume}:{volume}', image,
+                                '-c', 'fsync=off'], check=True, capture_output=True, text=True).stdout.strip()
+    try:
+        params = {'user': 'postgres', 'password': password, 'database': 'postgres', 'host': '127.0.0.1',
+                  'port': port}
+        _wait_until_ready(params)
+        # the server restarts once after its initialization
+        time.sleep(2)
+        _wait_until_ready(params)
+        yield params
+    finally:
+        logging.info(f'Removing container {container[:12]}')
+        subprocess.run(['docker', 'stop', container], capture_output=True)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the conversion and load hot paths on a synthetic hour of events, see `synthetic_events.py`.
+
+Run from the repository root, e.g. `python3 benchmarks/run_benchmarks.py --events 100000 --output results.json`,
+add `--database temp` (a throwaway cluster, requires the PostgreSQL binaries), `--database docker` or `--database env`
+(the server of the `.env` file) to benchmark the load modes, and `--baseline` with the results of an earlier run to
+compare against them.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from types import SimpleNamespace
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_PATH)
+
+import psycopg2
+from json_to_csv_converter import JSONToCSVConverter
+from csv_writers import CSVWriters
+from binary_writers import BinaryCopyWriters
+from parquet_writers import ParquetWriters, pa
+from database_link import DatabaseLink
+from synthetic_events import SyntheticHour
+from postgres import temp_cluster, docker_container
+
+WRITER_CLASSES = {'csv': CSVWriters, 'binary': BinaryCopyWriters, 'parquet': ParquetWriters}
+# load mode -> keywords of `insert_csvs_into_db`, whether the tables are kept in memory, output format
+LOAD_MODES = {
+    'stdin': ({'use_stdin': True}, False, 'csv'),
+    'memory': ({'use_stdin': True}, True, 'csv'),
+    'binary': ({'use_stdin': True, 'binary': True}, False, 'binary'),
+    'server': ({}, False, 'csv'),
+    'pandas': ({'use_pandas': True}, False, 'csv'),
+}
+BENCHMARK_DATABASE = 'ghelephant_benchmark'
+
+
+def peak_rss():
+    """
+    Get the peak resident set size of the process.
+    :return: peak RSS in MB
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return maxrss / (1 << 20) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def convert(path, work_path, output_format, low_memory, repeat):
+    """
+    Benchmark `JSONToCSVConverter.write_events` writing files.
+    :return: dict of the measurements
+    """
+    times = []
+    for _ in range(repeat):
+        writer = WRITER_CLASSES[output_format]('bench', work_path)
+        converter = JSONToCSVConverter(writer, low_memory=low_memory)
+        with open(path, 'rb') as f:
+            start = time.perf_counter()
+            converter.write_events(f)
+            writer.close()
+            times.append(time.perf_counter() - start)
+    return {'events': converter.events_written, 'seconds': min(times),
+            'events_per_sec': converter.events_written / min(times), 'peak_rss_mb': peak_rss()}
+
+
+def write(path, work_path, output_format, repeat):
+    """
+    Benchmark the writers alone, with the rows of the hour converted beforehand.
+    :return: dict of the measurements
+    """
+    tables = {name: [] for name in CSVWriters.file_names}
+    recorder = SimpleNamespace(writers={name: SimpleNamespace(writerow=rows.append) for name, rows in tables.items()})
+    with open(path, 'rb') as f:
+        JSONToCSVConverter(recorder).write_events(f)
+    writer_class = WRITER_CLASSES[output_format]
+    times = []
+    for _ in range(repeat):
+        writer = writer_class('bench', work_path)
+        start = time.perf_counter()
+        for name, rows in tables.items():
+            table_writer = writer.writers[name]
+            for row in rows:
+                table_writer.writerow(row)
+        writer.close()
+        times.append(time.perf_counter() - start)
+    size = sum(os.path.getsize(writer_class.file_path(work_path, name, 'bench')) for name in tables)
+    rows = sum(len(rows) for rows in tables.values())
+    return {'rows': rows, 'bytes': size, 'seconds': min(times), 'bytes_per_sec': size / min(times),
+            'rows_per_sec': rows / min(times), 'peak_rss_mb': peak_rss()}
+
+
+def load(path, work_path, mode, params, repeat):
+    """
+    Benchmark a load mode of `DatabaseLink.insert_csvs_into_db` on empty tables.
+    :return: dict of the measurements
+    """
+    kwargs, in_memory, output_format = LOAD_MODES[mode]
+    writer_class = WRITER_CLASSES[output_format]
+    times, rows = [], 0
+    for _ in range(repeat):
+        db = DatabaseLink(username=params['user'], password=params['password'], database=BENCHMARK_DATABASE,
+                          host=params['host'], port=params['port'], data_path=work_path)
+        with db:
+            db.cursor.execute(f'DROP TABLE IF EXISTS {", ".join(CSVWriters.file_names)} CASCADE')
+            db.create_tables()
+            db.conn.commit()
+            writer = writer_class('bench', work_path, in_memory=in_memory)
+            with open(path, 'rb') as f:
+                JSONToCSVConverter(writer).write_events(f)
+            writer.close()
+            start = time.perf_counter()
+            loaded = db.insert_csvs_into_db('bench', writer=writer if in_memory else None, **kwargs)
+            db.conn.commit()
+            times.append(time.perf_counter() - start)
+            rows = 0
+            for table in CSVWriters.file_names:
+                db.cursor.execute(f'SELECT count(*) FROM {table}')
+                rows += db.cursor.fetchone()[0]
+    return {'loaded': loaded, 'rows': rows, 'seconds': min(times), 'rows_per_sec': rows / min(times),
+            'peak_rss_mb': peak_rss()}
+
+
+def run_isolated(function, *args):
+    """
+    Run a benchmark in a new process, so that its peak RSS is its own.
+    :return: result of the benchmark, or the error it raised
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        try:
+            return executor.submit(function, *args).result()
+        except Exception as e:
+            logging.error(f'{function.__name__}{args[2:3]} failed: {e}')
+            return {'error': str(e)}
+
+
+def database(kind):
+    """
+    Get the server the load modes are benchmarked on.
+    :param kind: "temp", "docker" or "env"
+    :return: context manager of the connection parameters
+    """
+    if kind == 'temp':
+        return temp_cluster()
+    if kind == 'docker':
+        return docker_container()
+    from dotenv import load_dotenv
+    load_dotenv()
+    return nullcontext({'user': os.getenv('DATABASE_USERNAME'), 'password': os.getenv('DATABASE_PASSWORD'),
+                        'database': os.getenv('DATABASE_NAME'), 'host': os.getenv('DATABASE_HOST'),
+                        'port': os.getenv('DATABASE_PORT')})
+
+
+def create_benchmark_database(params):
+    """
+    Create the database the load modes are benchmarked in, so that the tables of the configured database are never
+    touched.
+    :param params: connection parameters of the server
+    :return: None
+    """
+    conn = psycopg2.connect(**params)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_database WHERE datname = %s', (BENCHMARK_DATABASE,))
+        if cursor.fetchone() is None:
+            cursor.execute(f'CREATE DATABASE {BENCHMARK_DATABASE}')
+    conn.close()
+
+
+def compare(results, baseline):
+    """
+    Log the ratio of each throughput to the one of a baseline run, above 1 when faster.
+    :param results: results of this run
+    :param baseline: results of the baseline run
+    :return: None
+    """
+    for name, measurements in results['benchmarks'].items():
+        base = baseline['benchmarks'].get(name, {})
+        for metric in ('events_per_sec', 'bytes_per_sec', 'rows_per_sec', 'peak_rss_mb'):
+            if metric in measurements and base.get(metric):
+                logging.info(f'{name:<24} {metric:<15} {measurements[metric]:>14.1f} vs {base[metric]:>14.1f} '
+                             f'({measurements[metric] / base[metric]:.2f}x)')
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=100000, help='Number of events of the synthetic hour.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic hour.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each benchmark, the fastest one is reported.')
+    parser.add_argument('--database', type=str, choices=['temp', 'docker', 'env'], required=False,
+                        help='Server the load modes are benchmarked on: "temp" for a throwaway cluster created with '
+                             'initdb, "docker" for a container, "env" for the server of the .env file. The tables '
+                             f'are created in a database "{BENCHMARK_DATABASE}". Without it, only the conversion is '
+                             'benchmarked.')
+    parser.add_argument('--load-modes', type=str, default=','.join(LOAD_MODES),
+                        help='Comma-separated list of the load modes to benchmark.')
+    parser.add_argument('--output', type=str, default='benchmark-results.json', help='File the results are written to.')
+    parser.add_argument('--baseline', type=str, required=False, help='Results of an earlier run to compare against.')
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp(prefix='ghelephant-bench-')
+    # the database server may run as another user and read the csv files itself
+    os.chmod(work_path, 0o755)
+    path = f'{work_path}/bench-input.json'
+    try:
+        logging.info(f'Generating {args.events} events')
+        with open(path, 'wb') as f:
+            f.write(SyntheticHour(seed=args.seed).lines(args.events))
+        formats = ['csv', 'binary'] + (['parquet'] if pa is not None else [])
+        benchmarks = {}
+        for output_format in formats:
+            logging.info(f'Benchmarking conversion to {output_format}')
+            benchmarks[f'convert_{output_format}'] = run_isolated(convert, path, work_path, output_format, False,
+                                                                  args.repeat)
+        benchmarks['convert_csv_low_memory'] = run_isolated(convert, path, work_path, 'csv', True, args.repeat)
+        for output_format in formats:
+            logging.info(f'Benchmarking {output_format} writers')
+            benchmarks[f'write_{output_format}'] = run_isolated(write, path, work_path, output_format, args.repeat)
+        if args.database:
+            with database(args.database) as params:
+                create_benchmark_database(params)
+                for mode in args.load_modes.split(','):
+                    logging.info(f'Benchmarking load mode {mode}')
+                    benchmarks[f'load_{mode}'] = run_isolated(load, path, work_path, mode, params, args.repeat)
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                            cwd=REPOSITORY_PATH).stdout.strip()
+    results = {'meta': {'commit': commit, 'events': args.events, 'seed': args.seed, 'repeat': args.repeat,
+                        'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+               'benchmarks': benchmarks}
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    logging.info(f'Results written to {args.output}')
+    for name, measurements in benchmarks.items():
+        logging.info(f'{name:<24} {json.dumps(measurements)}')
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
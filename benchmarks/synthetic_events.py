@@ -0,0 +1,178 @@
+import random
+import msgspec
+
+# share of each event type in an hour, roughly the mix of the GH Archive hours of recent years
+EVENT_MIX = {
+    'PushEvent': 0.46,
+    'CreateEvent': 0.11,
+    'WatchEvent': 0.08,
+    'PullRequestEvent': 0.07,
+    'IssueCommentEvent': 0.05,
+    'DeleteEvent': 0.04,
+    'PullRequestReviewEvent': 0.04,
+    'PullRequestReviewCommentEvent': 0.03,
+    'IssuesEvent': 0.025,
+    'ForkEvent': 0.02,
+    'ReleaseEvent': 0.01,
+    'GollumEvent': 0.003,
+    'MemberEvent': 0.003,
+    'CommitCommentEvent': 0.002,
+    'PublicEvent': 0.002,
+}
+
+WORDS = ['fix', 'add', 'update', 'remove', 'refactor', 'test', 'docs', 'build', 'release', 'bump', 'the', 'a', 'for',
+         'parser', 'config', 'readme', 'handler', 'api', 'version', 'dependency', 'typo', 'bug', '"quoted"', 'comma,',
+         'ünïcödé', 'line\nbreak']
+
+
+class SyntheticHour:
+    """
+    Generates the lines of a synthetic GH Archive hour file. The events cover all event types converted by
+    JSONToCSVConverter in the proportions of `EVENT_MIX`, with text fields of varying length, a few events repeated
+    like in the archive, and repositories, users, issues and pull requests drawn from pools so that they recur.
+    """
+    def __init__(self, seed=0, repos=5000, users=20000, duplicates=0.001, created_at='2023-01-01T15:00:00Z'):
+        """
+        :param seed: seed of the random generator, the same seed generates the same events
+        :param repos: number of distinct repositories
+        :param users: number of distinct users
+        :param duplicates: share of events that repeat an earlier event of the hour
+        :param created_at: creation time of the events
+        """
+        self.random = random.Random(seed)
+        self.repos = repos
+        self.users = users
+        self.duplicates = duplicates
+        self.created_at = created_at
+        self.encoder = msgspec.json.Encoder()
+
+    def lines(self, events):
+        """
+        Generate the lines of an hour, oldest event first like in the archive.
+        :param events: number of events
+        :return: bytes with one JSON event per line
+        """
+        types = self.random.choices(list(EVENT_MIX), weights=list(EVENT_MIX.values()), k=events)
+        lines = []
+        for i, event_type in enumerate(types):
+            if lines and self.random.random() < self.duplicates:
+                lines.append(self.random.choice(lines))
+                continue
+            lines.append(self.encoder.encode(self.event(10_000_000_000 + i, event_type)))
+        return b'\n'.join(lines) + b'\n'
+
+    def event(self, event_id, event_type):
+        """
+        Generate an event.
+        :param event_id: id of the event
+        :param event_type: type of the event
+        :return: dict of the event
+        """
+        repo = self.random.randrange(self.repos)
+        actor = self.random.randrange(self.users)
+        event = {'id': str(event_id), 'type': event_type, 'actor': {'id': actor, 'login': f'user{actor}'},
+                 'repo': {'id': repo, 'name': f'owner{repo % 1000}/repo{repo}'}, 'public': True,
+                 'created_at': self.created_at, 'payload': getattr(self, f'_{event_type}')(event_id)}
+        if repo % 4 == 0:
+            event['org'] = {'id': repo % 1000, 'login': f'owner{repo % 1000}'}
+        return event
+
+    def text(self, words):
+        return ' '.join(self.random.choices(WORDS, k=self.random.randint(1, words)))
+
+    def user(self, user_id=None):
+        user_id = self.random.randrange(self.users) if user_id is None else user_id
+        return {'id': user_id, 'login': f'user{user_id}', 'type': 'User', 'site_admin': False}
+
+    def reactions(self):
+        return {'total_count': 1, '+1': 1, '-1': 0, 'laugh': 0, 'hooray': 0, 'confused': 0, 'heart': 0, 'rocket': 0,
+                'eyes': 0}
+
+    def forkee(self, repo_id):
+        return {'id': repo_id, 'name': f'repo{repo_id}', 'private': False, 'owner': self.user(), 'fork': True,
+                'created_at': self.created_at, 'updated_at': self.created_at, 'pushed_at': self.created_at,
+                'size': self.random.randrange(100000), 'stargazers_count': 0, 'watchers_count': 0, 'has_issues': True,
+                'has_downloads': True, 'has_wiki': True, 'forks_count': 0, 'open_issues_count': 0, 'forks': 0,
+                'open_issues': 0, 'watchers': 0, 'default_branch': 'main', 'description': self.text(12),
+                'language': self.random.choice(['Python', 'JavaScript', 'Go', None]), 'topics': ['a', 'b'],
+                'license': {'key': 'mit', 'name': 'MIT License', 'spdx_id': 'MIT'}}
+
+    def issue(self):
+        issue_id = self.random.randrange(10 * self.repos)
+        return {'id': issue_id, 'number': issue_id % 1000, 'title': self.text(8), 'user': self.user(),
+                'state': 'open', 'locked': False, 'comments': self.random.randrange(20), 'created_at': self.created_at,
+                'updated_at': self.created_at, 'labels': [{'name': 'bug'}], 'assignees': [],
+                'author_association': 'CONTRIBUTOR', 'body': self.text(60), 'reactions': self.reactions()}
+
+    def pull_request(self):
+        pr_id = self.random.randrange(10 * self.repos)
+        return {'id': pr_id, 'number': pr_id % 1000, 'state': 'open', 'locked': False, 'title': self.text(8),
+                'user': self.user(), 'body': self.text(80), 'created_at': self.created_at,
+                'updated_at': self.created_at, 'head': {'sha': f'{pr_id:040x}', 'repo': self.forkee(pr_id)},
+                'base': {'sha': f'{pr_id + 1:040x}', 'repo': self.forkee(pr_id + 1)}, 'assignees': [],
+                'requested_reviewers': [self.user()], 'requested_teams': [], 'labels': [{'name': 'enhancement'}],
+                'draft': False, 'author_association': 'MEMBER', 'merged': False, 'comments': 1,
+                'review_comments': 0, 'maintainer_can_modify': False, 'commits': 1, 'additions': 10,
+                'deletions': 2, 'changed_files': 1}
+
+    def _PushEvent(self, event_id):
+        commits = [{'sha': f'{event_id + c:040x}', 'author': {'email': 'dev@example.com', 'name': 'Dev'},
+                    'message': self.text(15), 'distinct': True} for c in range(self.random.choice([1, 1, 1, 2, 3, 5]))]
+        return {'push_id': event_id, 'size': len(commits), 'distinct_size': len(commits), 'ref': 'refs/heads/main',
+                'head': commits[-1]['sha'], 'before': f'{event_id - 1:040x}', 'commits': commits}
+
+    def _CreateEvent(self, event_id):
+        return {'ref': f'feature-{event_id % 100}', 'ref_type': 'branch', 'master_branch': 'main',
+                'description': self.text(10), 'pusher_type': 'user'}
+
+    def _WatchEvent(self, event_id):
+        return {'action': 'started'}
+
+    def _PublicEvent(self, event_id):
+        return {}
+
+    def _DeleteEvent(self, event_id):
+        return {'ref': f'feature-{event_id % 100}', 'ref_type': 'branch', 'pusher_type': 'user'}
+
+    def _ForkEvent(self, event_id):
+        return {'forkee': self.forkee(event_id)}
+
+    def _MemberEvent(self, event_id):
+        return {'action': 'added', 'member': self.user()}
+
+    def _GollumEvent(self, event_id):
+        return {'pages': [{'page_name': 'Home', 'title': 'Home', 'action': 'edited', 'sha': f'{event_id:040x}'}]}
+
+    def _ReleaseEvent(self, event_id):
+        return {'action': 'published', 'release': {'id': event_id, 'tag_name': f'v1.{event_id % 100}',
+                'target_commitish': 'main', 'name': 'Release', 'draft': False, 'prerelease': False,
+                'created_at': self.created_at, 'published_at': self.created_at, 'body': self.text(100)}}
+
+    def _CommitCommentEvent(self, event_id):
+        return {'comment': {'id': event_id, 'commit_id': f'{event_id:040x}', 'body': self.text(30), 'path': 'a.py',
+                            'position': 1, 'line': 3, 'author_association': 'NONE'}}
+
+    def _IssuesEvent(self, event_id):
+        return {'action': 'opened', 'issue': self.issue()}
+
+    def _IssueCommentEvent(self, event_id):
+        return {'action': 'created', 'issue': self.issue(),
+                'comment': {'id': event_id, 'user': self.user(), 'created_at': self.created_at,
+                            'updated_at': self.created_at, 'author_association': 'NONE', 'body': self.text(50),
+                            'reactions': self.reactions()}}
+
+    def _PullRequestEvent(self, event_id):
+        return {'action': 'opened', 'number': 1, 'pull_request': self.pull_request()}
+
+    def _PullRequestReviewEvent(self, event_id):
+        return {'action': 'created', 'review': {'id': event_id, 'user': self.user(), 'body': self.text(20),
+                'commit_id': f'{event_id:040x}', 'submitted_at': self.created_at, 'state': 'approved',
+                'author_association': 'MEMBER'}, 'pull_request': self.pull_request()}
+
+    def _PullRequestReviewCommentEvent(self, event_id):
+        return {'action': 'created', 'comment': {'id': event_id, 'pull_request_review_id': event_id - 1,
+                'diff_hunk': '@@ -1,3 +1,4 @@\n-a\n+b', 'path': 'src/main.py', 'position': 4, 'original_position': 4,
+                'commit_id': f'{event_id:040x}', 'original_commit_id': f'{event_id:040x}', 'user': self.user(),
+                'body': self.text(30), 'created_at': self.created_at, 'updated_at': self.created_at,
+                'author_association': 'MEMBER', 'reactions': self.reactions(), 'line': 4, 'original_line': 4,
+                'side': 'RIGHT'}, 'pull_request': self.pull_request()}
@@ -0,0 +1,188 @@
+import os
+import struct
+import tempfile
+from datetime import datetime
+from csv_writers import CSVWriters
+from table_schemas import read_table_columns
+
+# header of a PostgreSQL binary COPY file: signature, flags and header extension length
+HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+TRAILER = struct.pack('!h', -1)
+NULL = struct.pack('!i', -1)
+POSTGRES_EPOCH = datetime(2000, 1, 1)
+
+_bigint = struct.Struct('!iq')
+_int = struct.Struct('!ii')
+_bool = struct.Struct('!i?')
+_length = struct.Struct('!i')
+
+
+def _encode_bigint(value):
+    return _bigint.pack(8, int(value))
+
+
+def _encode_int(value):
+    return _int.pack(4, int(value))
+
+
+def _encode_boolean(value):
+    return _bool.pack(1, bool(value))
+
+
+def _encode_timestamp(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    # like the text format, a timestamp without time zone keeps the wall clock time and drops the offset
+    delta = value.replace(tzinfo=None) - POSTGRES_EPOCH
+    return _bigint.pack(8, (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+
+
+def _encode_text(value):
+    # text, varchar and enum values are sent as utf-8 text, which cannot contain null characters
+    data = str(value).replace('\x00', '').encode('utf-8')
+    return _length.pack(len(data)) + data
+
+
+ENCODERS = {'bigint': _encode_bigint, 'int': _encode_int, 'boolean': _encode_boolean, 'timestamp': _encode_timestamp}
+
+
+class BinaryTableWriter:
+    """
+    Writes the rows of one table in the PostgreSQL binary COPY format.
+    """
+    def __init__(self, file, column_types):
+        """
+        :param file: binary file object to write to
+        :param column_types: PostgreSQL types of the columns of the table
+        """
+        self.file = file
+        self.encoders = [ENCODERS.get(column_type, _encode_text) for column_type in column_types]
+        self.field_count = struct.pack('!h', len(column_types))
+        self.file.write(HEADER)
+
+    def writerow(self, row):
+        """
+        Write a row.
+        :param row: tuple of values, one per column
+        :return: None
+        """
+        self.file.write(self.field_count + b''.join(NULL if value is None else encode(value)
+                                                    for encode, value in zip(self.encoders, row)))
+
+    def writerows(self, rows):
+        """
+        Write several rows.
+        :param rows: iterable of rows
+        :return: None
+        """
+        for row in rows:
+            self.writerow(row)
+
+
+class BinaryCopyWriters:
+    """
+    Class to manage binary COPY writers, an alternative to CSVWriters that the database loads without parsing text.
+    The column types are taken from `sql/create_tables.sql`.
+    """
+    file_names = CSVWriters.file_names
+    file_extension = 'bin'
+    copy_format = 'binary'
+    column_types = {table: [column_type for _, column_type in columns]
+                    for table, columns in read_table_columns().items()}
+    partitioned_column_types = {table: [column_type for _, column_type in columns]
+                                for table, columns in read_table_columns('create_partitioned_tables.sql').items()}
+
+    def __init__(self, date, data_path, in_memory=False, partitioned=False):
+        """
+        Create a binary writer for each table/file
+        :param date: date of the data to be written
+        :param in_memory: keep the tables in memory buffers for a COPY FROM STDIN instead of writing files
+        :param partitioned: write the columns of `sql/create_partitioned_tables.sql`
+        """
+        column_types = BinaryCopyWriters.partitioned_column_types if partitioned else BinaryCopyWriters.column_types
+        self.date = date
+        self.in_memory = in_memory
+        if in_memory:
+            self.files = [tempfile.SpooledTemporaryFile(max_size=CSVWriters.max_memory_size, mode='w+b')
+                          for _ in BinaryCopyWriters.file_names]
+        else:
+            self.files = [open(f'{data_path}/{file_name}-{date}.bin', 'wb') for file_name in BinaryCopyWriters.file_names]
+        self.writers = {name: BinaryTableWriter(f, column_types[name])
+                        for f, name in zip(self.files, BinaryCopyWriters.file_names)}
+
+    @staticmethod
+    def file_path(data_path, table, date):
+        """
+        Get the path of the file of a table.
+        :param data_path: directory of the files
+        :param table: table name
+        :param date: date of the hour
+        :return: path of the file
+        """
+        return f'{data_path}/{table}-{date}.{BinaryCopyWriters.file_extension}'
+
+    def open_table(self, name):
+        """
+        Get the in-memory buffer of a table for reading. The buffer is discarded when it is closed.
+        :param name: table name
+        :return: binary file object
+        """
+        return self.files[BinaryCopyWriters.file_names.index(name)]
+
+    def close(self):
+        """
+        Write the trailers and close all writers. In-memory buffers are rewound for reading instead.
+        :return: None
+        """
+        for file in self.files:
+            file.write(TRAILER)
+            if self.in_memory:
+                file.seek(0)
+            else:
+                file.close()
+
+    @staticmethod
+    def filter_rows(path, table, is_duplicate):
+        """
+        Rewrite a binary COPY file without the rows matching `is_duplicate`. The function gets the values of a row as
+        strings, like a csv reader would return them.
+        :param path: path of the file
+        :param table: table name
+        :param is_duplicate: function returning True for rows to remove
+        :return: None
+        """
+        with open(path, 'rb') as f_in, open(f'{path}.part', 'wb') as f_out:
+            f_out.write(f_in.read(len(HEADER)))
+            while (field_count := struct.unpack('!h', f_in.read(2))[0]) != -1:
+                # the rows of the partitioned schema have an additional column
+                column_types = BinaryCopyWriters.column_types[table] \
+                    if field_count == len(BinaryCopyWriters.column_types[table]) \
+                    else BinaryCopyWriters.partitioned_column_types[table]
+                fields = []
+                for _ in range(field_count):
+                    length = _length.unpack(f_in.read(4))[0]
+                    fields.append(f_in.read(length) if length >= 0 else None)
+                if not is_duplicate([BinaryCopyWriters.__decode(field, column_type)
+                                     for field, column_type in zip(fields, column_types)]):
+                    f_out.write(struct.pack('!h', field_count) + b''.join(
+                        NULL if field is None else _length.pack(len(field)) + field for field in fields))
+            f_out.write(TRAILER)
+        os.replace(f'{path}.part', path)
+
+    @staticmethod
+    def __decode(field, column_type):
+        """
+        Decode a field to the string a csv reader would return for it.
+        :param field: field data, None for NULL
+        :param column_type: PostgreSQL type of the column
+        :return: string value
+        """
+        if field is None:
+            return ''
+        if column_type in ('bigint', 'int'):
+            return str(int.from_bytes(field, 'big', signed=True))
+        if column_type == 'boolean':
+            return str(field != b'\x00')
+        if column_type == 'timestamp':
+            return str(int.from_bytes(field, 'big', signed=True))
+        return field.decode('utf-8')
@@ -1,7 +1,52 @@
+import os
 import csv
+import tempfile
 # from variables import data_path
 
 
+class BatchedRowWriter:
+    """
+    Wraps a csv writer to collect rows in a list and write them in blocks with a single `writerows` call, instead of
+    quoting and writing each row on its own.
+    """
+    def __init__(self, writer, batch_size):
+        """
+        :param writer: csv writer the rows are written with
+        :param batch_size: number of rows collected before they are written
+        """
+        self.writer = writer
+        self.batch_size = batch_size
+        self.rows = []
+
+    def writerow(self, row):
+        """
+        Write a row.
+        :param row: tuple of values
+        :return: None
+        """
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def writerows(self, rows):
+        """
+        Write several rows, after the rows collected so far.
+        :param rows: iterable of rows
+        :return: None
+        """
+        self.flush()
+        self.writer.writerows(rows)
+
+    def flush(self):
+        """
+        Write the collected rows.
+        :return: None
+        """
+        if self.rows:
+            self.writer.writerows(self.rows)
+            self.rows = []
+
+
 class CSVWriters:
     """
     Class to manage different CSV writers.
@@ -10,18 +55,76 @@ class CSVWriters:
             'gollumevent', 'memberevent', 'forkevent', 'createevent', 'issue', 'issuecomment', 'pullrequest',
             'pullrequestreview', 'pullrequestreviewcomment']
 
-    def __init__(self, date, data_path):
+    file_extension = 'csv'
+    copy_format = 'csv'
+
+    # size up to which an in-memory table is kept in memory before it is moved to a temporary file
+    max_memory_size = 64 * 1024 * 1024
+    # number of rows of a table collected before they are written, see BatchedRowWriter
+    batch_size = 1024
+    # size of the write buffer of each csv file, in bytes
+    buffer_size = 1024 * 1024
+
+    def __init__(self, date, data_path, in_memory=False, partitioned=False):
         """
         Create a CSV writer for each table/file
         :param date: date of the data to be written
+        :param in_memory: keep the tables in memory buffers for a COPY FROM STDIN instead of writing csv files
+        :param partitioned: the rows are written for the partitioned schema; csv files need no change for it
+        """
+        self.date = date
+        self.in_memory = in_memory
+        if in_memory:
+            self.files = [tempfile.SpooledTemporaryFile(max_size=CSVWriters.max_memory_size, mode='w+', newline='',
+                                                        encoding='utf-8') for _ in CSVWriters.file_names]
+        else:
+            self.files = [open(f'{data_path}/{file_name}-{date}.csv', 'w', buffering=CSVWriters.buffer_size)
+                          for file_name in CSVWriters.file_names]
+        self.writers = {name : BatchedRowWriter(csv.writer(f, escapechar='🁇'), CSVWriters.batch_size)
+                        for f, name in zip(self.files, CSVWriters.file_names)}
+
+    @staticmethod
+    def file_path(data_path, table, date):
+        """
+        Get the path of the file of a table.
+        :param data_path: directory of the files
+        :param table: table name
+        :param date: date of the hour
+        :return: path of the file
         """
-        self.files = [open(f'{data_path}/{file_name}-{date}.csv', 'a') for file_name in CSVWriters.file_names]
-        self.writers = {name : csv.writer(f, escapechar='🁇') for f, name in zip(self.files, CSVWriters.file_names)}
+        return f'{data_path}/{table}-{date}.{CSVWriters.file_extension}'
+
+    def open_table(self, name):
+        """
+        Get the in-memory buffer of a table for reading. The buffer is discarded when it is closed.
+        :param name: table name
+        :return: text file object
+        """
+        return self.files[CSVWriters.file_names.index(name)]
 
     def close(self):
         """
-        Close all writers
+        Close all writers. In-memory buffers are rewound for reading instead.
         :return: None
         """
+        for writer in self.writers.values():
+            writer.flush()
         for file in self.files:
-            file.close()
+            if self.in_memory:
+                file.seek(0)
+            else:
+                file.close()
+
+    @staticmethod
+    def filter_rows(path, table, is_duplicate):
+        """
+        Rewrite a csv file without the rows matching `is_duplicate`.
+        :param path: path of the file
+        :param table: table name
+        :param is_duplicate: function returning True for rows to remove
+        :return: None
+        """
+        with open(path, 'r', newline='') as f_in, open(f'{path}.part', 'w') as f_out:
+            writer = csv.writer(f_out, escapechar='🁇')
+            writer.writerows(row for row in csv.reader(f_in, escapechar='🁇') if not is_duplicate(row))
+        os.replace(f'{path}.part', path)
@@ -1,11 +1,36 @@
 import psycopg2
 import os
+import time
 import platform
 import logging
 import traceback
 import pandas as pd
 from csv_writers import CSVWriters
-from psycopg2.errors import CharacterNotInRepertoire
+from table_schemas import read_partitioned_tables
+from index_manager import IndexManager
+from metrics import Metrics
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.errors import CharacterNotInRepertoire, CheckViolation, UniqueViolation
+from concurrent.futures import ThreadPoolExecutor
+
+# columns identifying the rows of a table in merge mode, duplicates of which are not inserted again
+MERGE_KEYS = {
+    'archive': 'id',
+    'commit': 'push_id, sha',
+    'pushevent': 'id',
+    'commitcommentevent': 'id',
+    'releaseevent': 'id',
+    'deleteevent': 'event_id',
+    'gollumevent': 'event_id, page_name',
+    'memberevent': 'event_id',
+    'forkevent': 'forkee_id',
+    'createevent': 'event_id',
+    'issue': 'id',
+    'issuecomment': 'comment_id',
+    'pullrequest': 'id',
+    'pullrequestreview': 'id',
+    'pullrequestreviewcomment': 'id',
+}
 
 
 class DatabaseLink:
@@ -14,7 +39,7 @@ class DatabaseLink:
     """
     def __init__(self, username, password, 
                 database, host, port,
-                sed_name=None, data_path="."):
+                sed_name=None, data_path=".", pool_size=1, partitioned=False, merge=False, metrics=None):
         self.conn = psycopg2.connect(database=database, user=username,
             password=password, host=host, port=port)
         self.cursor = self.conn.cursor()
@@ -25,74 +50,422 @@ class DatabaseLink:
         self.port = port
         self.data_path = data_path
         self.sed_name = sed_name
+        # number of tables loaded concurrently, each over a connection of a pool; with 1, the tables are loaded one
+        # after another over the main connection
+        self.pool_size = pool_size
+        # the large tables are partitioned by month, see `sql/create_partitioned_tables.sql`
+        self.partitioned = partitioned
+        # months whose partitions exist
+        self.partitioned_months = set()
+        # the tables are copied into staging tables and merged into the tables without duplicates
+        self.merge = merge
+        # Metrics the rows and durations of the copies are recorded into
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.pool = None
+        self.executor = None
+        if pool_size > 1:
+            self.pool = ThreadedConnectionPool(1, pool_size, database=database, user=username,
+                password=password, host=host, port=port)
+            self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='loader')
 
     def __enter__(self):
-        self.__init__(username=self.username, password=self.password, 
-                          database=self.database, host=self.host, port=self.port, 
-                          sed_name=self.sed_name, data_path=self.data_path)
+        # reconnect if the link was closed by a previous `with` block
+        if self.conn.closed:
+            self.__init__(username=self.username, password=self.password, 
+                              database=self.database, host=self.host, port=self.port, 
+                              sed_name=self.sed_name, data_path=self.data_path, pool_size=self.pool_size,
+                              partitioned=self.partitioned, merge=self.merge, metrics=self.metrics)
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
         self.conn.commit()
         self.cursor.close()
         self.conn.close()
+        if self.pool is not None:
+            self.executor.shutdown()
+            self.pool.closeall()
 
     def create_tables(self):
         """
-        Create tables in the database.
+        Create tables in the database, partitioned if the link is. An existing database must have been created with
+        the same schema. In merge mode, the unique indices the merge relies on are created as well.
         :return: None
         """
-        with open('sql/create_tables.sql', 'r') as f:
+        with open('sql/create_partitioned_tables.sql' if self.partitioned else 'sql/create_tables.sql', 'r') as f:
             self.cursor.execute(f.read())
         self.conn.commit()
+        if self.is_partitioned() != self.partitioned:
+            schema = 'partitioned' if self.partitioned else 'unpartitioned'
+            raise ValueError(f'The tables exist with a different schema than the {schema} one requested, '
+                             f'check the --partitioned option')
+        if self.merge:
+            self.create_merge_indices()
 
-    def create_indices(self):
+    def create_merge_indices(self):
         """
-        Create indices in the database.
+        Create the unique indices on the merge keys of the tables. The index of the archive table is the one
+        `sql/create_indices.sql` defines for its primary key. On partitioned tables, the indices include the partition
+        key, so duplicates are only detected within the same event time.
+
+        The indices of unpartitioned tables are built concurrently, so the tables stay readable and writable, and
+        indices left invalid by an interrupted build are rebuilt. A table that already holds duplicates, like one
+        loaded by an earlier version without merging, cannot be indexed: its duplicates must be removed first.
         :return: None
         """
-        logging.info('Creating indices')
-        with open('sql/create_indices.sql', 'r') as f:
-            self.cursor.execute(f.read())
+        partitioned_tables = read_partitioned_tables() if self.partitioned else {}
         self.conn.commit()
-        logging.info('Finished creating indices')
+        # concurrent index builds cannot run in a transaction
+        self.conn.autocommit = True
+        try:
+            for table, columns in MERGE_KEYS.items():
+                # indices on partitioned tables cannot be built concurrently
+                concurrently = '' if table in partitioned_tables else 'CONCURRENTLY '
+                if table in partitioned_tables and partitioned_tables[table] not in columns:
+                    columns = f'{columns}, {partitioned_tables[table]}'
+                name = 'archive_pkey' if table == 'archive' else f'{table}_merge_idx'
+                valid = self.__index_valid(name)
+                if valid is False:
+                    logging.warning(f'Index {name} is invalid, rebuilding it')
+                    self.cursor.execute(f'DROP INDEX {concurrently}IF EXISTS {name}')
+                if not valid:
+                    logging.info(f'Creating index {name}')
+                    try:
+                        self.cursor.execute(f'CREATE UNIQUE INDEX {concurrently}IF NOT EXISTS {name} '
+                                            f'ON {table} ({columns})')
+                    except UniqueViolation:
+                        # a failed concurrent build leaves an invalid index behind, which would reject new rows
+                        self.cursor.execute(f'DROP INDEX {concurrently}IF EXISTS {name}')
+                        raise ValueError(f'Table {table} holds duplicate rows of ({columns}), so the unique index the '
+                                         f'database deduplication merges on cannot be built. Remove the duplicates '
+                                         f'or use another --dedup-store') from None
+        finally:
+            self.conn.autocommit = False
 
-    def insert_csvs_into_db(self, date, use_pandas=False):
+    def is_partitioned(self):
         """
-        Insert CSV files into the database.
-        :param date: the date of the files to be inserted, corresponds to file name
+        Check whether the archive table is partitioned.
+        :return: True if the archive table is partitioned
+        """
+        self.cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'archive'::regclass")
+        partitioned = self.cursor.fetchone() is not None
+        self.conn.commit()
+        return partitioned
+
+    def ensure_partitions(self, date):
+        """
+        Create the monthly partitions of the partitioned tables for the month of an hour, if they do not exist yet.
+        :param date: the date of the hour, in the format "YYYY-MM-DD-H"
         :return: None
         """
-        if not use_pandas:
-            for table in CSVWriters.file_names:
-                query = f"COPY {table} FROM '{self.data_path}/{table}-{date}.csv' WITH (FORMAT csv)"
-                try:
-                    self.cursor.execute(query)
-                except CharacterNotInRepertoire:
-                    self.conn.rollback()
-                    logging.warn(f'Illegal character in table {table} for {date}, removing null bytes and retrying')
-                    if self.sed_name is None:
-                        DatabaseLink.__remove_null_chars(f"{self.data_path}/{table}-{date}.csv")
-                    else:
-                        os.system(f"{self.sed_name} -i 's/\\x00//g' {self.data_path}/{table}-{date}.csv")
-                    logging.info(f'Removed null bytes from {table}')
-                    self.cursor.execute(query)
-                except Exception:
-                    self.conn.rollback()
-                    logging.error(f'Error copying table {table} for {date} into database')
-                    logging.error(traceback.format_exc())
+        self.ensure_month_partitions(int(date[:4]), int(date[5:7]))
+
+    def ensure_range_partitions(self, start_year, start_month, end_year, end_month):
+        """
+        Create the monthly partitions of the months of a date range before it is loaded, plus the month before and
+        the month after it, which events timestamped just before the first or after the last hour fall into. The
+        hours are loaded newest first, so the partition of an earlier month would otherwise be created after rows of
+        that month went to the default partitions.
+        :param start_year: year of the first month
+        :param start_month: first month
+        :param end_year: year of the last month
+        :param end_month: last month
+        :return: None
+        """
+        year, month = (start_year - 1, 12) if start_month == 1 else (start_year, start_month - 1)
+        last = (end_year + 1, 1) if end_month == 12 else (end_year, end_month + 1)
+        while (year, month) <= last:
+            self.ensure_month_partitions(year, month)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    def ensure_month_partitions(self, year, month):
+        """
+        Create the partitions of the partitioned tables for a month, if they do not exist yet. Rows of the month that
+        are already in a default partition are moved into the new partition.
+        :param year: year of the month
+        :param month: month
+        :return: None
+        """
+        if (year, month) in self.partitioned_months:
+            return
+        start = f'{year}-{month:02}-01'
+        end = f'{year + 1}-01-01' if month == 12 else f'{year}-{month + 1:02}-01'
+        for table, column in read_partitioned_tables().items():
+            partition = f'{table}_{year}_{month:02}'
+            create = (f"CREATE UNLOGGED TABLE IF NOT EXISTS {partition} PARTITION OF {table} "
+                      f"FOR VALUES FROM ('{start}') TO ('{end}')")
+            try:
+                self.cursor.execute(create)
                 self.conn.commit()
+            except CheckViolation:
+                # the default partition holds rows of the month, which have to move into the new partition
+                self.conn.rollback()
+                logging.info(f'Moving the rows of {year}-{month:02} from {table}_default into {partition}')
+                in_month = f"{column} >= '{start}' AND {column} < '{end}'"
+                self.cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {table}_default')
+                self.cursor.execute(create)
+                self.cursor.execute(f'INSERT INTO {table} SELECT * FROM {table}_default WHERE {in_month}')
+                self.cursor.execute(f'DELETE FROM {table}_default WHERE {in_month}')
+                self.cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {table}_default DEFAULT')
+                self.conn.commit()
+        self.partitioned_months.add((year, month))
+
+    def create_indices(self, months=None, workers=4, maintenance_work_mem='1GB'):
+        """
+        Create the indices that do not exist yet in the database, see `IndexManager`.
+        :param months: set of (year, month) tuples whose partitions are indexed, None to index all tables
+        :param workers: number of tables or partitions indexed in parallel
+        :param maintenance_work_mem: memory of each index build, a PostgreSQL size like '1GB'
+        :return: None
+        """
+        IndexManager(username=self.username, password=self.password, database=self.database, host=self.host,
+                     port=self.port, workers=workers,
+                     maintenance_work_mem=maintenance_work_mem).create_indices(months)
+
+    def insert_csvs_into_db(self, date, use_pandas=False, use_stdin=False, writer=None, binary=False,
+                            use_ledger=False):
+        """
+        Insert CSV files into the database. With a connection pool, the tables are loaded concurrently.
+        :param date: the date of the files to be inserted, corresponds to file name
+        :param use_pandas: insert the rows through pandas
+        :param use_stdin: stream the rows from the client with COPY FROM STDIN
+        :param writer: CSVWriters or BinaryCopyWriters holding the tables in memory, only used with `use_stdin`
+        :param binary: the files are in the binary COPY format, only used with `use_stdin`
+        :param use_ledger: skip the tables the ingest ledger records as loaded, and record the loaded tables
+        :return: True if all tables are loaded
+        """
+        if self.partitioned:
+            self.ensure_partitions(date)
+        if use_stdin:
+            return self.copy_csvs_from_stdin(date, writer, binary, use_ledger)
+        loaded = self.loaded_tables(date) if use_ledger else set()
+        if not use_pandas:
+            self.__copy_tables(date, self.__copy_table_from_server, loaded, use_ledger=use_ledger)
         else:
             for table in CSVWriters.file_names:
+                if table in loaded:
+                    continue
                 csv_filepath = f'{self.data_path}/{table}-{date}.csv'
+                start = time.perf_counter()
                 try:
                     df = pd.read_csv(csv_filepath)
                     df.to_sql(table, self.conn, if_exists='append')
+                    if use_ledger:
+                        self.mark_table_loaded(self.cursor, date, table, len(df))
+                        self.conn.commit()
+                    loaded.add(table)
+                    self.metrics.add('ghelephant_rows_loaded_total', len(df), table=table)
+                    self.metrics.add('ghelephant_copy_seconds_total', time.perf_counter() - start, table=table)
                 except Exception:
                     self.conn.rollback()
                     logging.error(f'Error copying table {table} for {date} into database')
                     logging.error(traceback.format_exc())                
         logging.info(f'Finished copying {date} into database')
+        return len(loaded) == len(CSVWriters.file_names)
+
+    def copy_csvs_from_stdin(self, date, writer=None, binary=False, use_ledger=False):
+        """
+        Stream CSV or binary COPY data into the database with COPY FROM STDIN, so the database server does not need
+        access to the files. Null bytes, which PostgreSQL does not accept in text, are removed from csv data while
+        streaming; the binary writers never write them.
+        :param date: the date of the files to be inserted, corresponds to file name
+        :param writer: CSVWriters or BinaryCopyWriters holding the tables in memory; if None, the files are read
+        :param binary: the files are in the binary COPY format, only used without `writer`
+        :param use_ledger: skip the tables the ingest ledger records as loaded, and record the loaded tables
+        :return: True if all tables are loaded
+        """
+        if writer:
+            binary = writer.copy_format == 'binary'
+        loaded = self.loaded_tables(date) if use_ledger else set()
+        self.__copy_tables(date, self.__copy_table_from_stdin, loaded, writer=writer, binary=binary,
+                           use_ledger=use_ledger)
+        logging.info(f'Finished copying {date} into database')
+        return len(loaded) == len(CSVWriters.file_names)
+
+    def __copy_tables(self, date, copy_table, loaded, **kwargs):
+        """
+        Copy the tables of a date that are not loaded yet, over the main connection or concurrently over the
+        connections of the pool. The largest files are started first, so that they do not hold up the end of the
+        load.
+        :param date: the date of the files
+        :param copy_table: function copying one table over a connection, returning True if the table is loaded
+        :param loaded: set of loaded tables, updated with the tables loaded
+        :param kwargs: keyword arguments of `copy_table`
+        :return: None
+        """
+        extension = 'bin' if kwargs.get('binary') else 'csv'
+        tables = sorted((table for table in CSVWriters.file_names if table not in loaded),
+                        key=lambda table: -self.__file_size(f'{self.data_path}/{table}-{date}.{extension}'))
+        if self.pool is None:
+            results = [copy_table(self.conn, date, table, **kwargs) for table in tables]
+        else:
+            results = list(self.executor.map(
+                lambda table: self.__with_pooled_connection(copy_table, date, table, **kwargs), tables))
+        loaded.update(table for table, copied in zip(tables, results) if copied)
+
+    def __with_pooled_connection(self, copy_table, date, table, **kwargs):
+        """
+        Copy a table over a connection taken from the pool.
+        :param copy_table: function copying one table over a connection
+        :param date: the date of the files
+        :param table: the table to copy
+        :param kwargs: keyword arguments of `copy_table`
+        :return: the result of `copy_table`
+        """
+        conn = self.pool.getconn()
+        try:
+            return copy_table(conn, date, table, **kwargs)
+        finally:
+            # broken connections are discarded instead of being handed out again
+            self.pool.putconn(conn, close=bool(conn.closed))
+
+    def __copy_table_from_server(self, conn, date, table, use_ledger=False):
+        """
+        Let the database server read the csv file of a table.
+        :param conn: connection to copy over
+        :param date: the date of the files
+        :param table: the table to copy
+        :param use_ledger: record the loaded table in the ingest ledger
+        :return: True if the table is loaded
+        """
+        query = f"COPY {{}} FROM '{self.data_path}/{table}-{date}.csv' WITH (FORMAT csv)"
+        start = time.perf_counter()
+        try:
+            with conn.cursor() as cursor:
+                try:
+                    cursor.execute(query.format(self.__copy_target(cursor, table)))
+                except CharacterNotInRepertoire:
+                    conn.rollback()
+                    logging.warn(f'Illegal character in table {table} for {date}, removing null bytes and retrying')
+                    if self.sed_name is None:
+                        DatabaseLink.__remove_null_chars(f"{self.data_path}/{table}-{date}.csv")
+                    else:
+                        os.system(f"{self.sed_name} -i 's/\\x00//g' {self.data_path}/{table}-{date}.csv")
+                    logging.info(f'Removed null bytes from {table}')
+                    cursor.execute(query.format(self.__copy_target(cursor, table)))
+                if self.merge:
+                    self.__merge_staging_table(cursor, table)
+                # read before the ledger insert, which resets the row count of the cursor
+                rows = cursor.rowcount
+                if use_ledger:
+                    self.mark_table_loaded(cursor, date, table, rows)
+            conn.commit()
+            self.metrics.add('ghelephant_rows_loaded_total', rows, table=table)
+            self.metrics.add('ghelephant_copy_seconds_total', time.perf_counter() - start, table=table)
+            return True
+        except Exception:
+            conn.rollback()
+            logging.error(f'Error copying table {table} for {date} into database')
+            logging.error(traceback.format_exc())
+            return False
+
+    def __copy_table_from_stdin(self, conn, date, table, writer=None, binary=False, use_ledger=False):
+        """
+        Stream the data of a table with COPY FROM STDIN.
+        :param conn: connection to copy over
+        :param date: the date of the files
+        :param table: the table to copy
+        :param writer: CSVWriters or BinaryCopyWriters holding the tables in memory; if None, the files are read
+        :param binary: the data is in the binary COPY format
+        :param use_ledger: record the loaded table in the ingest ledger
+        :return: True if the table is loaded
+        """
+        start = time.perf_counter()
+        try:
+            if writer:
+                f = writer.open_table(table)
+            elif binary:
+                f = open(f'{self.data_path}/{table}-{date}.bin', 'rb')
+            else:
+                f = open(f'{self.data_path}/{table}-{date}.csv', 'r', newline='')
+            with f, conn.cursor() as cursor:
+                target = self.__copy_target(cursor, table)
+                if binary:
+                    cursor.copy_expert(f'COPY {target} FROM STDIN WITH (FORMAT binary)', f)
+                else:
+                    cursor.copy_expert(f'COPY {target} FROM STDIN WITH (FORMAT csv)', NullCharFilter(f))
+                if self.merge:
+                    self.__merge_staging_table(cursor, table)
+                # read before the ledger insert, which resets the row count of the cursor
+                rows = cursor.rowcount
+                if use_ledger:
+                    self.mark_table_loaded(cursor, date, table, rows)
+            conn.commit()
+            self.metrics.add('ghelephant_rows_loaded_total', rows, table=table)
+            self.metrics.add('ghelephant_copy_seconds_total', time.perf_counter() - start, table=table)
+            return True
+        except Exception:
+            conn.rollback()
+            logging.error(f'Error copying table {table} for {date} into database')
+            logging.error(traceback.format_exc())
+            return False
+
+    def __copy_target(self, cursor, table):
+        """
+        Get the table to copy into: the table itself, or in merge mode a staging table. The staging tables are
+        temporary tables of the connection without indices, emptied at the end of each transaction.
+        :param cursor: cursor of the connection to copy over
+        :param table: the table to copy
+        :return: name of the table to copy into
+        """
+        if not self.merge:
+            return table
+        cursor.execute(f'CREATE TEMPORARY TABLE IF NOT EXISTS staging_{table} (LIKE {table}) ON COMMIT DELETE ROWS')
+        return f'staging_{table}'
+
+    def __merge_staging_table(self, cursor, table):
+        """
+        Insert the rows of a staging table into its table, skipping the rows whose merge key is already in the table
+        or repeated in the staging table. Of repeated rows, the first copied is kept: the rows of an hour are written
+        from the newest to the oldest event, and a freshly emptied table returns them in the order they were copied.
+        Sets `cursor.rowcount` to the number of rows inserted.
+        :param cursor: cursor of the connection the staging table was copied over
+        :param table: the table to merge into
+        :return: None
+        """
+        columns = MERGE_KEYS[table]
+        cursor.execute(f'INSERT INTO {table} SELECT DISTINCT ON ({columns}) * FROM staging_{table} '
+                       f'ORDER BY {columns}, ctid ON CONFLICT DO NOTHING')
+
+    def loaded_tables(self, date):
+        """
+        Get the tables the ingest ledger records as loaded for the given date.
+        :param date: the date of the files
+        :return: set of table names
+        """
+        self.cursor.execute("SELECT table_name FROM ingest_ledger WHERE hour = %s AND stage = 'table'", (date,))
+        tables = {row[0] for row in self.cursor.fetchall()}
+        self.conn.commit()
+        return tables
+
+    @staticmethod
+    def mark_table_loaded(cursor, date, table, rows):
+        """
+        Record a loaded table in the ingest ledger. Runs in the transaction of the COPY, so that the record and the
+        rows are committed together.
+        :param cursor: cursor of the connection the table was copied over
+        :param date: the date of the files
+        :param table: the loaded table
+        :param rows: number of rows loaded
+        :return: None
+        """
+        cursor.execute("INSERT INTO ingest_ledger (hour, stage, table_name, rows) VALUES (%s, 'table', %s, %s) "
+                       "ON CONFLICT (hour, stage, table_name) DO UPDATE SET rows = EXCLUDED.rows, "
+                       "updated_at = now()", (date, table, rows))
+
+    def __index_valid(self, name):
+        """
+        Check whether an index exists and is valid.
+        :param name: index name
+        :return: True if valid, False if invalid, None if the index does not exist
+        """
+        self.cursor.execute('SELECT x.indisvalid FROM pg_index x JOIN pg_class c ON c.oid = x.indexrelid '
+                            'WHERE c.relname = %s', (name,))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def __file_size(path):
+        return os.path.getsize(path) if os.path.isfile(path) else 0
 
     @staticmethod
     def __remove_null_chars( filepath):
@@ -101,3 +474,17 @@ class DatabaseLink:
         contenido_sin_nulos = contenido.replace('\x00', '')
         with open(filepath, 'w', encoding='utf-8') as archivo_salida:
             archivo_salida.write(contenido_sin_nulos)
+
+
+class NullCharFilter:
+    """
+    File-like wrapper that removes null characters from the text read from a file.
+    """
+    def __init__(self, file):
+        self.file = file
+
+    def read(self, size=-1):
+        return self.file.read(size).replace('\x00', '')
+
+    def readline(self, size=-1):
+        return self.file.readline(size).replace('\x00', '')
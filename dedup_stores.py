@@ -0,0 +1,220 @@
+import sqlite3
+import numpy as np
+from array import array
+from bisect import bisect_left
+
+
+class SetStore:
+    """
+    Keeps the ids in a python set, the default. Memory grows with every id, so the store is reset monthly.
+    """
+    persistent = False
+
+    def __init__(self, name=None):
+        self.keys = set()
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def add(self, key):
+        self.keys.add(key)
+
+    def intersection(self, keys):
+        """
+        Get the keys that are already in the store.
+        :param keys: set of keys
+        :return: set of keys in the store
+        """
+        return self.keys & keys
+
+    def update(self, keys):
+        self.keys |= keys
+
+    def commit(self, hour):
+        """
+        Persist the keys added for an hour. Nothing to do for in-memory stores.
+        :param hour: date of the hour
+        :return: None
+        """
+
+    def forget(self, hour):
+        """
+        Remove the persisted keys of an hour before it is converted again. Nothing to do for in-memory stores.
+        :param hour: date of the hour
+        :return: None
+        """
+
+    def rollback(self):
+        """
+        Drop the keys added since the last commit, after the conversion of an hour failed. In-memory stores do not
+        tell the keys of an hour apart and keep them.
+        :return: None
+        """
+
+    def reset(self):
+        self.keys = set()
+
+    def close(self):
+        pass
+
+
+class IntArrayStore(SetStore):
+    """
+    Keeps the ids as sorted arrays of 64 bit integers, about a tenth of the memory of a python set. New ids are
+    collected in a small set, which is merged into a sorted array of recent ids when full; the recent ids are merged
+    into the main array in larger batches, so that the main array is not copied for every small batch. Like SetStore,
+    the store is reset monthly.
+    """
+    def __init__(self, name=None, batch_size=1 << 14, recent_size=1 << 20):
+        """
+        :param name: unused, for the same signature as the other stores
+        :param batch_size: number of new ids collected in the set before they are merged into the recent ids
+        :param recent_size: number of recent ids merged into the main array at once
+        """
+        super().__init__(name)
+        self.sorted_keys = array('q')
+        self.recent_keys = array('q')
+        self.batch_size = batch_size
+        self.recent_size = recent_size
+
+    def __contains__(self, key):
+        key = int(key)
+        return key in self.keys or IntArrayStore.__in_sorted(self.recent_keys, key) \
+            or IntArrayStore.__in_sorted(self.sorted_keys, key)
+
+    def add(self, key):
+        self.keys.add(int(key))
+        if len(self.keys) >= self.batch_size:
+            self.recent_keys = IntArrayStore.__union(self.recent_keys, self.keys)
+            self.keys = set()
+            if len(self.recent_keys) >= self.recent_size:
+                self.sorted_keys = IntArrayStore.__union(self.sorted_keys, self.recent_keys)
+                self.recent_keys = array('q')
+
+    def intersection(self, keys):
+        return {key for key in keys if key in self}
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def reset(self):
+        self.keys = set()
+        self.sorted_keys = array('q')
+        self.recent_keys = array('q')
+
+    @staticmethod
+    def __in_sorted(keys, key):
+        i = bisect_left(keys, key)
+        return i < len(keys) and keys[i] == key
+
+    @staticmethod
+    def __union(sorted_keys, new_keys):
+        """
+        Merge ids into a sorted array, inserting the ids that are not in it yet at their positions, which costs a copy
+        of the array instead of sorting it again.
+        :param sorted_keys: sorted array of ids
+        :param new_keys: set or sorted array of ids to merge
+        :return: new sorted array
+        """
+        new_keys = np.frombuffer(new_keys, dtype=np.int64) if isinstance(new_keys, array) \
+            else np.unique(np.fromiter(new_keys, dtype=np.int64, count=len(new_keys)))
+        existing = np.frombuffer(sorted_keys, dtype=np.int64)
+        positions = np.searchsorted(existing, new_keys)
+        found = positions < len(existing)
+        found[found] = existing[positions[found]] == new_keys[found]
+        merged = np.insert(existing, positions[~found], new_keys[~found])
+        return array('q', merged.tobytes())
+
+
+class SQLiteStore(SetStore):
+    """
+    Keeps the ids in a SQLite database on disk, so memory stays bounded and the ids survive restarts. The ids added
+    for an hour are kept in memory until the hour is committed. The store is never reset, so no duplicates leak
+    across months.
+    """
+    persistent = True
+
+    def __init__(self, name, path):
+        """
+        :param name: name of the table holding the ids
+        :param path: path of the database file
+        """
+        super().__init__(name)
+        self.name = name
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(f'CREATE TABLE IF NOT EXISTS {name} (key INTEGER PRIMARY KEY, hour TEXT) WITHOUT ROWID')
+        self.conn.execute(f'CREATE INDEX IF NOT EXISTS {name}_hour_idx ON {name} (hour)')
+        self.conn.commit()
+
+    def __contains__(self, key):
+        key = int(key)
+        if key in self.keys:
+            return True
+        return self.conn.execute(f'SELECT 1 FROM {self.name} WHERE key = ?', (key,)).fetchone() is not None
+
+    def add(self, key):
+        self.keys.add(int(key))
+
+    def intersection(self, keys):
+        return {key for key in keys if key in self}
+
+    def update(self, keys):
+        self.keys |= {int(key) for key in keys}
+
+    def commit(self, hour):
+        self.conn.executemany(f'INSERT OR IGNORE INTO {self.name} (key, hour) VALUES (?, ?)',
+                              ((key, hour) for key in self.keys))
+        self.conn.commit()
+        self.keys = set()
+
+    def forget(self, hour):
+        self.conn.execute(f'DELETE FROM {self.name} WHERE hour = ?', (hour,))
+        self.conn.commit()
+
+    def rollback(self):
+        self.keys = set()
+
+    def reset(self):
+        # the ids are kept, the store is bounded
+        pass
+
+    def close(self):
+        self.conn.close()
+
+
+class NullStore(SetStore):
+    """
+    Keeps no ids, for when duplicates are removed by the database while the tables are merged.
+    """
+    def __contains__(self, key):
+        return False
+
+    def add(self, key):
+        pass
+
+    def intersection(self, keys):
+        return set()
+
+    def update(self, keys):
+        pass
+
+
+def create_dedup_stores(kind='memory', data_path='.'):
+    """
+    Create the stores for event, push, issue and pull request ids.
+    :param kind: 'memory' for python sets, 'array' for sorted integer arrays, 'sqlite' for a database on disk,
+    'database' for no stores when the database removes duplicates
+    :param data_path: directory of the database file of the 'sqlite' stores
+    :return: tuple of four stores
+    """
+    names = ('added_ids', 'added_pushes', 'added_issues', 'added_prs')
+    if kind == 'database':
+        return tuple(NullStore(name) for name in names)
+    if kind == 'sqlite':
+        return tuple(SQLiteStore(name, f'{data_path}/dedup.sqlite') for name in names)
+    if kind == 'array':
+        return tuple(IntArrayStore(name) for name in names)
+    return tuple(SetStore(name) for name in names)
@@ -0,0 +1,147 @@
+import os
+import gzip
+import time
+import logging
+import requests
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+
+
+class Downloader:
+    """
+    Class to download hourly GH Archive files concurrently.
+    All workers share one keep-alive session, responses are streamed to disk in chunks and partially downloaded
+    files are resumed with HTTP range requests.
+    """
+    def __init__(self, data_path, workers=4, base_url='https://data.gharchive.org', retries=5, backoff=1.0,
+                 chunk_size=1 << 20, timeout=60):
+        """
+        :param data_path: directory where the `.json.gz` files are stored
+        :param workers: number of concurrent downloads
+        :param base_url: url the hour files are fetched from
+        :param retries: number of retries for a single file before giving up
+        :param backoff: base of the exponential backoff between retries, in seconds
+        :param chunk_size: size of the chunks written to disk, in bytes
+        :param timeout: connect and read timeout of a request, in seconds
+        """
+        self.data_path = data_path
+        self.workers = workers
+        self.base_url = base_url.rstrip('/')
+        self.retries = retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def download_all(self, dates, admit=None, interval=0.5):
+        """
+        Download the files for the given dates with a pool of workers. At most twice as many downloads as there are
+        workers are in flight, and results are returned in the order of the input.
+        :param dates: iterable of dates to download
+        :param admit: function called with a date before its download starts, returning False while the download has
+        to wait; finished downloads are returned in the meantime
+        :param interval: seconds between calls of `admit` while a download waits
+        :return: iterator of (date, success) tuples
+        """
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='downloader') as executor:
+            for date in dates:
+                while admit is not None and not admit(date):
+                    if in_flight and wait([in_flight[0][1]], timeout=interval).done:
+                        head, future = in_flight.popleft()
+                        yield head, future.result()
+                    elif not in_flight:
+                        time.sleep(interval)
+                in_flight.append((date, executor.submit(self.download, date)))
+                if len(in_flight) >= 2 * self.workers:
+                    date, future = in_flight.popleft()
+                    yield date, future.result()
+            while in_flight:
+                date, future = in_flight.popleft()
+                yield date, future.result()
+
+    def download(self, date):
+        """
+        Download the file for the given date, resuming a partial download if there is one.
+        :param date: date to download
+        :return: True if the file was downloaded, False otherwise
+        """
+        path = f'{self.data_path}/{date}.json.gz'
+        if os.path.isfile(path):
+            return True
+        logging.info(f'Downloading {date}')
+        for attempt in range(self.retries + 1):
+            try:
+                self.__fetch(date, f'{path}.part')
+                os.replace(f'{path}.part', path)
+                return True
+            except requests.HTTPError as e:
+                if e.response is not None and 400 <= e.response.status_code < 500 \
+                        and e.response.status_code not in (408, 429):
+                    logging.error(f'Error downloading {date}: {e}')
+                    return False
+                logging.warning(f'Error downloading {date} (attempt {attempt + 1}): {e}')
+            except (requests.RequestException, IOError) as e:
+                logging.warning(f'Error downloading {date} (attempt {attempt + 1}): {e}')
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt)
+        logging.error(f'Error downloading {date}, giving up after {self.retries + 1} attempts')
+        return False
+
+    def __fetch(self, date, part_path):
+        """
+        Stream the file for the given date into `part_path`, appending to it if it already holds a prefix.
+        :param date: date to download
+        :param part_path: path of the partial file
+        :return: None
+        """
+        offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else None
+        url = f'{self.base_url}/{date}.json.gz'
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416:
+                # the partial file is already complete if its size matches the one the server reports
+                if response.headers.get('Content-Range', '').endswith(f'/{offset}'):
+                    return
+                os.remove(part_path)
+                raise IOError(f'Partial file of size {offset} does not match remote file')
+            response.raise_for_status()
+            if response.status_code == 206:
+                mode = 'ab'
+            else:
+                # the server ignored the range request, start from scratch
+                mode, offset = 'wb', 0
+            expected = response.headers.get('Content-Length')
+            written = 0
+            with open(part_path, mode) as f:
+                for chunk in response.raw.stream(self.chunk_size, decode_content=False):
+                    f.write(chunk)
+                    written += len(chunk)
+            if expected is not None and written != int(expected):
+                raise IOError(f'Incomplete download, got {written} of {expected} bytes')
+
+    @contextmanager
+    def stream(self, date):
+        """
+        Open the file for the given date as a stream that is decompressed incrementally while it is read from the
+        http response, without storing anything on disk.
+        :param date: date to stream
+        :return: binary file object yielding the decompressed lines
+        """
+        logging.info(f'Streaming {date}')
+        with self.session.get(f'{self.base_url}/{date}.json.gz', stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            with gzip.GzipFile(fileobj=response.raw, mode='rb') as f:
+                yield f
+
+    def close(self):
+        """
+        Close the session.
+        :return: None
+        """
+        self.session.close()
@@ -0,0 +1,82 @@
+import re
+import msgspec
+from json_objects import GenericEvent
+
+
+class EventFilter:
+    """
+    Selects the events to convert by event type and by repository, organization or actor, before a line is decoded
+    into its typed event. The event types are matched on the raw bytes of the line, and the repositories,
+    organizations and actors on the header of the event, decoded as a GenericEvent without building the payload.
+    Lines that cannot be decoded as a header are passed on, so that the converter logs them as usual.
+    """
+    def __init__(self, event_types=None, repos=None, orgs=None, actors=None):
+        """
+        :param event_types: event types to keep, None to keep all
+        :param repos: names of the repositories ("owner/name") to keep
+        :param orgs: logins of the organizations to keep
+        :param actors: logins of the actors to keep
+        Without repositories, organizations and actors, events of all of them are kept, otherwise an event is kept if
+        any of them matches. Names are compared case-insensitively, like GitHub does.
+        """
+        self.event_types = frozenset(event_types) if event_types else None
+        self.repos = frozenset(repo.lower() for repo in repos or ())
+        self.orgs = frozenset(org.lower() for org in orgs or ())
+        self.actors = frozenset(actor.lower() for actor in actors or ())
+        # a nested "type" field with the value of an event type is unlikely, and such lines are dropped once decoded
+        self.type_pattern = re.compile(rb'"type"\s*:\s*"(?:' + b'|'.join(
+            re.escape(event_type.encode()) for event_type in sorted(self.event_types)) + rb')"') \
+            if self.event_types else None
+        self.header_decoder = msgspec.json.Decoder(GenericEvent)
+
+    @classmethod
+    def from_file(cls, path, event_types=None):
+        """
+        Create a filter from a file with one entry per line: `repo:<owner>/<name>`, `org:<login>` or
+        `actor:<login>`. A line without prefix is a repository. Empty lines and lines starting with "#" are skipped.
+        :param path: path of the file
+        :param event_types: event types to keep, None to keep all
+        :return: EventFilter
+        """
+        entries = {'repo': [], 'org': [], 'actor': []}
+        with open(path, 'r') as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                kind, _, name = line.rpartition(':')
+                if kind not in ('', *entries):
+                    raise ValueError(f'Unknown filter "{kind}" in line {number} of {path}')
+                entries[kind or 'repo'].append(name.strip())
+        return cls(event_types, repos=entries['repo'], orgs=entries['org'], actors=entries['actor'])
+
+    def __reduce__(self):
+        # the compiled decoder cannot be pickled, the filter is rebuilt in the worker processes instead
+        return EventFilter, (self.event_types, self.repos, self.orgs, self.actors)
+
+    def accepts(self, line: bytes):
+        """
+        Check whether the event of a line is kept.
+        :param line: line from JSON file
+        :return: True if the event is kept or cannot be checked, False otherwise
+        """
+        if self.type_pattern is not None and not self.type_pattern.search(line):
+            # a malformed line without a matching type is dropped as well, it could not be written anyway
+            return False
+        if not (self.repos or self.orgs or self.actors):
+            return True
+        try:
+            header = self.header_decoder.decode(line)
+        except msgspec.DecodeError:
+            return True
+        return self.accepts_type(header.type) and (
+            header.repo.name.lower() in self.repos or header.actor.login.lower() in self.actors
+            or (header.org is not None and header.org.login.lower() in self.orgs))
+
+    def accepts_type(self, event_type):
+        """
+        Check whether events of a type are kept.
+        :param event_type: event type
+        :return: True if the events are kept
+        """
+        return self.event_types is None or event_type in self.event_types
@@ -5,6 +5,9 @@ import threading
 import argparse
 from manager import Manager
 from database_link import DatabaseLink
+from index_manager import months_between
+from event_filter import EventFilter
+from json_to_csv_converter import EVENT_TYPES
 from processing import Processing
 
 import os
@@ -30,15 +33,98 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-s', '--start-date', type=str, required=False, help='Start date in format YYYY-MM-DD.')
     parser.add_argument('-e', '--end-date', type=str, required=False, help='End date in format YYYY-MM-DD.')
-    parser.add_argument('-i', '--create-indices', required=False, help='Create indices for tables.',
-                        action='store_true')
-    parser.add_argument('-t', '--token', type=str, required=False, help='Access token for the GitHub API.')
+    parser.add_argument('--event-types', type=str, required=False,
+                        help='Comma-separated list of the event types to convert, e.g. "PushEvent,PullRequestEvent". '
+                             'Other events are skipped before they are decoded.')
+    parser.add_argument('--filter-file', type=str, required=False,
+                        help='File with the repositories, organizations and actors whose events are converted, one '
+                             'per line as "repo:<owner>/<name>", "org:<login>" or "actor:<login>". Other events are '
+                             'skipped before they are decoded.')
+    parser.add_argument('-i', '--create-indices', required=False, action='store_true',
+                        help='Create the indices for tables that do not exist yet. With -s and -e, only the '
+                             'partitions of the months of the date range are indexed.')
+    parser.add_argument('--index-workers', type=int, default=4, required=False,
+                        help='Number of tables or partitions indexed in parallel.')
+    parser.add_argument('--maintenance-work-mem', type=str, default='1GB', required=False,
+                        help='Memory of each index build, a PostgreSQL size like "1GB".')
+    parser.add_argument('--index-loaded-months', required=False, action='store_true',
+                        help='With --partitioned, index the partitions of each month in the background once all its '
+                             'hours are loaded.')
+    parser.add_argument('--download-workers', type=int, default=4, required=False,
+                        help='Number of hour files downloaded concurrently.')
+    parser.add_argument('--stream', required=False, action='store_true',
+                        help='Decompress the downloaded files on the fly instead of extracting them to disk.')
+    parser.add_argument('--low-memory', required=False, action='store_true',
+                        help='Read the hour files backwards in blocks instead of loading them into memory at once.')
+    parser.add_argument('--conversion-workers', type=int, default=1, required=False,
+                        help='Number of processes converting hour files to csv in parallel.')
+    parser.add_argument('--load-mode', type=str, default='stdin', choices=['stdin', 'memory', 'server', 'pandas'],
+                        required=False,
+                        help='How the converted data is loaded: "stdin" streams the csv files with COPY FROM STDIN, '
+                             '"memory" streams in-memory buffers without writing csv files, "server" lets the '
+                             'database server read the csv files, "pandas" inserts the rows through pandas.')
+    parser.add_argument('--output-format', type=str, default='csv', choices=['csv', 'binary', 'parquet'],
+                        required=False,
+                        help='Format of the converted files: "csv", or "binary" for the PostgreSQL binary COPY format, '
+                             'which is loaded faster. Binary files require load mode "stdin" or "memory". "parquet" '
+                             'writes Parquet files partitioned by day to the "parquet" folder of the data path '
+                             'instead of loading the database; requires pyarrow.')
+    parser.add_argument('--loader-threads', type=int, default=4, required=False,
+                        help='Number of tables of an hour loaded into the database concurrently, each over its own '
+                             'connection.')
+    parser.add_argument('--partitioned', required=False, action='store_true',
+                        help='Create the archive, commit, issue, issuecomment and pullrequest tables partitioned by '
+                             'month of the event time. The partitions are created as the hours are loaded. Must be '
+                             'given for every run on a database created with it.')
+    parser.add_argument('--dedup-store', type=str, default='memory',
+                        choices=['memory', 'array', 'sqlite', 'database'], required=False,
+                        help='Where the ids used to remove duplicate events are kept: "memory" in python sets, '
+                             '"array" in compact integer arrays, "sqlite" in a database in the data path that '
+                             'keeps memory bounded and survives restarts, "database" in unique indices of the '
+                             'tables, with each hour copied into staging tables and merged into the tables '
+                             '(not with --partitioned, which uses "memory" instead).')
+    parser.add_argument('--disk-budget', type=float, required=False,
+                        help='Maximum size of the temporary files in the data path, in GB. Downloads and '
+                             'decompressions wait for space instead of being bounded by fixed queue sizes, and the '
+                             'number of concurrent downloads adapts to the speed of the conversion.')
+    parser.add_argument('--metrics-port', type=int, required=False,
+                        help='Serve the counters and timers of the pipeline stages in the Prometheus text format at '
+                             'http://127.0.0.1:<port>/metrics.')
+    parser.add_argument('--summary-interval', type=float, default=60, required=False,
+                        help='Seconds between two log lines summarizing the progress and throughput of the stages, '
+                             '0 to disable.')
+    parser.add_argument('--profile', required=False, action='store_true',
+                        help='Profile the conversion and the loading of each hour with cProfile, writing the '
+                             'statistics to the "profiles" folder of the data path, and log the share of the '
+                             'conversion time spent on each event type. Converts the hours in a single process.')
+    parser.add_argument('--no-resume', required=False, action='store_true',
+                        help='Process all hours of the date range, even those the ingest ledger records as done.')
+    parser.add_argument('-t', '--token', type=str, action='append', required=False,
+                        help='Access token for the GitHub API. Repeat to spread the requests over several tokens.')
+    parser.add_argument('--token-file', type=str, required=False,
+                        help='File with access tokens for the GitHub API, one per line, added to those of -t.')
+    parser.add_argument('--api-url', type=str, default='https://api.github.com', required=False,
+                        help='Url of the GitHub API, e.g. of a GitHub Enterprise server or of a local mock server.')
+    parser.add_argument('--api-concurrency', type=int, default=16, required=False,
+                        help='Maximum number of concurrent requests to the GitHub API.')
+    parser.add_argument('--no-graphql', required=False, action='store_true',
+                        help='Fetch user details with one REST request per user instead of batched GraphQL queries, '
+                             'which are used when a token is given.')
+    parser.add_argument('--api-cache-ttl', type=float, default=24, required=False,
+                        help='Hours a cached response of the GitHub API is used without being revalidated. Responses '
+                             'are cached in "github_cache.sqlite" in the data path.')
+    parser.add_argument('--api-cache-size', type=int, default=512, required=False,
+                        help='Maximum size of the cached responses of the GitHub API in MB.')
+    parser.add_argument('--no-api-cache', required=False, action='store_true',
+                        help='Do not cache the responses of the GitHub API.')
     parser.add_argument('-c', '--add-commit-details', type=str, required=False,
                         help='Append commit details from the GitHub API to a csv file. '
                              'The csv file must have columns "repo_name" and "sha".')
     parser.add_argument('-u', '--add-user-details', type=str, required=False,
                         help='Append user details from the GitHub API to a csv file. '
                              'The csv file must have the column "actor_login".')
+    parser.add_argument('--chunk-size', type=int, default=100000, required=False,
+                        help='Rows of the csv file read at a time by -c, -u, -l and -r.')
     parser.add_argument('-r', '--clone-repos', type=str, required=False,
                         help='Clone repos listed in a csv file from GitHub into a folder.'
                              'Use in conjunction with -o and specify an empty folder where to clone the repos to.'
@@ -55,46 +141,80 @@ def main():
 
     if not os.path.isdir(DATA_PATH):
         os.mkdir(DATA_PATH)
+    cache_path = None if args.no_api_cache else f'{DATA_PATH}/github_cache.sqlite'
+    tokens = args.token or []
+    if args.token_file:
+        with open(args.token_file, 'r') as f:
+            tokens += [line.strip() for line in f if line.strip() and not line.startswith('#')]
 
 
     if args.create_indices:
+        months = months_between(args.start_date, args.end_date) if args.start_date and args.end_date else None
         with DatabaseLink(username=DATABASE_USERNAME, password=DATABASE_PASSWORD,
             database=DATABASE_NAME, host=DATABASE_HOST, port=DATABASE_PORT, sed_name=SED_NAME) as db:
-            db.create_indices()
+            db.create_indices(months, workers=args.index_workers, maintenance_work_mem=args.maintenance_work_mem)
 
     elif args.start_date and args.end_date:
         start_year, start_month, start_day = args.start_date.split('-')
         end_year, end_month, end_day = args.end_date.split('-')
         if start_year < 2015:
             raise ValueError('Start year must be 2015 or later.')
+        event_types = args.event_types.split(',') if args.event_types else None
+        if event_types and not set(event_types) <= EVENT_TYPES:
+            raise ValueError(f'Unknown event types: {", ".join(sorted(set(event_types) - EVENT_TYPES))}.')
+        if args.filter_file:
+            event_filter = EventFilter.from_file(args.filter_file, event_types)
+        else:
+            event_filter = EventFilter(event_types) if event_types else None
         manager = Manager(start_year=int(start_year), start_month=int(start_month), start_day=int(start_day),
                             end_year=int(end_year), end_month=int(end_month), end_day=int(end_day),
                             data_path=DATA_PATH, sed_name=SED_NAME,
                             database_username=DATABASE_USERNAME, database_password=DATABASE_PASSWORD,
-                            database_name=DATABASE_NAME, database_host=DATABASE_HOST, database_port=DATABASE_PORT)
+                            database_name=DATABASE_NAME, database_host=DATABASE_HOST, database_port=DATABASE_PORT,
+                            download_workers=args.download_workers, stream=args.stream,
+                            low_memory=args.low_memory, conversion_workers=args.conversion_workers,
+                            load_mode=args.load_mode, output_format=args.output_format,
+                            loader_threads=args.loader_threads, partitioned=args.partitioned,
+                            index_loaded_months=args.index_loaded_months, index_workers=args.index_workers,
+                            maintenance_work_mem=args.maintenance_work_mem,
+                            dedup_store=args.dedup_store, resume=not args.no_resume, event_filter=event_filter,
+                            profile=args.profile,
+                            disk_budget=int(args.disk_budget * 1e9) if args.disk_budget else None)
+        if args.metrics_port:
+            manager.metrics.serve(args.metrics_port)
+        if args.summary_interval > 0:
+            manager.metrics.report(args.summary_interval)
+        manager.create_tables()
         downloading_thread = threading.Thread(target=manager.run_download, name='downloadingThread')
         downloading_thread.start()
-        decompressing_thread = threading.Thread(target=manager.run_decompress, name='decompressingThread')
-        decompressing_thread.start()
+        if not args.stream:
+            decompressing_thread = threading.Thread(target=manager.run_decompress, name='decompressingThread')
+            decompressing_thread.start()
         writing_thread = threading.Thread(target=manager.run_write_csvs, name='writingThread')
         writing_thread.start()
         copying_thread = threading.Thread(target=manager.run_copy_into_database, name='copyingThread')
         copying_thread.start()
 
     elif args.add_commit_details:
-        processing = Processing(filename=args.add_commit_details, auth_token=args.token)
+        processing = Processing(filename=args.add_commit_details, auth_token=tokens, api_url=args.api_url,
+                                api_concurrency=args.api_concurrency, cache_path=cache_path,
+                                cache_ttl=args.api_cache_ttl * 3600, cache_size=args.api_cache_size * 1024 * 1024,
+                                chunksize=args.chunk_size)
         processing.add_commit_details()
 
     elif args.add_user_details:
-        processing = Processing(filename=args.add_user_details, auth_token=args.token)
+        processing = Processing(filename=args.add_user_details, auth_token=tokens, api_url=args.api_url,
+                                api_concurrency=args.api_concurrency, cache_path=cache_path,
+                                cache_ttl=args.api_cache_ttl * 3600, cache_size=args.api_cache_size * 1024 * 1024,
+                                use_graphql=not args.no_graphql, chunksize=args.chunk_size)
         processing.add_user_details()
 
     elif args.clone_repos and args.outpath:
-        processing = Processing(filename=args.clone_repos, repo_path=args.outpath)
+        processing = Processing(filename=args.clone_repos, repo_path=args.outpath, chunksize=args.chunk_size)
         processing.clone_repos()
 
     elif args.add_country_details:
-        processing = Processing(filename=args.add_country_details)
+        processing = Processing(filename=args.add_country_details, chunksize=args.chunk_size)
         processing.add_country_details()
 
     else:
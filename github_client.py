@@ -0,0 +1,368 @@
+import time
+import json
+import random
+import asyncio
+import logging
+import aiohttp
+from tqdm import tqdm
+from http_cache import NullHTTPCache
+
+API_URL = 'https://api.github.com'
+# user details added by `Processing.add_user_details`, with the values of users that are not found
+USER_DETAILS = {'bio': '', 'location': '', 'blog': '', 'company': ''}
+COMMIT_NOT_FOUND = 'Commit for not found.'
+
+
+class GitHubAPIError(Exception):
+    """
+    Raised for responses the client cannot recover from, like bad credentials, and for requests that still fail after
+    all retries, so that they are not taken for missing users or commits.
+    """
+    def __init__(self, status, text):
+        super().__init__(f'GitHub API returned {status}: {text}')
+        self.status = status
+        self.text = text
+
+
+class TokenBucket:
+    """
+    Request budget of a token, following the `X-RateLimit-*` headers of the GitHub API: the bucket holds the
+    requests remaining in the current rate limit window and is refilled when the window resets. Requests are taken
+    from the bucket before they are sent, so that concurrent requests do not overdraw it, and the count is corrected
+    with the headers of each response.
+    """
+    def __init__(self, token=None):
+        """
+        :param token: access token, None for unauthenticated requests
+        """
+        self.token = token
+        # unknown until the first response
+        self.limit = None
+        self.remaining = None
+        self.reset = 0.0
+
+    def headers(self):
+        return {'Authorization': f'Token {self.token}'} if self.token else {}
+
+    def available(self):
+        """
+        Check whether a request can be sent now, refilling the bucket if its window has reset.
+        :return: True if a request can be sent
+        """
+        if self.remaining is not None and time.time() >= self.reset:
+            # the window reset; the headers of the next response tell the new budget
+            self.remaining = None
+        return self.remaining is None or self.remaining > 0
+
+    def take(self):
+        """
+        Take a request from the bucket.
+        :return: None
+        """
+        if self.remaining is not None:
+            self.remaining -= 1
+
+    def give_back(self):
+        """
+        Give back a request that GitHub did not count against the rate limit, like a 304 response.
+        :return: None
+        """
+        if self.remaining is not None:
+            self.remaining += 1
+
+    def update(self, headers):
+        """
+        Update the bucket from the rate limit headers of a response.
+        :param headers: response headers
+        :return: None
+        """
+        if 'X-RateLimit-Remaining' not in headers:
+            return
+        remaining = int(headers['X-RateLimit-Remaining'])
+        reset = float(headers.get('X-RateLimit-Reset', time.time() + 3600))
+        self.limit = int(headers.get('X-RateLimit-Limit', remaining))
+        if self.remaining is not None and reset == self.reset:
+            # responses of the same window arrive out of order, the lowest count is the most recent
+            remaining = min(remaining, self.remaining)
+        self.remaining, self.reset = remaining, reset
+
+
+class TokenPool:
+    """
+    Pool of the TokenBuckets of several tokens. Each request is sent with the token that has the most requests
+    remaining, so that the requests are spread over the tokens by quota, and requests only wait when the rate limits
+    of all tokens are reached, until the earliest reset.
+    """
+    def __init__(self, tokens=None):
+        """
+        :param tokens: list of access tokens, empty or None for unauthenticated requests
+        """
+        self.buckets = [TokenBucket(token) for token in tokens or [None]]
+
+    async def acquire(self):
+        """
+        Wait until a token can send a request and take the request from its bucket.
+        :return: TokenBucket of the token
+        """
+        while True:
+            buckets = [bucket for bucket in self.buckets if bucket.available()]
+            if buckets:
+                # tokens not used yet come first, their budget is learned from their first response
+                bucket = max(buckets, key=lambda b: float('inf') if b.remaining is None else b.remaining)
+                bucket.take()
+                return bucket
+            reset = min(bucket.reset for bucket in self.buckets)
+            logging.info(f'Rate limits of {len(self.buckets)} tokens reached, sleeping until {int(reset) + 1}')
+            await asyncio.sleep(max(reset - time.time(), 0) + 1)
+
+
+class GitHubClient:
+    """
+    Asynchronous client of the GitHub REST and GraphQL APIs sending many requests concurrently over one connection pool. Requests
+    are admitted by the rate limit budgets of a pool of tokens, responses with server errors or a secondary rate limit are
+    retried with exponential backoff, and requests hitting the primary rate limit of a token are sent with another
+    token, or wait until the earliest reset when the rate limits of all tokens are reached. Successful
+    responses are stored in an HTTPCache and revalidated with conditional requests once they are stale.
+    """
+    def __init__(self, tokens=None, api_url=API_URL, concurrency=16, retries=5, backoff=1.0, timeout=60, cache=None,
+                 batch_size=100):
+        """
+        :param tokens: list of access tokens, empty or None for unauthenticated requests
+        :param api_url: url of the API, e.g. of a GitHub Enterprise server or of a local mock server
+        :param concurrency: maximum number of requests in flight
+        :param retries: number of retries of a request after server errors and secondary rate limits
+        :param backoff: base of the exponential backoff between retries, in seconds
+        :param timeout: total timeout of a request, in seconds
+        :param cache: HTTPCache of the responses, None to send every request
+        :param batch_size: number of users per GraphQL query, at most 100
+        """
+        # the REST and GraphQL APIs have separate rate limits
+        self.pool = TokenPool(tokens)
+        self.graphql_pool = TokenPool(tokens)
+        self.api_url = api_url.rstrip('/')
+        # the GraphQL API of GitHub Enterprise servers is at /api/graphql, next to the REST API at /api/v3
+        self.graphql_url = f'{self.api_url[:-len("/v3")] if self.api_url.endswith("/api/v3") else self.api_url}/graphql'
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache if cache is not None else NullHTTPCache()
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'Accept': 'application/vnd.github+json', 'User-Agent': 'ghelephant'})
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback):
+        await self.session.close()
+
+    async def get(self, path):
+        """
+        Send a GET request to the API.
+        :param path: path of the resource, e.g. "/users/octocat"
+        :return: tuple of the status and the decoded JSON body, None if the body is not JSON
+        """
+        url = f'{self.api_url}{path}'
+        entry = self.cache.get(url)
+        if entry is not None and entry.fresh:
+            return 200, json.loads(entry.body)
+        conditions = {}
+        if entry is not None and entry.etag:
+            conditions['If-None-Match'] = entry.etag
+        if entry is not None and entry.last_modified:
+            conditions['If-Modified-Since'] = entry.last_modified
+        status, text, headers, bucket = await self.__send('GET', url, self.pool, headers=conditions)
+        if status == 304 and entry is not None:
+            bucket.give_back()
+            self.cache.refresh(url)
+            return 200, json.loads(entry.body)
+        try:
+            body = json.loads(text)
+        except ValueError:
+            return status, None
+        if status == 200:
+            self.cache.put(url, text, headers.get('ETag'), headers.get('Last-Modified'))
+        return status, body
+
+    async def graphql(self, query, variables=None):
+        """
+        Send a query to the GraphQL API, which has a rate limit of its own.
+        :param query: GraphQL query
+        :param variables: dict of the variables of the query
+        :return: tuple of the status and the decoded JSON body, None if the body is not JSON
+        """
+        payload = {'query': query, 'variables': variables or {}}
+        while True:
+            status, text, _, bucket = await self.__send('POST', self.graphql_url, self.graphql_pool, payload=payload)
+            try:
+                body = json.loads(text)
+            except ValueError:
+                return status, None
+            if status == 200 and any(error.get('type') == 'RATE_LIMITED' for error in body.get('errors') or []):
+                # the query was refused, the next one is sent with another token or waits for the reset
+                bucket.remaining, bucket.reset = 0, max(bucket.reset, time.time() + 60)
+                continue
+            return status, body
+
+    async def __send(self, method, url, pool, headers=None, payload=None):
+        """
+        Send a request. Requests hitting a rate limit are sent again with another token or once the limit resets, as
+        often as needed; failed requests and server errors are retried `retries` times with exponential backoff.
+        :param method: HTTP method
+        :param url: url of the request
+        :param pool: TokenPool of the rate limit the request counts against
+        :param headers: additional headers of the request
+        :param payload: JSON payload of the request, None for no body
+        :return: tuple of the status, the text and the headers of the response, and the TokenBucket of its token
+        :raises GitHubAPIError: if the request is refused, or still fails after all retries
+        """
+        failures = 0
+        throttled = 0
+        while True:
+            bucket = await pool.acquire()
+            try:
+                async with self.session.request(method, url, headers={**bucket.headers(), **(headers or {})},
+                                                json=payload) as response:
+                    bucket.update(response.headers)
+                    text = await response.text()
+                    status, response_headers = response.status, response.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                failures += 1
+                logging.warning(f'Error requesting {url} (attempt {failures}): {e!r}')
+                await self.__retry_after_failure(url, failures, repr(e))
+                continue
+            if status in (403, 429):
+                if response_headers.get('X-RateLimit-Remaining') == '0':
+                    # the bucket is empty, the request is sent again with another token or after the reset
+                    continue
+                if 'Retry-After' in response_headers or 'secondary rate limit' in text.lower():
+                    delay = float(response_headers.get('Retry-After', 60 * 2 ** min(throttled, 4)))
+                    throttled += 1
+                    logging.warning(f'Secondary rate limit hit, waiting {delay:.0f}s')
+                    await asyncio.sleep(delay)
+                    continue
+                raise GitHubAPIError(status, text)
+            if status == 401:
+                raise GitHubAPIError(status, text)
+            if status >= 500:
+                failures += 1
+                logging.warning(f'Server error {status} for {url} (attempt {failures})')
+                await self.__retry_after_failure(url, failures, f'server error {status}', status)
+                continue
+            return status, text, response_headers, bucket
+
+    async def __retry_after_failure(self, url, failures, reason, status=None):
+        """
+        Wait before retrying a failed request, or give up after `retries` retries.
+        :param url: url of the request
+        :param failures: number of failed attempts so far
+        :param reason: description of the last failure
+        :param status: status of the last response, None if there was no response
+        :return: None
+        :raises GitHubAPIError: if all retries failed
+        """
+        if failures > self.retries:
+            logging.error(f'Giving up on {url} after {failures} attempts')
+            raise GitHubAPIError(status, f'Giving up on {url} after {failures} attempts: {reason}')
+        await self.__sleep_backoff(failures - 1)
+
+    async def __sleep_backoff(self, attempt):
+        await asyncio.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+
+    async def fetch_user(self, login):
+        """
+        Fetch user details like bio, location, blog and company.
+        :param login: login of the user
+        :return: dict of the user details, with empty values if the user is not found
+        """
+        status, body = await self.get(f'/users/{login}')
+        if status == 200 and body:
+            return {key: body.get(key, '') for key in USER_DETAILS}
+        return dict(USER_DETAILS)
+
+    async def fetch_users(self, logins, description=None):
+        """
+        Fetch the details of many users with the GraphQL API, `batch_size` aliased `user(login:)` fields per query.
+        Logins the GraphQL API does not resolve, like those of bots, of renamed or of deleted accounts, or whole
+        batches whose query failed, are fetched from the REST API, which returns empty values for missing users.
+        Results are cached for the time to live of the cache.
+        :param logins: iterable of logins
+        :param description: description of the progress bar
+        :return: dict of the user details by login
+        """
+        logins = list(dict.fromkeys(logins))
+        results = {}
+        pending = []
+        for login in logins:
+            entry = self.cache.get(f'{self.graphql_url}#user:{login}')
+            if entry is not None and entry.fresh:
+                results[login] = json.loads(entry.body)
+            else:
+                pending.append(login)
+        batches = [tuple(pending[i:i + self.batch_size]) for i in range(0, len(pending), self.batch_size)]
+        for found in (await self.map(self.__query_users, batches, description)).values():
+            for login, details in found.items():
+                results[login] = details
+                self.cache.put(f'{self.graphql_url}#user:{login}', json.dumps(details))
+        missing = [login for login in pending if login not in results]
+        if missing:
+            logging.info(f'{len(missing)} users not resolved by the GraphQL API, fetching them from the REST API')
+            results.update(await self.map(self.fetch_user, missing, description))
+        return results
+
+    async def __query_users(self, logins):
+        """
+        Query the details of a batch of users with one aliased field per user.
+        :param logins: tuple of logins
+        :return: dict of the user details by login, for the users found
+        """
+        variables = {f'u{i}': login for i, login in enumerate(logins)}
+        query = (f'query({", ".join(f"${name}: String!" for name in variables)}) {{ '
+                 + ' '.join(f'{name}: user(login: ${name}) {{ bio location websiteUrl company }}' for name in variables)
+                 + ' }')
+        status, body = await self.graphql(query, variables)
+        if status != 200 or not body or not body.get('data'):
+            logging.warning(f'GraphQL query of {len(logins)} users failed: {status} {(body or {}).get("errors")}')
+            return {}
+        found = {}
+        for name, login in variables.items():
+            user = body['data'].get(name)
+            if user is not None:
+                found[login] = {'bio': user['bio'], 'location': user['location'], 'blog': user['websiteUrl'] or '',
+                                'company': user['company']}
+        return found
+
+    async def fetch_commit(self, key):
+        """
+        Fetch the files changed by a commit.
+        :param key: tuple of the repo name in the format "owner/repo" and the commit sha
+        :return: the files in JSON format, or a note if the commit is not found
+        """
+        repo, sha = key
+        status, body = await self.get(f'/repos/{repo}/commits/{sha}')
+        if status == 200 and body and 'files' in body:
+            return json.dumps(body['files'])
+        return COMMIT_NOT_FOUND
+
+    async def map(self, fetch, keys, description=None):
+        """
+        Fetch the values of many keys concurrently, each key once.
+        :param fetch: coroutine function fetching the value of a key
+        :param keys: iterable of keys
+        :param description: description of the progress bar
+        :return: dict of the values by key
+        """
+        keys = list(dict.fromkeys(keys))
+        results = {}
+        pending = iter(keys)
+        with tqdm(total=len(keys), desc=description) as progress:
+            async def worker():
+                for key in pending:
+                    results[key] = await fetch(key)
+                    progress.update()
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(keys)) or 1)))
+        return results
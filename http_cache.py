@@ -0,0 +1,129 @@
+import time
+import sqlite3
+import logging
+from collections import namedtuple
+
+CacheEntry = namedtuple('CacheEntry', ['body', 'etag', 'last_modified', 'fresh'])
+
+
+class HTTPCache:
+    """
+    Persistent cache of GitHub API responses in a SQLite database. Responses are stored with their `ETag` and
+    `Last-Modified` validators: entries younger than the time to live are served without a request, older ones are
+    revalidated with a conditional request, which GitHub answers with 304 without counting it against the rate limit.
+    Entries not validated within `max_age` are evicted, then the least recently used ones until the cache fits in
+    `max_size`, every `commit_every` changes and when the cache is closed.
+
+    Entries are keyed by url only, whatever the token of the request: a response fetched with one token is served to
+    requests with any other token, or without one. The enrichment commands only fetch users and commits, but a cache
+    that holds responses about private repositories must not be shared with users who have no access to them.
+    """
+    def __init__(self, path, ttl=24 * 3600, max_age=90 * 24 * 3600, max_size=512 * 1024 * 1024, commit_every=1000):
+        """
+        :param path: path of the database file
+        :param ttl: seconds an entry is served without being revalidated
+        :param max_age: seconds after which an entry that was not validated is evicted
+        :param max_size: maximum total size of the stored bodies, in bytes
+        :param commit_every: number of changes after which they are committed and the limits are enforced
+        """
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_size = max_size
+        self.commit_every = commit_every
+        self.changes = 0
+        self.hits = self.revalidated = self.misses = 0
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, body TEXT, etag TEXT, '
+                          'last_modified TEXT, size INTEGER, validated_at REAL, accessed_at REAL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed_idx ON responses (accessed_at)')
+        self.conn.commit()
+
+    def get(self, url):
+        """
+        Look up the response of a url.
+        :param url: url of the request
+        :return: CacheEntry, None if the url is not cached
+        """
+        row = self.conn.execute('SELECT body, etag, last_modified, validated_at FROM responses WHERE url = ?',
+                                (url,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        body, etag, last_modified, validated_at = row
+        fresh = time.time() - validated_at < self.ttl
+        if fresh:
+            self.hits += 1
+            self.__change('UPDATE responses SET accessed_at = ? WHERE url = ?', (time.time(), url))
+        return CacheEntry(body, etag, last_modified, fresh)
+
+    def put(self, url, body, etag=None, last_modified=None):
+        """
+        Store the response of a url.
+        :param url: url of the request
+        :param body: text of the response
+        :param etag: value of the ETag header
+        :param last_modified: value of the Last-Modified header
+        :return: None
+        """
+        now = time.time()
+        self.__change('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                      (url, body, etag, last_modified, len(body), now, now))
+
+    def refresh(self, url):
+        """
+        Mark the entry of a url as validated, after a 304 response.
+        :param url: url of the request
+        :return: None
+        """
+        self.revalidated += 1
+        now = time.time()
+        self.__change('UPDATE responses SET validated_at = ?, accessed_at = ? WHERE url = ?', (now, now, url))
+
+    def evict(self):
+        """
+        Evict the entries older than `max_age`, then the least recently used ones until the cache fits in `max_size`.
+        :return: None
+        """
+        self.conn.execute('DELETE FROM responses WHERE validated_at < ?', (time.time() - self.max_age,))
+        size = self.conn.execute('SELECT coalesce(sum(size), 0) FROM responses').fetchone()[0]
+        if size > self.max_size:
+            # the most recently used entries that fit in the size limit are kept
+            self.conn.execute('DELETE FROM responses WHERE url IN (SELECT url FROM (SELECT url, sum(size) OVER '
+                              '(ORDER BY accessed_at DESC, url) AS total FROM responses) WHERE total > ?)',
+                              (self.max_size,))
+        self.conn.commit()
+        self.changes = 0
+
+    def close(self):
+        self.evict()
+        logging.info(f'HTTP cache: {self.hits} fresh hits, {self.revalidated} revalidated, {self.misses} misses')
+        self.conn.close()
+
+    def __change(self, query, params):
+        self.conn.execute(query, params)
+        self.changes += 1
+        if self.changes >= self.commit_every:
+            # the limits are enforced with every commit, so that the cache stays bounded during long runs
+            self.evict()
+
+
+class NullHTTPCache:
+    """
+    Cache that stores nothing, for when the cache is disabled.
+    """
+    def get(self, url):
+        return None
+
+    def put(self, url, body, etag=None, last_modified=None):
+        pass
+
+    def refresh(self, url):
+        pass
+
+    def evict(self):
+        pass
+
+    def close(self):
+        pass
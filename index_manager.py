@@ -0,0 +1,213 @@
+import re
+import logging
+import traceback
+import psycopg2
+from contextlib import closing
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from table_schemas import SQL_PATH, read_partitioned_tables
+
+INDEX_PATTERN = re.compile(r'create (unique )?index (?:if not exists )?(\w+) on (\w+) \(([^)]*)\);', re.IGNORECASE)
+
+
+def read_indices(file_name='create_indices.sql'):
+    """
+    Read the indices defined in a file.
+    :param file_name: name of the file in the `sql` folder
+    :return: list of (index name, table, columns, unique) tuples
+    """
+    with open(f'{SQL_PATH}/{file_name}', 'r') as f:
+        sql = re.sub(r'--[^\n]*', '', f.read())
+    return [(name, table, columns, bool(unique)) for unique, name, table, columns in INDEX_PATTERN.findall(sql)]
+
+
+def months_between(start_date, end_date):
+    """
+    Get the months of a date range.
+    :param start_date: first date, in the format "YYYY-MM-DD"
+    :param end_date: last date, in the format "YYYY-MM-DD"
+    :return: set of (year, month) tuples
+    """
+    year, month = int(start_date[:4]), int(start_date[5:7])
+    end = int(end_date[:4]), int(end_date[5:7])
+    months = set()
+    while (year, month) <= end:
+        months.add((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+class IndexManager:
+    """
+    Class to build the indices of `sql/create_indices.sql` idempotently: indices that exist are skipped, and indices
+    left invalid by an interrupted build are rebuilt. Indices are built concurrently, so the tables stay readable and
+    writable, and in parallel across tables, one connection per table.
+
+    On partitioned tables, an index is created on the parent only and built on each partition separately, then
+    attached, so that the partitions of a date range can be indexed while newer months are still being loaded. The
+    index of the parent becomes valid once the indices of all partitions are attached.
+    """
+    def __init__(self, username, password, database, host, port, workers=4, maintenance_work_mem='1GB',
+                 concurrently=True):
+        """
+        :param workers: number of tables or partitions indexed in parallel
+        :param maintenance_work_mem: memory of each index build, a PostgreSQL size like '1GB'
+        :param concurrently: build the indices without blocking writes to the tables
+        """
+        self.username = username
+        self.password = password
+        self.database = database
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.maintenance_work_mem = maintenance_work_mem
+        self.concurrently = concurrently
+
+    def create_indices(self, months=None):
+        """
+        Create the indices that do not exist yet.
+        :param months: set of (year, month) tuples whose partitions are indexed, None to index all tables and
+        partitions; unpartitioned tables are only indexed with None, and all tables are indexed if the database is
+        not partitioned
+        :return: None
+        """
+        logging.info('Creating indices')
+        partitioned_tables = read_partitioned_tables()
+        # relation -> indices to build on it, built one after another
+        builds = defaultdict(list)
+        with closing(self.__connect()) as conn:
+            if months is not None and not self.__partitions(conn, 'archive'):
+                logging.warning('The tables are not partitioned by month, indexing all tables')
+                months = None
+            for name, table, columns, unique in read_indices():
+                partitions = self.__partitions(conn, table)
+                if not partitions:
+                    if months is None:
+                        builds[table].append((name, columns, unique, None))
+                    continue
+                # a unique index on a partitioned table must contain the partition key
+                key = partitioned_tables[table]
+                if unique and key not in [column.strip() for column in columns.split(',')]:
+                    columns = f'{columns}, {key}'
+                IndexManager.__execute(conn, f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {name} '
+                                             f'ON ONLY {table} ({columns})')
+                for partition in partitions:
+                    if months is None or IndexManager.__month(partition) in months:
+                        builds[partition].append((f'{partition}{name[len(table):]}', columns, unique, name))
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='indexer') as executor:
+            for relation, indices in builds.items():
+                executor.submit(self.__build, relation, indices)
+        if months is None:
+            self.__add_primary_keys()
+        logging.info('Finished creating indices')
+
+    def __build(self, relation, indices):
+        """
+        Build indices on a table or partition, attaching the indices of a partition to those of its parent.
+        :param relation: table or partition
+        :param indices: list of (index name, columns, unique, parent index) tuples, with None as parent index for
+        unpartitioned tables
+        :return: None
+        """
+        try:
+            with closing(self.__connect()) as conn:
+                for name, columns, unique, parent in indices:
+                    if parent is not None and self.__attached_index(conn, parent, relation):
+                        continue
+                    valid = self.__is_valid(conn, name)
+                    if valid is False:
+                        logging.warning(f'Index {name} is invalid, rebuilding it')
+                        IndexManager.__execute(conn, f'DROP INDEX {"CONCURRENTLY " if self.concurrently else ""}'
+                                                     f'IF EXISTS {name}')
+                    if not valid:
+                        logging.info(f'Creating index {name}')
+                        IndexManager.__execute(conn, f'CREATE {"UNIQUE " if unique else ""}INDEX '
+                                                     f'{"CONCURRENTLY " if self.concurrently else ""}'
+                                                     f'IF NOT EXISTS {name} ON {relation} ({columns})')
+                    if parent is not None:
+                        IndexManager.__execute(conn, f'ALTER INDEX {parent} ATTACH PARTITION {name}')
+        except Exception:
+            logging.error(f'Error creating indices on {relation}')
+            logging.error(traceback.format_exc())
+
+    def __add_primary_keys(self):
+        """
+        Turn the unique indices named `<table>_pkey` of unpartitioned tables into primary keys.
+        :return: None
+        """
+        with closing(self.__connect()) as conn:
+            for name, table, _, unique in read_indices():
+                if unique and name == f'{table}_pkey' and not self.__partitions(conn, table) \
+                        and self.__is_valid(conn, name) \
+                        and not IndexManager.__fetch(conn, "SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass "
+                                                           "AND contype = 'p'", (table,)):
+                    IndexManager.__execute(conn, f'ALTER TABLE {table} ADD PRIMARY KEY USING INDEX {name}')
+
+    def __connect(self):
+        """
+        Open a connection in autocommit mode, as concurrent index builds cannot run in a transaction.
+        :return: connection
+        """
+        conn = psycopg2.connect(database=self.database, user=self.username,
+            password=self.password, host=self.host, port=self.port)
+        conn.autocommit = True
+        IndexManager.__execute(conn, 'SET maintenance_work_mem = %s', (self.maintenance_work_mem,))
+        return conn
+
+    def __partitions(self, conn, table):
+        """
+        Get the partitions of a table.
+        :param conn: connection
+        :param table: table name
+        :return: list of partition names, empty if the table is not partitioned
+        """
+        return [row[0] for row in IndexManager.__fetch(conn, "SELECT c.relname FROM pg_inherits i "
+                                                             "JOIN pg_class c ON c.oid = i.inhrelid "
+                                                             "WHERE i.inhparent = %s::regclass ORDER BY c.relname DESC",
+                                                       (table,), all_rows=True)]
+
+    def __attached_index(self, conn, parent, partition):
+        """
+        Check whether a partition has an index attached to an index of its parent, like the indices PostgreSQL
+        creates on partitions added after the index of the parent.
+        :param conn: connection
+        :param parent: index of the parent
+        :param partition: partition name
+        :return: True if the partition has an attached index
+        """
+        return IndexManager.__fetch(conn, "SELECT 1 FROM pg_inherits i JOIN pg_index x ON x.indexrelid = i.inhrelid "
+                                          "WHERE i.inhparent = %s::regclass AND x.indrelid = %s::regclass",
+                                    (parent, partition)) is not None
+
+    def __is_valid(self, conn, name):
+        """
+        Check whether an index exists and is valid.
+        :param conn: connection
+        :param name: index name
+        :return: True if valid, False if invalid, None if the index does not exist
+        """
+        row = IndexManager.__fetch(conn, "SELECT x.indisvalid FROM pg_index x JOIN pg_class c ON c.oid = x.indexrelid "
+                                         "WHERE c.relname = %s", (name,))
+        return row[0] if row else None
+
+    @staticmethod
+    def __month(partition):
+        """
+        Get the month of a monthly partition named `<table>_<YYYY>_<MM>`.
+        :param partition: partition name
+        :return: (year, month) tuple, None for other partitions
+        """
+        match = re.search(r'_(\d{4})_(\d{2})$', partition)
+        return (int(match.group(1)), int(match.group(2))) if match else None
+
+    @staticmethod
+    def __execute(conn, query, params=None):
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+
+    @staticmethod
+    def __fetch(conn, query, params=None, all_rows=False):
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall() if all_rows else cursor.fetchone()
+
@@ -1,5 +1,5 @@
 import msgspec
-from typing import Optional
+from typing import Optional, Union
 from datetime import datetime
 
 # contains all the json objects from Events API/GH Archive.
@@ -33,6 +33,32 @@ class GenericEvent(msgspec.Struct):
     org: Optional[Org] = None
 
 
+# base of all typed events. the "type" field of an event selects the struct it is decoded into,
+# so that a line is decoded only once.
+
+class Event(msgspec.Struct, tag_field='type', kw_only=True):
+    id: str
+    actor: Actor
+    repo: Repo
+    public: bool
+    created_at: datetime
+    org: Optional[Org] = None
+
+    @property
+    def type(self):
+        return self.__struct_config__.tag
+
+
+# WatchEvent and PublicEvent, which have no payload that is stored
+
+class WatchEvent(Event, tag=True):
+    pass
+
+
+class PublicEvent(Event, tag=True):
+    pass
+
+
 # PushEvent
 
 class Author(msgspec.Struct):
@@ -57,7 +83,7 @@ class PushEventPayload(msgspec.Struct):
     commits: list[Commit]
 
 
-class PushEvent(msgspec.Struct):
+class PushEvent(Event, tag=True):
     payload: PushEventPayload
 
 
@@ -77,7 +103,7 @@ class CommitCommentEventPayload(msgspec.Struct):
     comment: Comment
 
 
-class CommitCommentEvent(msgspec.Struct):
+class CommitCommentEvent(Event, tag=True):
     payload: CommitCommentEventPayload
 
 
@@ -99,7 +125,7 @@ class ReleaseEventPayload(msgspec.Struct):
     release: Release
 
 
-class ReleaseEvent(msgspec.Struct):
+class ReleaseEvent(Event, tag=True):
     payload: ReleaseEventPayload
 
 
@@ -111,7 +137,7 @@ class DeleteEventPayload(msgspec.Struct):
     pusher_type: str
 
 
-class DeleteEvent(msgspec.Struct):
+class DeleteEvent(Event, tag=True):
     payload: DeleteEventPayload
 
 
@@ -129,7 +155,7 @@ class GollumEventPayload(msgspec.Struct):
     pages: list[Page]
 
 
-class GollumEvent(msgspec.Struct):
+class GollumEvent(Event, tag=True):
     payload: GollumEventPayload
 
 
@@ -146,7 +172,7 @@ class MemberEventPayload(msgspec.Struct):
     member: Member
 
 
-class MemberEvent(msgspec.Struct):
+class MemberEvent(Event, tag=True):
     payload: MemberEventPayload
 
 
@@ -199,7 +225,7 @@ class ForkEventPayload(msgspec.Struct):
     forkee: Forkee
 
 
-class ForkEvent(msgspec.Struct):
+class ForkEvent(Event, tag=True):
     payload: ForkEventPayload
 
 
@@ -212,21 +238,106 @@ class CreateEventPayload(msgspec.Struct):
     description: Optional[str] = None
     ref: Optional[str] = None
 
-class CreateEvent(msgspec.Struct):
+class CreateEvent(Event, tag=True):
     payload: CreateEventPayload
 
 
-# PullRequestEvent
+# IssuesEvent. the fields of issues, comments and review comments other than their ids can be null in the archive,
+# so that they are all optional
+
+class User(msgspec.Struct):
+    id: Optional[int] = None
+    login: Optional[str] = None
+    type: Optional[str] = None
+    site_admin: Optional[bool] = None
+
+
+class Reactions(msgspec.Struct):
+    total_count: Optional[int] = None
+    plus_one: Optional[int] = msgspec.field(default=None, name='+1')
+    minus_one: Optional[int] = msgspec.field(default=None, name='-1')
+    laugh: Optional[int] = None
+    hooray: Optional[int] = None
+    confused: Optional[int] = None
+    heart: Optional[int] = None
+    rocket: Optional[int] = None
+    eyes: Optional[int] = None
+
+
+class App(msgspec.Struct):
+    slug: Optional[str] = None
 
-class PullRequestHead(msgspec.Struct):
-    sha: str
-    repo: Optional[Forkee]
 
 class Label(msgspec.Struct):
-    name: str
+    name: Optional[str] = None
+
 
 class Milestone(msgspec.Struct):
+    id: Optional[int] = None
+
+
+class Issue(msgspec.Struct):
+    id: int
+    user: User
+    number: Optional[int] = None
+    title: Optional[str] = None
+    state: Optional[str] = None
+    locked: Optional[bool] = None
+    comments: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    closed_at: Optional[datetime] = None
+    labels: Optional[list[Label]] = None
+    assignee: Optional[User] = None
+    assignees: Optional[list[User]] = None
+    milestone: Optional[Milestone] = None
+    author_association: Optional[str] = None
+    active_lock_reason: Optional[str] = None
+    draft: Optional[bool] = None
+    pull_request: Optional[dict] = None
+    body: Optional[str] = None
+    reactions: Optional[Reactions] = None
+    performed_via_github_app: Optional[App] = None
+    state_reason: Optional[str] = None
+
+
+class IssuesEventPayload(msgspec.Struct):
+    issue: Issue
+    action: Optional[str] = None
+
+
+class IssuesEvent(Event, tag=True):
+    payload: IssuesEventPayload
+
+
+# IssueCommentEvent
+
+class IssueComment(msgspec.Struct):
     id: int
+    user: User
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    body: Optional[str] = None
+    author_association: Optional[str] = None
+    reactions: Optional[Reactions] = None
+    performed_via_github_app: Optional[App] = None
+
+
+class IssueCommentEventPayload(msgspec.Struct):
+    issue: Issue
+    comment: IssueComment
+    action: Optional[str] = None
+
+
+class IssueCommentEvent(Event, tag=True):
+    payload: IssueCommentEventPayload
+
+
+# PullRequestEvent
+
+class PullRequestHead(msgspec.Struct):
+    sha: str
+    repo: Optional[Forkee]
 
 class Team(msgspec.Struct):
     name: str
@@ -273,7 +384,7 @@ class PullRequestEventPayload(msgspec.Struct):
     number: int
     pull_request: PullRequest
 
-class PullRequestEvent(msgspec.Struct):
+class PullRequestEvent(Event, tag=True):
     payload: PullRequestEventPayload
 
 
@@ -293,15 +404,46 @@ class PullRequestReviewEventPayload(msgspec.Struct):
     review: Review
     pull_request: PullRequest
 
-class PullRequestReviewEvent(msgspec.Struct):
+class PullRequestReviewEvent(Event, tag=True):
     payload: PullRequestReviewEventPayload
 
 
 # PullRequestReviewCommentEvent
 
+class ReviewComment(msgspec.Struct):
+    id: int
+    user: User
+    diff_hunk: Optional[str] = None
+    path: Optional[str] = None
+    commit_id: Optional[str] = None
+    original_commit_id: Optional[str] = None
+    body: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    pull_request_review_id: Optional[int] = None
+    position: Optional[int] = None
+    original_position: Optional[int] = None
+    author_association: Optional[str] = None
+    reactions: Optional[Reactions] = None
+    start_line: Optional[int] = None
+    original_start_line: Optional[int] = None
+    start_side: Optional[str] = None
+    line: Optional[int] = None
+    original_line: Optional[int] = None
+    side: Optional[str] = None
+    in_reply_to_id: Optional[int] = None
+
 class PullRequestReviewCommentEventPayload(msgspec.Struct):
     action: str
+    comment: ReviewComment
     pull_request: PullRequest
 
-class PullRequestReviewCommentEvent(msgspec.Struct):
-    payload: PullRequestReviewCommentEventPayload
\ No newline at end of file
+class PullRequestReviewCommentEvent(Event, tag=True):
+    payload: PullRequestReviewCommentEventPayload
+
+
+# all typed events, decoded in one pass with `msgspec.json.Decoder(AnyEvent)`
+
+AnyEvent = Union[PushEvent, CommitCommentEvent, WatchEvent, ReleaseEvent, DeleteEvent, GollumEvent, PublicEvent,
+                 MemberEvent, ForkEvent, CreateEvent, IssuesEvent, IssueCommentEvent, PullRequestEvent,
+                 PullRequestReviewEvent, PullRequestReviewCommentEvent]
@@ -1,87 +1,126 @@
-import orjson
 import logging
 import traceback
 import msgspec
+from collections import Counter
 from json_objects import *
+from line_readers import reversed_lines
+from dedup_stores import create_dedup_stores
+
+EVENT_TYPES = {event.__name__ for event in AnyEvent.__args__}
 
 
 class JSONToCSVConverter:
     """
     Converts JSON file to CSV files.
     """
-    def __init__(self, writer) -> None:
+    def __init__(self, writer, low_memory=False, dedup_stores=None, partitioned=False, event_filter=None) -> None:
         self.writer = writer
-        self.added_ids = set()
-        self.added_pushes = set()
-        self.added_issues = set()
-        self.added_prs = set()
+        # EventFilter selecting the events to write before they are decoded, None to write all events
+        self.event_filter = event_filter
+        # the rows of the tables partitioned by event time end with the time of their event
+        self.partitioned = partitioned
+        # read the lines backwards in blocks instead of loading the whole file into memory
+        self.low_memory = low_memory
+        # decodes a line directly into the struct of its event type
+        self.decoder = msgspec.json.Decoder(AnyEvent)
+        # stores of the event, push, issue and pull request ids already written, see `dedup_stores.py`
+        self.dedup_stores = dedup_stores or create_dedup_stores()
+        self.added_ids, self.added_pushes, self.added_issues, self.added_prs = self.dedup_stores
+        # number of events written by the last call of `write_events`, in total and by event type
+        self.events_written = 0
+        self.events_by_type = Counter()
 
     def write_events(self, f):
         """
-        Write events from JSON file to CSV files, line by line.
+        Write events from JSON file to CSV files, line by line. The lines are processed from the newest to the
+        oldest event, so that the newest version of a duplicated event is the one that is kept.
         :param f:  JSON file
         :return:  None
         """
-        for line in reversed(f.readlines()):
+        self.events_written = 0
+        self.events_by_type = Counter()
+        lines = reversed_lines(f) if self.low_memory else reversed(f.readlines())
+        for line in lines:
+            if self.event_filter is not None and not self.event_filter.accepts(line):
+                continue
             try:
-                generic_event = msgspec.json.decode(line, type=GenericEvent)
+                record = self.decoder.decode(line)
             except Exception:
-                logging.error(f"Malformed event: {line}")
+                self.log_undecodable_event(line)
+                continue
+            if self.event_filter is not None and not self.event_filter.accepts_type(record.type):
                 continue
 
-            if generic_event.id in self.added_ids:
+            if record.id in self.added_ids:
                 continue
             else:
-                self.added_ids.add(generic_event.id)
+                self.added_ids.add(record.id)
+                self.events_written += 1
+                self.events_by_type[record.type] += 1
 
             try:
-                match generic_event.type:
+                match record.type:
                     case 'PushEvent':
-                        record = msgspec.json.decode(line, type=PushEvent)
                         if record.payload.push_id in self.added_pushes:
                             continue
                         else:
                             self.added_pushes.add(record.payload.push_id)
-                        self.write_push_event(record, generic_event)
+                        self.write_push_event(record)
                     case 'CommitCommentEvent':
-                        self.write_commit_comment_event(line, generic_event)
+                        self.write_commit_comment_event(record)
                     case 'WatchEvent':
-                        self.write_generic_event(generic_event)
+                        self.write_generic_event(record)
                     case 'ReleaseEvent':
-                        self.write_release_event(line, generic_event)
+                        self.write_release_event(record)
                     case 'DeleteEvent':
-                        self.write_delete_event(line, generic_event)
+                        self.write_delete_event(record)
                     case 'GollumEvent':
-                        self.write_gollum_event(line, generic_event)
+                        self.write_gollum_event(record)
                     case 'PublicEvent':
-                        self.write_generic_event(generic_event)
+                        self.write_generic_event(record)
                     case 'MemberEvent':
-                        self.write_member_event(line, generic_event)
+                        self.write_member_event(record)
                     case 'ForkEvent':
-                        self.write_fork_event(line, generic_event)
+                        self.write_fork_event(record)
                     case 'CreateEvent':
-                        self.write_create_event(line, generic_event)
+                        self.write_create_event(record)
                     case 'IssuesEvent':
-                        self.write_issues_event(line, generic_event)
+                        self.write_issues_event(record)
                     case 'IssueCommentEvent':
-                        self.write_issue_comment_event(line, generic_event)
+                        self.write_issue_comment_event(record)
                     case 'PullRequestEvent':
-                        self.write_pull_request_event(line, generic_event)
+                        self.write_pull_request_event(record)
                     case 'PullRequestReviewEvent':
-                        self.write_pull_request_review_event(line, generic_event)
+                        self.write_pull_request_review_event(record)
                     case 'PullRequestReviewCommentEvent':
-                        self.write_pull_request_review_comment_event(line, generic_event)
-                    case _:
-                        logging.error(f'Unknown event type: {generic_event.type}')
+                        self.write_pull_request_review_comment_event(record)
             except Exception:
                 logging.error(f'Error writing line: {line}')
                 logging.error(traceback.format_exc())
 
-    def write_pull_request_tuple(self, pr, action):
+    def log_undecodable_event(self, line: bytes):
+        """
+        Log a line that could not be decoded into a typed event, either because it is malformed or because its event
+        type is unknown.
+        :param line: line from JSON file
+        :return: None
+        """
+        try:
+            generic_event = msgspec.json.decode(line, type=GenericEvent)
+        except Exception:
+            logging.error(f"Malformed event: {line}")
+            return
+        if generic_event.type in EVENT_TYPES:
+            logging.error(f'Malformed event: {line}')
+        else:
+            logging.error(f'Unknown event type: {generic_event.type}')
+
+    def write_pull_request_tuple(self, pr, action, record):
         """
         Write a tuple of pull request data to the CSV file.
         :param pr: line from JSON file
         :param action: generic event
+        :param record: decoded event the pull request is part of
         :return: None
         """
         if pr.id in self.added_prs:
@@ -103,142 +142,128 @@ class JSONToCSVConverter:
                 str(requested_reviewers)[:255], str(requested_teams)[:255], labels, milestone, pr.draft, pr.author_association,
                 pr.active_lock_reason, pr.merged, pr.mergeable, pr.mergeable_state, pr.merged_by.id if pr.merged_by else None,
                 pr.comments, pr.review_comments, pr.maintainer_can_modify, pr.commits, pr.additions, pr.deletions, pr.changed_files,
-                head_repo, pr.head.sha, base_repo, pr.base.sha))
+                head_repo, pr.head.sha, base_repo, pr.base.sha, *self.event_time(record)))
 
-    def write_pull_request_review_comment_event(self, line: bytes, generic_event: GenericEvent):
+    def write_pull_request_review_comment_event(self, record: PullRequestReviewCommentEvent):
         """
         Write a pull request review comment event to the CSV file.
-        :param line: line from JSON file
-        :param generic_event: generic event
+        :param record: decoded event
         :return: None
         """
-        record = orjson.loads(line)
-        record_msgspec = msgspec.json.decode(line, type=PullRequestReviewCommentEvent)
-        self.writer.writers['archive'].writerow(self.generic_event_tuple(generic_event, record['payload']['comment']['id']))
-        c = record['payload']['comment']
-        self.writer.writers['pullrequestreviewcomment'].writerow((c['id'], c.get('pull_request_review_id'),
-                                                        c['diff_hunk'], c['path'], c['position'],
-                                                        c['original_position'], c['commit_id'],
-                                                        c['original_commit_id'], c['user']['id'],
-                                                        c['user']['login'],
-                                                        c['user']['type'], c['user']['site_admin'],
-                                                        c['body'], c['created_at'], c['updated_at'],
-                                                        c.get('author_association'), *self.reactions(c),
-                                                        c.get('start_line'), c.get('original_start_line'),
-                                                        c.get('start_side'), c.get('line'), c.get('original_line'),
-                                                        c.get('side'), c.get('in_reply_to_id'),
-                                                        record['payload']['pull_request']['id']))
-        self.write_pull_request_tuple(record_msgspec.payload.pull_request, record_msgspec.payload.action)
-
-    def write_pull_request_review_event(self, line: bytes, generic_event: GenericEvent):
+        c = record.payload.comment
+        self.writer.writers['archive'].writerow(self.generic_event_tuple(record, c.id))
+        self.writer.writers['pullrequestreviewcomment'].writerow((c.id, c.pull_request_review_id,
+                                                        c.diff_hunk, c.path, c.position,
+                                                        c.original_position, c.commit_id,
+                                                        c.original_commit_id, c.user.id,
+                                                        c.user.login,
+                                                        c.user.type, c.user.site_admin,
+                                                        c.body, c.created_at, c.updated_at,
+                                                        c.author_association, *self.reactions(c),
+                                                        c.start_line, c.original_start_line,
+                                                        c.start_side, c.line, c.original_line,
+                                                        c.side, c.in_reply_to_id,
+                                                        record.payload.pull_request.id))
+        self.write_pull_request_tuple(record.payload.pull_request, record.payload.action, record)
+
+    def write_pull_request_review_event(self, record: PullRequestReviewEvent):
         """
         Write a pull request review event to the CSV file.
-        :param line: line from JSON file
-        :param generic_event: generic event
+        :param record: decoded event
         :return: None
         """
-        record = msgspec.json.decode(line, type=PullRequestReviewEvent)
-        self.writer.writers['archive'].writerow(self.generic_event_tuple(generic_event, record.payload.review.id))
+        self.writer.writers['archive'].writerow(self.generic_event_tuple(record, record.payload.review.id))
         p = record.payload.review
         self.writer.writers['pullrequestreview'].writerow((p.id, record.payload.action, p.user.id,
                                                 p.user.login, p.user.type,
                                                 p.user.site_admin, p.body, p.commit_id,
                                                 p.submitted_at, p.state, p.author_association,
                                                 record.payload.pull_request.id))
-        self.write_pull_request_tuple(record.payload.pull_request, record.payload.action)
+        self.write_pull_request_tuple(record.payload.pull_request, record.payload.action, record)
 
-    def write_pull_request_event(self, line: bytes, generic_event: GenericEvent):
+    def write_pull_request_event(self, record: PullRequestEvent):
         """
         Write a pull request event to the CSV file.
-        :param line: line from JSON file
-        :param generic_event: generic event
+        :param record: decoded event
         :return: None
         """
-        record = msgspec.json.decode(line, type=PullRequestEvent)
-        self.writer.writers['archive'].writerow(self.generic_event_tuple(generic_event, record.payload.pull_request.id))
+        self.writer.writers['archive'].writerow(self.generic_event_tuple(record, record.payload.pull_request.id))
         pr = record.payload.pull_request
-        self.write_pull_request_tuple(pr, record.payload.action)
+        self.write_pull_request_tuple(pr, record.payload.action, record)
 
-    def write_issue_comment_event(self, line: bytes, generic_event: GenericEvent):
+    def write_issue_comment_event(self, record: IssueCommentEvent):
         """
         Write an issue comment event to the CSV file.
-        :param line: line from JSON file
-        :param generic_event: generic event
+        :param record: decoded event
         :return: None
         """
-        record = orjson.loads(line)
-        c = record['payload']['comment']
-        comment_id = c['id']
-        issue_id = record['payload']['issue']['id']
+        c = record.payload.comment
+        comment_id = c.id
+        issue_id = record.payload.issue.id
 
-        self.writer.writers['archive'].writerow(self.generic_event_tuple(generic_event, comment_id))
+        self.writer.writers['archive'].writerow(self.generic_event_tuple(record, comment_id))
         if issue_id not in self.added_issues:
             self.added_issues.add(issue_id)
             self.writer.writers['issue'].writerow(self.issue_event_tuple(record))
-        app = c['performed_via_github_app']['slug'] if 'performed_via_github_app' in c and c['performed_via_github_app'] else None
-        self.writer.writers['issuecomment'].writerow((comment_id, issue_id, c['user']['type'], c['user']['site_admin'],
-                                            c['created_at'], c['updated_at'], c.get('author_association'), c['body'], *self.reactions(c), app))
+        app = c.performed_via_github_app.slug if c.performed_via_github_app else None
+        self.writer.writers['issuecomment'].writerow((comment_id, issue_id, c.user.type, c.user.site_admin,
+                                            c.created_at, c.updated_at, c.author_association, c.body, *self.reactions(c), app,
+                                            *self.event_time(record)))
 
     def issue_event_tuple(self, record):
         """
         Return a tuple of values for an issue event.
-        :param record: JSON record
+        :param record: decoded issues or issue comment event
         :return: tuple of values
         """
-        i = record['payload']['issue']
-        assignee = i.get('assignee')['id'] if i['assignee'] else None
-        milestone = i['milestone']['id'] if i['milestone'] else None
-        app = i['performed_via_github_app']['slug'] if 'performed_via_github_app' in i and i['performed_via_github_app'] else None
-        assignees_ids = [a['id'] for a in i['assignees']] if 'assignees' in i else None
-        labels_names = [l['name'] for l in i['labels']] if 'labels' in i else None
-        return (record['payload']['action'], i['id'], i['number'], i['title'],
-                i['user']['login'], i['user']['id'], i['user']['type'],
-                i['user']['site_admin'], labels_names, i['state'], i['locked'], assignee, assignees_ids,
-                milestone, i['comments'], i['created_at'], i['updated_at'], i['closed_at'],
-                i.get('author_association'), i.get('active_lock_reason'), i.get('draft'), i.get('pull_request'), i['body'],
-                *self.reactions(i), app, i.get('state_reason'))
-
-    def write_issues_event(self, line: bytes, generic_event: GenericEvent):
+        i = record.payload.issue
+        assignee = i.assignee.id if i.assignee else None
+        milestone = i.milestone.id if i.milestone else None
+        app = i.performed_via_github_app.slug if i.performed_via_github_app else None
+        assignees_ids = [a.id for a in i.assignees] if i.assignees is not None else None
+        labels_names = [l.name for l in i.labels] if i.labels is not None else None
+        return (record.payload.action, i.id, i.number, i.title,
+                i.user.login, i.user.id, i.user.type,
+                i.user.site_admin, labels_names, i.state, i.locked, assignee, assignees_ids,
+                milestone, i.comments, i.created_at, i.updated_at, i.closed_at,
+                i.author_association, i.active_lock_reason, i.draft, i.pull_request, i.body,
+                *self.reactions(i), app, i.state_reason, *self.event_time(record))
+
+    def write_issues_event(self, record: IssuesEvent):
         """
         Write an issues event to the CSV file.
-        :param line: line from JSON file
-        :param generic_event: generic event
+        :param record: decoded event
         :return: None
         """
-        record = orjson.loads(line)
-        issue_id = record['payload']['issue']['id']
-        self.writer.writers['archive'].writerow(self.generic_event_tuple(generic_event, issue_id))
+        issue_id = record.payload.issue.id
+        self.writer.writers['archive'].writerow(self.generic_event_tuple(record, issue_id))
         if issue_id not in self.added_issues:
             self.added_issues.add(issue_id)
             self.writer.writers['issue'].writerow(self.issue_event_tuple(record))
 
-    def write_create_event(self, line: bytes, generic_event: GenericEvent):
+    def write_create_event(self, record: CreateEvent):
         """
         Write a create event to the CSV file.
-        :param line: line from JSON file
-        :param generic_event: generic event
+        :param record: decoded event
         :return: None
         """
-        record = msgspec.json.decode(line, type=CreateEvent)
-        self.writer.writers['archive'].writerow(self.generic_event_tuple(generic_event))
+        self.writer.writers['archive'].writerow(self.generic_event_tuple(record))
         ref = record.payload.ref[:127] if record.payload.ref else None
-        self.writer.writers['createevent'].writerow((generic_event.id, ref, record.payload.ref_type,
+        self.writer.writers['createevent'].writerow((record.id, ref, record.payload.ref_type,
                                            record.payload.master_branch[:127], record.payload.description,
                                            record.payload.pusher_type))
 
-    def write_fork_event(self, line: bytes, generic_event: GenericEvent):
+    def write_fork_event(self, record: ForkEvent):
         """
         Write a fork event to the CSV file.
-        :param line: line from JSON file
-        :param generic_event: generic event
+        :param record: decoded event
         :return: None
         """
-        record = msgspec.json.decode(line, type=ForkEvent)
         f = record.payload.forkee
         license_key = f.license.key if f.license else None
         license_name = f.license.name if f.license else None
         license_spdx_id = f.license.spdx_id if f.license else None
-        self.writer.writers['archive'].writerow(self.generic_event_tuple(generic_event, f.id))
+        self.writer.writers['archive'].writerow(self.generic_event_tuple(record, f.id))
         self.writer.writers['forkevent'].writerow((f.id, f.name[:255], f.private, f.owner.id, f.owner.login[:255],
                                          f.owner.type, f.owner.site_admin, f.description, f.fork,
                                          f.created_at,
@@ -252,96 +277,85 @@ class JSONToCSVConverter:
                                          f.default_branch[:255], f.public, license_key,
                                          license_name, license_spdx_id))
 
-    def write_member_event(self, line: bytes, generic_event: GenericEvent):
+    def write_member_event(self, record: MemberEvent):
         """
         Write a member event to the CSV file.
-        :param line: line from JSON file
-        :param generic_event: generic event
+        :param record: decoded event
         :return: None
         """
-        record = msgspec.json.decode(line, type=MemberEvent)
-        self.writer.writers['archive'].writerow(self.generic_event_tuple(generic_event))
-        self.writer.writers['memberevent'].writerow((generic_event.id, record.payload.member.id,
+        self.writer.writers['archive'].writerow(self.generic_event_tuple(record))
+        self.writer.writers['memberevent'].writerow((record.id, record.payload.member.id,
                                            record.payload.member.login[:255],
                                            record.payload.member.type, record.payload.member.site_admin,
                                            record.payload.action))
 
-    def write_gollum_event(self, line: bytes, generic_event: GenericEvent):
+    def write_gollum_event(self, record: GollumEvent):
         """
         Write a gollum event to the CSV file.
-        :param line: line from JSON file
-        :param generic_event: generic event
+        :param record: decoded event
         :return: None
         """
-        record = msgspec.json.decode(line, type=GollumEvent)
-        self.writer.writers['archive'].writerow(self.generic_event_tuple(generic_event))
+        self.writer.writers['archive'].writerow(self.generic_event_tuple(record))
         for page in record.payload.pages:
             self.writer.writers['gollumevent'].writerow(
-                (generic_event.id, page.page_name[:255], page.title[:255], page.summary, page.action, page.sha))
+                (record.id, page.page_name[:255], page.title[:255], page.summary, page.action, page.sha))
 
-    def write_delete_event(self, line: bytes, generic_event: GenericEvent):
+    def write_delete_event(self, record: DeleteEvent):
         """
         Write a delete event to the CSV file.
-        :param line: line from JSON file
-        :param generic_event: generic event
+        :param record: decoded event
         :return: None
         """
-        record = msgspec.json.decode(line, type=DeleteEvent)
-        self.writer.writers['archive'].writerow(self.generic_event_tuple(generic_event))
-        self.writer.writers['deleteevent'].writerow((generic_event.id, record.payload.ref[:255], record.payload.ref_type,
+        self.writer.writers['archive'].writerow(self.generic_event_tuple(record))
+        self.writer.writers['deleteevent'].writerow((record.id, record.payload.ref[:255], record.payload.ref_type,
                                            record.payload.pusher_type))
 
-    def write_release_event(self, line: bytes, generic_event: GenericEvent):
+    def write_release_event(self, record: ReleaseEvent):
         """
         Write a release event to the CSV file.
-        :param line: line from JSON file
-        :param generic_event: generic event
+        :param record: decoded event
         :return: None
         """
-        record = msgspec.json.decode(line, type=ReleaseEvent)
         release = record.payload.release
-        self.writer.writers['archive'].writerow(self.generic_event_tuple(generic_event, release.id))
+        self.writer.writers['archive'].writerow(self.generic_event_tuple(record, release.id))
         self.writer.writers['releaseevent'].writerow((release.id, release.tag_name[:255],
                                             release.target_commitish[:255], release.name[:255] if release.name else None, release.draft, release.prerelease,
                                             release.created_at, release.published_at, release.body))
 
-    def write_push_event(self, record: PushEvent, generic_event: GenericEvent):
+    def write_push_event(self, record: PushEvent):
         """
         Write a push event to the CSV file.
-        :param record: line from JSON file
-        :param generic_event: generic event
+        :param record: decoded event
         :return: None
         """
-        self.writer.writers['archive'].writerow(self.generic_event_tuple(generic_event, record.payload.push_id))
+        self.writer.writers['archive'].writerow(self.generic_event_tuple(record, record.payload.push_id))
         self.writer.writers['pushevent'].writerow((record.payload.push_id, record.payload.size,
                                          record.payload.distinct_size, record.payload.ref[:255],
                                          record.payload.head, record.payload.before))
         for commit in record.payload.commits:
             self.writer.writers['commit'].writerow((commit.sha, record.payload.push_id,
                                           commit.author.email[:127], commit.author.name[:127], commit.message,
-                                          commit.distinct))
+                                          commit.distinct, *self.event_time(record)))
 
-    def write_commit_comment_event(self, line: bytes, generic_event: GenericEvent):
+    def write_commit_comment_event(self, record: CommitCommentEvent):
         """
         Write a commit comment event to the CSV file.
-        :param line: line from JSON file
-        :param generic_event: generic event
+        :param record: decoded event
         :return: None
         """
-        record = msgspec.json.decode(line, type=CommitCommentEvent)
         c = record.payload.comment
         path = c.path[:255] if c.path else None
-        self.writer.writers['archive'].writerow(self.generic_event_tuple(generic_event, c.id))
+        self.writer.writers['archive'].writerow(self.generic_event_tuple(record, c.id))
         self.writer.writers['commitcommentevent'].writerow((c.id, c.position, c.line,
                                                   path, c.commit_id, c.author_association, c.body))
 
-    def write_generic_event(self, generic_event: GenericEvent):
+    def write_generic_event(self, record: Event):
         """
         Write a generic event to the CSV file.
-        :param generic_event: generic event
+        :param record: decoded event
         :return: None
         """
-        self.writer.writers['archive'].writerow(self.generic_event_tuple(generic_event))
+        self.writer.writers['archive'].writerow(self.generic_event_tuple(record))
 
     def reactions(self, record):
         """
@@ -349,13 +363,21 @@ class JSONToCSVConverter:
         :param record: record to get reactions from
         :return: tuple of reactions
         """
-        reactions = record.get('reactions')
+        reactions = record.reactions
         if reactions:
-            return reactions['total_count'], reactions['+1'], reactions['-1'], reactions['laugh'], reactions['hooray'],\
-                   reactions['confused'], reactions['heart'], reactions['rocket'], reactions['eyes']
+            return reactions.total_count, reactions.plus_one, reactions.minus_one, reactions.laugh, reactions.hooray,\
+                   reactions.confused, reactions.heart, reactions.rocket, reactions.eyes
         return None, None, None, None, None, None, None, None, None
 
-    def generic_event_tuple(self, record: GenericEvent, payload_id=None) -> tuple:
+    def event_time(self, record: Event) -> tuple:
+        """
+        Get the partition key appended to the rows of the tables partitioned by event time.
+        :param record: record the row is written for
+        :return: tuple holding the time of the event if the tables are partitioned, empty tuple otherwise
+        """
+        return (record.created_at,) if self.partitioned else ()
+
+    def generic_event_tuple(self, record: Event, payload_id=None) -> tuple:
         """
         Get a tuple of generic event data.
         :param record: record to get data from
@@ -370,10 +392,34 @@ class JSONToCSVConverter:
 
     def reset_added_sets(self):
         """
-        Reset the added sets.
+        Reset the added sets. Persistent stores are bounded and keep their ids.
+        :return: None
+        """
+        for store in self.dedup_stores:
+            store.reset()
+
+    def forget_hour(self, date):
+        """
+        Remove the persisted ids of an hour, before the hour is converted again.
+        :param date: date of the hour
+        :return: None
+        """
+        for store in self.dedup_stores:
+            store.forget(date)
+
+    def abort_hour(self):
+        """
+        Drop the ids added while converting an hour that failed, so that they are not persisted with the next hour.
+        :return: None
+        """
+        for store in self.dedup_stores:
+            store.rollback()
+
+    def commit_hour(self, date):
+        """
+        Persist the ids added while converting an hour.
+        :param date: date of the hour
         :return: None
         """
-        self.added_ids = set()
-        self.added_pushes = set()
-        self.added_issues = set()
-        self.added_prs = set()
+        for store in self.dedup_stores:
+            store.commit(date)
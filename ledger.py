@@ -0,0 +1,89 @@
+import threading
+import psycopg2
+from table_schemas import SQL_PATH
+
+
+class Ledger:
+    """
+    Class to record the stages each hour has completed in the `ingest_ledger` table, so that an interrupted run skips
+    the hours that are done and redoes only the partial ones. The tables loaded for an hour are recorded by
+    DatabaseLink in the same transaction as their COPY.
+    """
+    def __init__(self, username, password, database, host, port):
+        self.conn = psycopg2.connect(database=database, user=username,
+            password=password, host=host, port=port)
+        self.conn.autocommit = True
+        # the ledger is shared by the threads of the manager
+        self.lock = threading.Lock()
+        with open(f'{SQL_PATH}/create_ledger.sql', 'r') as f:
+            self.__execute(f.read())
+
+    def is_done(self, hour, stage):
+        """
+        Check whether an hour has completed a stage.
+        :param hour: date of the hour
+        :param stage: 'downloaded', 'converted' or 'loaded'
+        :return: True if the stage is completed
+        """
+        return self.__execute("SELECT 1 FROM ingest_ledger WHERE hour = %s AND stage = %s AND table_name = ''",
+                              (hour, stage), fetch=True) is not None
+
+    def mark(self, hour, stage, rows=None):
+        """
+        Record that an hour has completed a stage.
+        :param hour: date of the hour
+        :param stage: 'downloaded' or 'converted'
+        :param rows: number of bytes downloaded or events converted
+        :return: None
+        """
+        self.__execute("INSERT INTO ingest_ledger (hour, stage, rows) VALUES (%s, %s, %s) "
+                       "ON CONFLICT (hour, stage, table_name) DO UPDATE SET rows = EXCLUDED.rows, updated_at = now()",
+                       (hour, stage, rows))
+
+    def mark_loaded(self, hour):
+        """
+        Record that all tables of an hour are loaded, with the total number of rows loaded.
+        :param hour: date of the hour
+        :return: None
+        """
+        self.__execute("INSERT INTO ingest_ledger (hour, stage, rows) "
+                       "SELECT %s, 'loaded', coalesce(sum(rows), 0) FROM ingest_ledger WHERE hour = %s AND stage = 'table' "
+                       "ON CONFLICT (hour, stage, table_name) DO UPDATE SET rows = EXCLUDED.rows, updated_at = now()",
+                       (hour, hour))
+
+    def clear(self, hour, stage):
+        """
+        Remove the record of a stage, before the stage is redone for an hour.
+        :param hour: date of the hour
+        :param stage: 'downloaded', 'converted', 'loaded', or 'table' for the records of all tables loaded
+        :return: None
+        """
+        self.__execute("DELETE FROM ingest_ledger WHERE hour = %s AND stage = %s", (hour, stage))
+
+    def __execute(self, query, params=None, fetch=False):
+        with self.lock, self.conn.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchone() if fetch else None
+
+    def close(self):
+        self.conn.close()
+
+
+class NullLedger:
+    """
+    Ledger that records nothing, for runs that do not use the database. No hour is skipped when resuming.
+    """
+    def is_done(self, hour, stage):
+        return False
+
+    def mark(self, hour, stage, rows=None):
+        pass
+
+    def mark_loaded(self, hour):
+        pass
+
+    def clear(self, hour, stage):
+        pass
+
+    def close(self):
+        pass
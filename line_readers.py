@@ -0,0 +1,65 @@
+import io
+import gzip
+import zlib
+
+
+def reversed_lines(f, block_size=1 << 20):
+    """
+    Iterate over the lines of a binary file from the last to the first line while holding only a bounded part of the
+    file in memory. Plain files are read backwards in blocks. Streams that cannot be read backwards cheaply, like
+    gzip files or http responses, are read forwards once and kept in memory as compressed blocks, which are then
+    decompressed one at a time in reverse order.
+    :param f: binary file object
+    :param block_size: number of bytes read at a time
+    :return: iterator of lines, without the trailing newline
+    """
+    if isinstance(f, gzip.GzipFile) or not f.seekable():
+        return _reversed_lines_spooled(f, block_size)
+    return _reversed_lines_seekable(f, block_size)
+
+
+def _reversed_lines_seekable(f, block_size):
+    """
+    Read a seekable file backwards in blocks and yield its lines in reverse order.
+    :param f: seekable binary file object
+    :param block_size: number of bytes read at a time
+    :return: iterator of lines
+    """
+    position = f.seek(0, io.SEEK_END)
+    tail = b''
+    while position > 0:
+        size = min(block_size, position)
+        position -= size
+        f.seek(position)
+        lines = (f.read(size) + tail).split(b'\n')
+        # the first piece may be the end of a line that starts in the previous block
+        tail = lines[0]
+        for line in reversed(lines[1:]):
+            if line:
+                yield line
+    if tail:
+        yield tail
+
+
+def _reversed_lines_spooled(f, block_size):
+    """
+    Read a stream forwards, keep it as zlib compressed blocks of whole lines and yield its lines in reverse order.
+    :param f: binary file object
+    :param block_size: number of bytes read at a time
+    :return: iterator of lines
+    """
+    blocks = []
+    tail = b''
+    while block := f.read(block_size):
+        block = tail + block
+        end = block.rfind(b'\n') + 1
+        tail = block[end:]
+        if end:
+            blocks.append(zlib.compress(block[:end], 1))
+    if tail:
+        yield tail
+    while blocks:
+        lines = zlib.decompress(blocks.pop()).split(b'\n')
+        for line in reversed(lines):
+            if line:
+                yield line
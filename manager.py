@@ -1,12 +1,26 @@
-import requests
 import os
 import logging
+import requests
+import urllib3
+import gzip
+import shutil
 import datetime
-from queue import Queue  
-from zipfile import ZipFile
+import threading
+from collections import Counter
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from json_to_csv_converter import JSONToCSVConverter
 from csv_writers import CSVWriters
+from binary_writers import BinaryCopyWriters
 from database_link import DatabaseLink
+from downloader import Downloader
+from parallel_converter import ParallelConverter
+from dedup_stores import create_dedup_stores
+from ledger import Ledger, NullLedger
+from parquet_writers import ParquetWriters
+from scheduler import DiskBudgetScheduler
+from metrics import Metrics, MeteredQueue
+from profiler import HourProfiler
 
 
 class Manager:
@@ -14,7 +28,10 @@ class Manager:
     Class to manage the download, decompression, and writing of data.
     """
     def __init__(self, start_year, start_month, start_day, end_year, end_month, end_day, data_path, sed_name,
-        database_username, database_password, database_name, database_host, database_port):
+        database_username, database_password, database_name, database_host, database_port, download_workers=4,
+        stream=False, low_memory=False, conversion_workers=1, load_mode='stdin', output_format='csv',
+        dedup_store='memory', resume=True, disk_budget=None, loader_threads=1, partitioned=False,
+        index_loaded_months=False, index_workers=4, maintenance_work_mem='1GB', event_filter=None, profile=False):
 
         self.start_year = start_year
         self.start_month = start_month
@@ -23,11 +40,75 @@ class Manager:
         self.end_month = end_month
         self.end_day = end_day
         self.dates_to_download = self.__dates_to_download()
-        self.downloaded_queue = Queue(maxsize=30)
-        self.decompressed_queue = Queue(maxsize=30)
-        self.written_queue = Queue(maxsize=2)
+        # with a disk budget, the scheduler admits hours based on the space used in the data path instead of the sizes
+        # of the queues
+        self.scheduler = DiskBudgetScheduler(data_path, disk_budget, download_workers) if disk_budget else None
+        # counters and timers of the stages, see `metrics.py`
+        self.metrics = Metrics()
+        self.downloaded_queue = MeteredQueue(self.metrics, 'downloaded', maxsize=0 if self.scheduler else 30)
+        self.decompressed_queue = MeteredQueue(self.metrics, 'decompressed', maxsize=0 if self.scheduler else 30)
+        self.written_queue = MeteredQueue(self.metrics, 'written', maxsize=2)
         self.data_path = data_path
         self.sed_name = sed_name
+        self.downloader = Downloader(data_path, workers=download_workers)
+        # in streaming mode the `.json.gz` files are decompressed on the fly by the csv writing stage
+        self.stream = stream
+        self.low_memory = low_memory
+        if profile and conversion_workers > 1:
+            logging.warning('Profiling converts the hours in a single process')
+            conversion_workers = 1
+        self.conversion_workers = conversion_workers
+        # how the csv data is loaded: 'stdin' streams the csv files with COPY FROM STDIN, 'memory' streams in-memory
+        # buffers so no csv files are written, 'server' lets the server read the files, 'pandas' inserts via pandas
+        if load_mode == 'memory' and conversion_workers > 1:
+            logging.warning('In-memory loading is not possible with several conversion workers, using csv files')
+            load_mode = 'stdin'
+        if dedup_store == 'database' and output_format == 'parquet':
+            logging.warning('Duplicates can only be removed by the database when loading into it, using python sets')
+            dedup_store = 'memory'
+        if dedup_store == 'database' and partitioned:
+            # the unique indices of partitioned tables include the event time, so duplicate issues, pull requests and
+            # pushes of different events would not be removed
+            logging.warning('Duplicates cannot be removed by partitioned tables, using python sets')
+            dedup_store = 'memory'
+        if dedup_store == 'database' and load_mode == 'pandas':
+            logging.warning('Duplicates can only be removed by the database with COPY, using csv files')
+            load_mode = 'stdin'
+        if output_format == 'binary' and load_mode not in ('stdin', 'memory'):
+            logging.warning('Binary COPY files can only be loaded from stdin, using csv files')
+            output_format = 'csv'
+        self.load_mode = load_mode
+        # number of tables of an hour loaded concurrently
+        self.loader_threads = loader_threads
+        # the large tables are partitioned by month of the event time
+        self.partitioned = partitioned
+        # index the partitions of each month once all its hours are loaded
+        if index_loaded_months and not partitioned:
+            logging.warning('Only partitioned tables can be indexed by month, indices are not created while loading')
+            index_loaded_months = False
+        self.index_loaded_months = index_loaded_months
+        # hours of each month that have not left the pipeline yet; a month is indexed once all its hours are loaded,
+        # skipped or failed, whatever order the stages finish them in
+        self.pending_hours = Counter(date[:7] for date in self.__dates_to_download())
+        self.loaded_months = set()
+        self.indexed_months = set()
+        self.months_lock = threading.Lock()
+        self.index_workers = index_workers
+        self.maintenance_work_mem = maintenance_work_mem
+        # the binary COPY format is loaded without parsing text on the database server, Parquet files are written
+        # for analyses without the database
+        self.writer_class = {'binary': BinaryCopyWriters, 'parquet': ParquetWriters}.get(output_format, CSVWriters)
+        self.use_database = self.writer_class.copy_format is not None
+        # 'memory', 'array' or 'sqlite', see `dedup_stores.py`, or 'database' to copy the hours into staging tables
+        # and merge them into the tables without duplicates
+        self.dedup_store = dedup_store
+        self.merge = dedup_store == 'database'
+        # in-memory tables of the converted dates that are not yet loaded
+        self.buffered_writers = {}
+        # EventFilter selecting the events to convert, None to convert all events
+        self.event_filter = event_filter
+        # writes a profile of the conversion and the loading of each hour to the data path
+        self.profiler = HourProfiler(data_path) if profile else None
 
         self.DATABASE_USERNAME = database_username
         self.DATABASE_PASSWORD = database_password
@@ -35,56 +116,122 @@ class Manager:
         self.DATABASE_HOST = database_host
         self.DATABASE_PORT = database_port
 
+        # records the completed stages of each hour; with `resume`, hours that are done are skipped
+        self.ledger = Ledger(username=database_username, password=database_password, database=database_name,
+                             host=database_host, port=database_port) if self.use_database else NullLedger()
+        self.resume = resume
 
     def run_serie(self):
 
         with DatabaseLink(username=self.DATABASE_USERNAME, password=self.DATABASE_PASSWORD,
             database=self.DATABASE_NAME, host=self.DATABASE_HOST, port=self.DATABASE_PORT,
-            sed_name=self.sed_name, data_path=self.data_path) as db:
-            db.create_tables()
+            sed_name=self.sed_name, data_path=self.data_path, pool_size=self.loader_threads,
+            partitioned=self.partitioned, merge=self.merge, metrics=self.metrics) if self.use_database \
+                else nullcontext() as db:
+            if db:
+                db.create_tables()
+                self.create_partitions(db)
             
-            converter = JSONToCSVConverter(writer=None)
+            converter = JSONToCSVConverter(writer=None, low_memory=self.low_memory,
+                                           dedup_stores=create_dedup_stores(self.dedup_store, self.data_path),
+                                           partitioned=self.partitioned, event_filter=self.event_filter)
             while date := next(self.dates_to_download, None):
+                if self.resume and self.ledger.is_done(date, 'loaded'):
+                    logging.info(f'Skipping {date}, already loaded')
+                    continue
 
                 # --------------------------------------------------------------------------
                 # download and descompress
                 # --------------------------------------------------------------------------
-                self.download_json(date)
-                self.decompress_json(date)
+                if not self.stream:
+                    if not (self.download_json(date) and self.decompress_json(date)):
+                        continue
                 # --------------------------------------------------------------------------
 
                 # --------------------------------------------------------------------------
                 # convert to csv
                 # --------------------------------------------------------------------------
-                converter.writer = CSVWriters(date, self.data_path)
+                converter.writer = self.writer_class(date, self.data_path, in_memory=self.load_mode == 'memory',
+                                                     partitioned=self.partitioned)
                 # at the first of the month, reset sets to not use too much memory
                 if date[-5:] == '01-23':
                     converter.reset_added_sets()
                 
-                file_name = f'{self.data_path}/{date}.json'
                 logging.info(f'Writing csv for {date}')
-                with open(file_name, 'rb') as f:
-                    converter.write_events(f)
-                self.remove_json(date)
+                self.ledger.clear(date, 'converted')
+                converter.forget_hour(date)
+                # in streaming mode, the hour is read straight from the http response
+                try:
+                    with (self.downloader.stream(date) if self.stream else self.open_events(date)) as f, \
+                            self.metrics.timer('ghelephant_stage_seconds_total', stage='convert'), \
+                            self.profiled(date, 'convert', converter):
+                        converter.write_events(f)
+                except (requests.RequestException, urllib3.exceptions.HTTPError, OSError, EOFError) as e:
+                    # a truncated hour is neither loaded nor marked as converted, so that the next run redoes it
+                    logging.error(f'Error reading {date}, leaving it pending: {e!r}')
+                    converter.abort_hour()
+                    converter.writer.close()
+                    continue
+                self.record_conversion(converter.events_by_type)
+                converter.commit_hour(date)
+                self.ledger.mark(date, 'converted', converter.events_written)
+                if not self.stream:
+                    self.remove_json(date)
                 converter.writer.close()
                 # --------------------------------------------------------------------------
                 
                 # --------------------------------------------------------------------------
                 # 
                 # --------------------------------------------------------------------------
-                db.insert_csvs_into_db(date, use_pandas=True)
-                self.remove_inserted_csvs(date)
+                if db:
+                    self.insert_into_db(db, date, converter.writer)
                 # --------------------------------------------------------------------------
+            logging.info(self.metrics.summary())
+
+
 
+    def create_tables(self):
+        """
+        Create the tables and the partitions of the date range, if the data is loaded into the database. Called
+        before the pipeline threads are started, so that a database that cannot be loaded into stops the run.
+        :return: None
+        """
+        if self.use_database:
+            with DatabaseLink(username=self.DATABASE_USERNAME, password=self.DATABASE_PASSWORD,
+                database=self.DATABASE_NAME, host=self.DATABASE_HOST, port=self.DATABASE_PORT,
+                sed_name=self.sed_name, data_path=self.data_path, partitioned=self.partitioned,
+                merge=self.merge) as db:
+                db.create_tables()
+                self.create_partitions(db)
 
+    def create_partitions(self, db):
+        """
+        Create the partitions of the months of the date range before the hours are loaded, if the tables are
+        partitioned.
+        :param db: DatabaseLink
+        :return: None
+        """
+        if self.partitioned:
+            db.ensure_range_partitions(self.start_year, self.start_month, self.end_year, self.end_month)
 
     def run_download(self):
         """
-        Run the download process. Blocks when queue is empty/full.
+        Run the download process with a pool of download workers. Blocks when queue is empty/full.
         :return: None
         """
-        while date := next(self.dates_to_download, None):
-            self.download_json(date)
+        admit = self.scheduler.admit_download if self.scheduler else None
+        for date, downloaded in self.downloader.download_all(self.__dates_to_fetch(), admit=admit):
+            if self.scheduler:
+                self.scheduler.downloaded(date, downloaded)
+            if downloaded:
+                size = os.path.getsize(f'{self.data_path}/{date}.json.gz')
+                self.metrics.add('ghelephant_hours_total', stage='downloaded')
+                self.metrics.add('ghelephant_downloaded_bytes_total', size)
+                self.ledger.mark(date, 'downloaded', size)
+                self.downloaded_queue.put(date)
+            else:
+                self.hour_finished(date)
+        self.downloader.close()
         self.downloaded_queue.put(None)
 
     def run_decompress(self):
@@ -93,80 +240,292 @@ class Manager:
         :return: None
         """
         while date := self.downloaded_queue.get():
-            self.decompress_json(date)
+            if self.scheduler:
+                self.scheduler.admit_decompression(date)
+            decompressed = self.decompress_json(date)
+            if self.scheduler:
+                self.scheduler.decompressed(date, decompressed)
+            if decompressed:
+                self.decompressed_queue.put(date)
+            else:
+                self.hour_finished(date)
         self.decompressed_queue.put(None)
 
     def run_write_csvs(self):
         """
-        Run the csv writing process. Blocks when queue is empty/full.
+        Run the csv writing process, converting several hours in parallel if more than one conversion worker is
+        configured. Blocks when queue is empty/full.
         :return: None
         """
-        with DatabaseLink(username=self.DATABASE_USERNAME, password=self.DATABASE_PASSWORD,
-            database=self.DATABASE_NAME, host=self.DATABASE_HOST, port=self.DATABASE_PORT,
-            sed_name=self.sed_name, data_path=self.data_path) as db:
-            db.create_tables()
+        try:
+            # without the decompression stage, the downloaded files are read directly
+            queue = self.downloaded_queue if self.stream else self.decompressed_queue
+            if self.conversion_workers > 1:
+                self.__write_csvs_parallel(queue)
+            else:
+                self.__write_csvs(queue)
+        finally:
+            # the loading stage stops at the end of the queue, even if the conversion failed
+            self.written_queue.put(None)
+
+    def __write_csvs_parallel(self, queue):
+        """
+        Convert the hours of a queue with a ParallelConverter and pass them on to the loading stage.
+        :param queue: queue of dates
+        :return: None
+        """
+        converter = ParallelConverter(self.data_path, self.conversion_workers, stream=self.stream,
+                                      low_memory=self.low_memory, writer_class=self.writer_class,
+                                      dedup_store=self.dedup_store, partitioned=self.partitioned,
+                                      event_filter=self.event_filter)
+        for date, events_written in converter.convert_all(self.__dates_to_convert(queue)):
+            if events_written is None:
+                self.discard_hour(date)
+                continue
+            self.record_conversion(converter.events_by_type)
+            self.ledger.mark(date, 'converted', events_written)
+            if self.scheduler:
+                self.scheduler.converted(date)
+            self.written_queue.put(date)
 
-        converter = JSONToCSVConverter(writer=None)
-        while date := self.decompressed_queue.get():
-            converter.writer = CSVWriters(date, self.data_path)
+    def __write_csvs(self, queue):
+        """
+        Convert the hours of a queue one after the other and pass them on to the loading stage.
+        :param queue: queue of dates
+        :return: None
+        """
+        converter = JSONToCSVConverter(writer=None, low_memory=self.low_memory,
+                                       dedup_stores=create_dedup_stores(self.dedup_store, self.data_path),
+                                       partitioned=self.partitioned, event_filter=self.event_filter)
+        while date := queue.get():
+            if self.scheduler:
+                self.scheduler.converting(date)
+            converter.writer = self.writer_class(date, self.data_path, in_memory=self.load_mode == 'memory',
+                                                 partitioned=self.partitioned)
             # at the first of the month, reset sets to not use too much memory
             if date[-5:] == '01-23':
                 converter.reset_added_sets()
-            file_name = f'{self.data_path}/{date}.json'
             logging.info(f'Writing csv for {date}')
-            with open(file_name, 'rb') as f:
-                converter.write_events(f)
+            self.ledger.clear(date, 'converted')
+            converter.forget_hour(date)
+            try:
+                with self.open_events(date) as f, \
+                        self.metrics.timer('ghelephant_stage_seconds_total', stage='convert'), \
+                        self.profiled(date, 'convert', converter):
+                    converter.write_events(f)
+            except (OSError, EOFError) as e:
+                # a truncated hour is neither loaded nor marked as converted, so that the next run redoes it
+                logging.error(f'Error reading {date}, leaving it pending: {e!r}')
+                converter.abort_hour()
+                converter.writer.close()
+                self.discard_hour(date)
+                continue
+            self.record_conversion(converter.events_by_type)
+            converter.commit_hour(date)
+            self.ledger.mark(date, 'converted', converter.events_written)
             self.remove_json(date)
             converter.writer.close()
+            if converter.writer.in_memory:
+                self.buffered_writers[date] = converter.writer
+            if self.scheduler:
+                self.scheduler.converted(date)
             self.written_queue.put(date)
 
-        self.written_queue.put(None)      
-
     def run_copy_into_database(self):
         """
         Run the copy into database process. Blocks when queue is empty/full.
         :return: None
         """
-        while date := self.written_queue.get():
-            logging.info(f'Copying {date} into database')
-            with DatabaseLink(username=self.DATABASE_USERNAME, password=self.DATABASE_PASSWORD,
-                database=self.DATABASE_NAME, host=self.DATABASE_HOST, port=self.DATABASE_PORT,
-                data_path=self.data_path, sed_name=self.sed_name) as db:
-                db.insert_csvs_into_db(date, use_pandas=True)
+        if not self.use_database:
+            # the written files are the output
+            while date := self.written_queue.get():
+                logging.info(f'Finished writing {date}')
+                if self.scheduler:
+                    self.scheduler.finish(date)
+            logging.info(self.metrics.summary())
+            return
+        # the months are indexed in the background while the next ones are loaded
+        indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='monthIndexer') \
+            if self.index_loaded_months else None
+        # the connections are reused for all hours
+        with DatabaseLink(username=self.DATABASE_USERNAME, password=self.DATABASE_PASSWORD,
+            database=self.DATABASE_NAME, host=self.DATABASE_HOST, port=self.DATABASE_PORT,
+            data_path=self.data_path, sed_name=self.sed_name, pool_size=self.loader_threads,
+            partitioned=self.partitioned, merge=self.merge, metrics=self.metrics) as db:
+            while date := self.written_queue.get():
+                logging.info(f'Copying {date} into database')
+                self.insert_into_db(db, date, self.buffered_writers.pop(date, None))
+                if self.scheduler:
+                    self.scheduler.finish(date)
+                with self.months_lock:
+                    self.loaded_months.add(date[:7])
+                self.hour_finished(date)
+                if indexer:
+                    for month in self.completed_months():
+                        self.index_month(indexer, db, month)
+            if indexer:
+                # the months some of whose hours failed are indexed at the end
+                for month in self.completed_months(all_months=True):
+                    self.index_month(indexer, db, month)
+                indexer.shutdown()
+        logging.info(self.metrics.summary())
+
+    def record_conversion(self, events_by_type):
+        """
+        Record a converted hour in the metrics.
+        :param events_by_type: number of events written by event type
+        :return: None
+        """
+        self.metrics.add('ghelephant_hours_total', stage='converted')
+        for event_type, events in events_by_type.items():
+            self.metrics.add('ghelephant_events_total', events, type=event_type)
+
+    def profiled(self, date, stage, converter=None):
+        """
+        Profile a stage of an hour if profiling is enabled, see `HourProfiler.profile`.
+        :param date: date of the hour
+        :param stage: name of the stage
+        :param converter: JSONToCSVConverter whose event handlers are timed by event type
+        :return: context manager
+        """
+        return self.profiler.profile(date, stage, converter) if self.profiler else nullcontext()
+
+    def hour_finished(self, date):
+        """
+        Record that an hour left the pipeline, loaded, skipped or failed.
+        :param date: date of the hour
+        :return: None
+        """
+        with self.months_lock:
+            self.pending_hours[date[:7]] -= 1
+
+    def completed_months(self, all_months=False):
+        """
+        Take the months with loaded hours that are not indexed yet and have no hour left in the pipeline.
+        :param all_months: take all months with loaded hours that are not indexed yet
+        :return: sorted list of months in the format "YYYY-MM"
+        """
+        with self.months_lock:
+            months = sorted(month for month in self.loaded_months - self.indexed_months
+                            if all_months or self.pending_hours[month] <= 0)
+            self.indexed_months.update(months)
+        return months
+
+    def index_month(self, indexer, db, month):
+        """
+        Build the indices of the partitions of a month in the background.
+        :param indexer: executor running the index builds
+        :param db: DatabaseLink of the database
+        :param month: month in the format "YYYY-MM"
+        :return: None
+        """
+        logging.info(f'Indexing {month}')
+        indexer.submit(db.create_indices, {(int(month[:4]), int(month[5:7]))}, self.index_workers,
+                       self.maintenance_work_mem)
+
+    def insert_into_db(self, db, date, writer=None):
+        """
+        Insert the converted data of the given date into the database with the configured load mode and remove the
+        csv files afterwards.
+        :param db: DatabaseLink to insert with
+        :param date: date to insert
+        :param writer: CSVWriters or BinaryCopyWriters holding the tables in memory, if any
+        :return: None
+        """
+        in_memory = writer is not None and writer.in_memory
+        if not self.resume:
+            # the tables recorded as loaded by an earlier run are loaded again
+            self.ledger.clear(date, 'loaded')
+            self.ledger.clear(date, 'table')
+        with self.metrics.timer('ghelephant_stage_seconds_total', stage='load'), self.profiled(date, 'load'):
+            loaded = db.insert_csvs_into_db(date, use_pandas=self.load_mode == 'pandas',
+                                            use_stdin=self.load_mode in ('stdin', 'memory'),
+                                            writer=writer if in_memory else None,
+                                            binary=self.writer_class.copy_format == 'binary', use_ledger=True)
+        if loaded:
+            self.metrics.add('ghelephant_hours_total', stage='loaded')
+            self.ledger.mark_loaded(date)
+        if not in_memory:
             self.remove_inserted_csvs(date)
 
     def download_json(self, date_to_download):
         """
         Download the json file for the given date.
         :param date_to_download: date to download
-        :return: None
+        :return: True if the file is available, False otherwise
         """
         path = f'{self.data_path}/{date_to_download}'
         if os.path.isfile(f'{path}.json'):
-            return
-        logging.info(f'Downloading {date_to_download}')
-        response = requests.get(f'https://data.gharchive.org/{date_to_download}.json.gz')
-        if response.status_code != 200:
-            logging.error(f'Error downloading {date_to_download}')
-            return
-        with open(f'{path}.json.gz', 'wb') as f:
-            f.write(response.content)
-        self.downloaded_queue.put(date_to_download)
+            return True
+        return self.downloader.download(date_to_download)
 
     def decompress_json(self, date_to_download):
         """
         Decompress the json file for the given date.
         :param date_to_download: date to decompress
-        :return: None
+        :return: True if the file is available, False otherwise
         """
         path = f'{self.data_path}/{date_to_download}'
         if os.path.isfile(f'{path}.json'):
-            return
+            return True
         logging.info(f'Decompressing {date_to_download}')
         # os.system(f'gunzip {path}.json.gz')
-        with ZipFile(path, 'r') as zf:
-            zf.extract()
-        self.decompressed_queue.put(date_to_download)
+        try:
+            with gzip.open(f'{path}.json.gz', 'rb') as f_in, open(f'{path}.json.part', 'wb') as f_out, \
+                    self.metrics.timer('ghelephant_stage_seconds_total', stage='decompress'):
+                shutil.copyfileobj(f_in, f_out, 1 << 20)
+        except (OSError, EOFError):
+            logging.error(f'Error decompressing {date_to_download}')
+            return False
+        os.replace(f'{path}.json.part', f'{path}.json')
+        os.remove(f'{path}.json.gz')
+        self.metrics.add('ghelephant_hours_total', stage='decompressed')
+        return True
+
+    def open_events(self, date):
+        """
+        Open the events of the given date for reading. In streaming mode, the `.json.gz` file is decompressed
+        incrementally while it is read.
+        :param date: date to open
+        :return: binary file object
+        """
+        path = f'{self.data_path}/{date}'
+        if self.stream:
+            return gzip.open(f'{path}.json.gz', 'rb')
+        return open(f'{path}.json', 'rb')
+
+    def __dates_to_fetch(self):
+        """
+        Iterate over the dates that still need to be downloaded. Dates whose decompressed file is already present are
+        passed on to the next stage directly. When resuming, dates the ledger records as loaded are skipped, and
+        converted dates whose files are still present are passed on to the loading stage.
+        :return: iterator of dates to fetch
+        """
+        for date in self.dates_to_download:
+            if self.resume and self.ledger.is_done(date, 'loaded'):
+                logging.info(f'Skipping {date}, already loaded')
+                self.hour_finished(date)
+            elif self.resume and self.ledger.is_done(date, 'converted') and all(
+                    os.path.isfile(self.writer_class.file_path(self.data_path, fn, date))
+                    for fn in self.writer_class.file_names):
+                logging.info(f'Skipping conversion of {date}, already converted')
+                self.written_queue.put(date)
+            elif not self.stream and os.path.isfile(f'{self.data_path}/{date}.json'):
+                self.downloaded_queue.put(date)
+            else:
+                yield date
+
+    def __dates_to_convert(self, queue):
+        """
+        Iterate over the dates to convert from a queue until the end of the queue, clearing their conversion records.
+        :param queue: queue of dates
+        :return: iterator of dates
+        """
+        while date := queue.get():
+            self.ledger.clear(date, 'converted')
+            if self.scheduler:
+                self.scheduler.converting(date)
+            yield date
 
     def __dates_to_download(self):
         """
@@ -191,7 +550,23 @@ class Manager:
         :return: None
         """
         path = f'{self.data_path}/{date_to_download}'
-        os.remove(f'{path}.json')
+        os.remove(f'{path}.json.gz' if self.stream else f'{path}.json')
+
+    def discard_hour(self, date):
+        """
+        Remove the input file and the partial output files of an hour whose conversion failed, so that the next run
+        downloads and converts it again.
+        :param date: date of the hour
+        :return: None
+        """
+        paths = [f'{self.data_path}/{date}.json.gz', f'{self.data_path}/{date}.json']
+        paths += [self.writer_class.file_path(self.data_path, fn, date) for fn in self.writer_class.file_names]
+        for path in paths:
+            if os.path.isfile(path):
+                os.remove(path)
+        if self.scheduler:
+            self.scheduler.finish(date)
+        self.hour_finished(date)
 
     def remove_inserted_csvs(self, day):
         """
@@ -200,5 +575,5 @@ class Manager:
         :return: None
         """
         # os.system(f'rm {self.data_path}/*-{day}.csv')
-        for fn in CSVWriters.file_names:
-            os.remove(f'{self.data_path}/{fn}-{day}.csv')
+        for fn in self.writer_class.file_names:
+            os.remove(self.writer_class.file_path(self.data_path, fn, day))
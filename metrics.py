@@ -0,0 +1,182 @@
+import time
+import logging
+import threading
+from queue import Queue
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# metric name -> (type, help text), in the order they are exported
+METRICS = {
+    'ghelephant_hours_total': ('counter', 'Hours that finished a stage of the pipeline.'),
+    'ghelephant_downloaded_bytes_total': ('counter', 'Bytes of the downloaded .json.gz files.'),
+    'ghelephant_stage_seconds_total': ('counter', 'Time spent working in a stage of the pipeline.'),
+    'ghelephant_events_total': ('counter', 'Events written, by event type.'),
+    'ghelephant_rows_loaded_total': ('counter', 'Rows loaded into the database, by table.'),
+    'ghelephant_copy_seconds_total': ('counter', 'Time spent copying into the database, by table.'),
+    'ghelephant_queue_blocked_seconds_total': ('counter', 'Time a stage waited to get from or put into a queue.'),
+    'ghelephant_queue_depth': ('gauge', 'Hours waiting in a queue between two stages.'),
+}
+
+
+class Metrics:
+    """
+    Thread-safe counters of the pipeline, labelled like Prometheus metrics, and gauges read when they are exported.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # metric name -> tuple of (label, value) pairs -> value
+        self.counters = defaultdict(lambda: defaultdict(float))
+        self.gauges = {}
+        self.started = time.monotonic()
+
+    def add(self, name, value=1, **labels):
+        """
+        Add to a counter.
+        :param name: metric name
+        :param value: value added
+        :param labels: labels of the counter
+        :return: None
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.counters[name][key] += value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Add the time spent in the block to a counter of seconds.
+        :param name: metric name
+        :param labels: labels of the counter
+        :return: None
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, **labels)
+
+    def gauge(self, name, function, **labels):
+        """
+        Register a gauge.
+        :param name: metric name
+        :param function: function returning the value of the gauge
+        :param labels: labels of the gauge
+        :return: None
+        """
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = function
+
+    def value(self, name, **labels):
+        """
+        Get the value of a counter, summed over the labels not given.
+        :param name: metric name
+        :param labels: labels the counters have to match
+        :return: value
+        """
+        with self.lock:
+            return sum(value for key, value in self.counters[name].items() if set(labels.items()) <= set(key))
+
+    def render(self):
+        """
+        Export the metrics in the Prometheus text format.
+        :return: text of the metrics
+        """
+        with self.lock:
+            samples = [(name, key, value) for name, values in self.counters.items() for key, value in values.items()]
+            gauges = list(self.gauges.items())
+        samples += [(name, key, function()) for (name, key), function in gauges]
+        lines = []
+        for name, (metric_type, text) in METRICS.items():
+            lines += [f'# HELP {name} {text}', f'# TYPE {name} {metric_type}']
+            for sample_name, key, value in sorted(samples, key=lambda sample: sample[:2]):
+                if sample_name == name:
+                    labels = ','.join(f'{label}="{label_value}"' for label, label_value in key)
+                    lines.append(f'{name}{{{labels}}} {value:g}' if labels else f'{name} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """
+        Summarize the progress of the pipeline in a line: the hours through each stage, the throughput, the depths
+        of the queues and how long each queue kept its stages waiting. The stage that rarely waits is the bottleneck.
+        :return: summary line
+        """
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        hours = ', '.join(f'{stage} {self.value("ghelephant_hours_total", stage=stage):.0f}'
+                          for stage in ('downloaded', 'decompressed', 'converted', 'loaded'))
+        events = self.value('ghelephant_events_total')
+        rows = self.value('ghelephant_rows_loaded_total')
+        with self.lock:
+            queues = {dict(key)['queue']: function for (name, key), function in self.gauges.items()
+                      if name == 'ghelephant_queue_depth'}
+        waits = ', '.join(f'{queue} {depth():.0f} '
+                          f'(get {self.value("ghelephant_queue_blocked_seconds_total", queue=queue, op="get"):.0f}s, '
+                          f'put {self.value("ghelephant_queue_blocked_seconds_total", queue=queue, op="put"):.0f}s)'
+                          for queue, depth in sorted(queues.items()))
+        return (f'Hours {hours}; {self.value("ghelephant_downloaded_bytes_total") / 1e9:.2f} GB downloaded, '
+                f'{events / elapsed:.0f} events/s, {rows / elapsed:.0f} rows/s; queues {waits or "none"}')
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Serve the metrics at `http://<host>:<port>/metrics` from a background thread.
+        :param port: port to listen on
+        :param host: address to listen on
+        :return: the server
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='metricsServer', daemon=True).start()
+        logging.info(f'Serving metrics at http://{host}:{server.server_port}/metrics')
+        return server
+
+    def report(self, interval):
+        """
+        Log the summary line periodically from a background thread.
+        :param interval: seconds between two summaries
+        :return: None
+        """
+        def run():
+            while True:
+                time.sleep(interval)
+                logging.info(self.summary())
+        threading.Thread(target=run, name='metricsReporter', daemon=True).start()
+
+
+class MeteredQueue(Queue):
+    """
+    Queue that measures how long its producers and consumers wait on it and exports its depth.
+    """
+    def __init__(self, metrics, name, maxsize=0):
+        """
+        :param metrics: Metrics to record into
+        :param name: name of the queue in the metrics
+        :param maxsize: maximum number of items, 0 for no limit
+        """
+        super().__init__(maxsize)
+        self.metrics = metrics
+        self.name = name
+        metrics.gauge('ghelephant_queue_depth', self.qsize, queue=name)
+
+    def get(self, block=True, timeout=None):
+        with self.metrics.timer('ghelephant_queue_blocked_seconds_total', queue=self.name, op='get'):
+            return super().get(block, timeout)
+
+    def put(self, item, block=True, timeout=None):
+        with self.metrics.timer('ghelephant_queue_blocked_seconds_total', queue=self.name, op='put'):
+            super().put(item, block, timeout)
@@ -0,0 +1,182 @@
+import os
+import gzip
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from json_to_csv_converter import JSONToCSVConverter
+from csv_writers import CSVWriters
+from dedup_stores import create_dedup_stores
+
+# rows written for an event besides its archive row: event type -> (table, key column, key taken from the event
+# id or from the payload id of the archive row)
+CHILD_ROWS = {
+    'PushEvent': [('pushevent', 0, 'payload'), ('commit', 1, 'payload')],
+    'CommitCommentEvent': [('commitcommentevent', 0, 'payload')],
+    'ReleaseEvent': [('releaseevent', 0, 'payload')],
+    'DeleteEvent': [('deleteevent', 0, 'id')],
+    'GollumEvent': [('gollumevent', 0, 'id')],
+    'MemberEvent': [('memberevent', 0, 'id')],
+    'ForkEvent': [('forkevent', 0, 'payload')],
+    'CreateEvent': [('createevent', 0, 'id')],
+    'IssueCommentEvent': [('issuecomment', 0, 'payload')],
+    'PullRequestReviewEvent': [('pullrequestreview', 0, 'payload')],
+    'PullRequestReviewCommentEvent': [('pullrequestreviewcomment', 0, 'payload')],
+}
+
+
+def convert_hour(date, data_path, stream, low_memory, writer_class=CSVWriters, partitioned=False, event_filter=None):
+    """
+    Convert the events of one hour to csv files, with duplicates removed within the hour. Runs in a worker process.
+    :param date: date to convert
+    :param data_path: directory of the json and csv files
+    :param stream: whether the `.json.gz` file is read instead of the decompressed `.json` file
+    :param low_memory: whether the file is read backwards in blocks
+    :param writer_class: class of the writers of the output files
+    :param partitioned: write the rows for the partitioned schema
+    :param event_filter: EventFilter selecting the events to write, None to write all events
+    :return: the ids of the events, pushes, issues and pull requests that were written, and the number of events
+    written by event type
+    """
+    path = f'{data_path}/{date}.json.gz' if stream else f'{data_path}/{date}.json'
+    converter = JSONToCSVConverter(writer=writer_class(date, data_path, partitioned=partitioned),
+                                   low_memory=low_memory, partitioned=partitioned, event_filter=event_filter)
+    logging.info(f'Writing csv for {date}')
+    try:
+        with (gzip.open(path, 'rb') if stream else open(path, 'rb')) as f:
+            converter.write_events(f)
+    finally:
+        converter.writer.close()
+    os.remove(path)
+    return *(store.keys for store in converter.dedup_stores), converter.events_by_type
+
+
+class ParallelConverter:
+    """
+    Converts several hours in parallel with a pool of processes. Each worker removes duplicates within its hour; the
+    results are then merged in the order of the input so that an event, push, issue or pull request already written
+    for an earlier hour in the input is removed from the later ones, as it would be by a single converter.
+    """
+    def __init__(self, data_path, workers, stream=False, low_memory=False, writer_class=CSVWriters,
+                 dedup_store='memory', partitioned=False, event_filter=None):
+        """
+        :param data_path: directory of the json and csv files
+        :param workers: number of worker processes
+        :param stream: whether the workers read the `.json.gz` files directly
+        :param low_memory: whether the workers read the files backwards in blocks
+        :param writer_class: class of the writers of the output files, CSVWriters or BinaryCopyWriters
+        :param dedup_store: kind of store for the ids written so far, see `create_dedup_stores`
+        :param partitioned: whether the workers write the rows for the partitioned schema
+        :param event_filter: EventFilter selecting the events the workers write, None to write all events
+        """
+        self.data_path = data_path
+        self.workers = workers
+        self.stream = stream
+        self.low_memory = low_memory
+        self.writer_class = writer_class
+        self.partitioned = partitioned
+        self.event_filter = event_filter
+        # number of events of the last hour returned by `convert_all` by event type, counted before the duplicates
+        # of earlier hours are removed
+        self.events_by_type = {}
+        self.dedup_stores = create_dedup_stores(dedup_store, data_path)
+        self.added_ids, self.added_pushes, self.added_issues, self.added_prs = self.dedup_stores
+
+    def convert_all(self, dates):
+        """
+        Convert the given dates. At most twice as many hours as there are workers are converted at a time.
+        :param dates: iterable of dates to convert
+        :return: iterator of (date, number of events written) tuples, in the order of the input, with None as the
+        number of events for hours whose file could not be read
+        """
+        in_flight = deque()
+        # workers are spawned, forking a process that runs other threads is not safe
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            for date in dates:
+                in_flight.append((date, executor.submit(convert_hour, date, self.data_path, self.stream,
+                                                        self.low_memory, self.writer_class, self.partitioned,
+                                                        self.event_filter)))
+                if len(in_flight) >= 2 * self.workers:
+                    yield self.__merge(*in_flight.popleft())
+            while in_flight:
+                yield self.__merge(*in_flight.popleft())
+
+    def __merge(self, date, future):
+        """
+        Merge the ids written for an hour into the ids of the previous hours and remove the rows of duplicates.
+        :param date: date of the hour
+        :param future: future holding the result of `convert_hour`
+        :return: the date and the number of events written for it, None if its file could not be read
+        """
+        try:
+            ids, pushes, issues, prs, events_by_type = future.result()
+        except (OSError, EOFError) as e:
+            # the ids of a truncated hour are not merged, so that they do not hide the events of other hours
+            logging.error(f'Error reading {date}, leaving it pending: {e!r}')
+            return date, None
+        self.events_by_type = events_by_type
+        # at the first of the month, reset sets to not use too much memory
+        if date[-5:] == '01-23':
+            self.reset_added_sets()
+        for store in self.dedup_stores:
+            store.forget(date)
+        duplicate_ids = self.added_ids.intersection(ids)
+        duplicate_pushes = self.added_pushes.intersection(pushes)
+        duplicate_issues = self.added_issues.intersection(issues)
+        duplicate_prs = self.added_prs.intersection(prs)
+        if duplicate_ids or duplicate_pushes or duplicate_issues or duplicate_prs:
+            logging.info(f'Removing {len(duplicate_ids)} duplicate events from {date}')
+            self.__remove_duplicates(date, duplicate_ids, duplicate_pushes, duplicate_issues, duplicate_prs)
+        self.added_ids.update(ids - duplicate_ids)
+        self.added_pushes.update(pushes - duplicate_pushes)
+        self.added_issues.update(issues - duplicate_issues)
+        self.added_prs.update(prs - duplicate_prs)
+        for store in self.dedup_stores:
+            store.commit(date)
+        return date, len(ids) - len(duplicate_ids)
+
+    def __remove_duplicates(self, date, ids, pushes, issues, prs):
+        """
+        Remove the rows of duplicate events, pushes, issues and pull requests from the csv files of an hour.
+        :param date: date of the hour
+        :param ids: duplicate event ids
+        :param pushes: duplicate push ids
+        :param issues: duplicate issue ids
+        :param prs: duplicate pull request ids
+        :return: None
+        """
+        pushes = {str(p) for p in pushes}
+        # table -> (key column, keys of the rows to remove)
+        to_remove = {'issue': (1, {str(i) for i in issues}), 'pullrequest': (0, {str(p) for p in prs}),
+                     'pushevent': (0, set(pushes)), 'commit': (1, set(pushes))}
+
+        def is_duplicate(row):
+            event_id, event_type, payload_id = row[0], row[1], row[6]
+            if event_id in ids or (event_type == 'PushEvent' and payload_id in pushes):
+                for table, column, key in CHILD_ROWS.get(event_type, []):
+                    to_remove.setdefault(table, (column, set()))[1].add(event_id if key == 'id' else payload_id)
+                return True
+            return False
+
+        self.__filter_rows(date, 'archive', is_duplicate)
+        for table, (column, keys) in to_remove.items():
+            if keys:
+                self.__filter_rows(date, table, lambda row: row[column] in keys)
+
+    def __filter_rows(self, date, table, is_duplicate):
+        """
+        Rewrite the file of a table without the rows matching `is_duplicate`.
+        :param date: date of the hour
+        :param table: table name
+        :param is_duplicate: function returning True for rows to remove
+        :return: None
+        """
+        self.writer_class.filter_rows(self.writer_class.file_path(self.data_path, table, date), table, is_duplicate)
+
+    def reset_added_sets(self):
+        """
+        Reset the added sets. Persistent stores are bounded and keep their ids.
+        :return: None
+        """
+        for store in self.dedup_stores:
+            store.reset()
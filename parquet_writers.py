@@ -0,0 +1,162 @@
+import os
+from datetime import datetime
+from csv_writers import CSVWriters
+from table_schemas import read_table_columns
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+def _to_timestamp(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    # like the database, a timestamp without time zone keeps the wall clock time and drops the offset
+    return value.replace(tzinfo=None)
+
+
+def _to_text(value):
+    # lists are written the way the csv files hold them
+    return value if isinstance(value, str) else str(value)
+
+
+# PostgreSQL type -> (Arrow type, function converting a value of the row tuples)
+ARROW_TYPES = {'bigint': ('int64', int), 'int': ('int32', int), 'boolean': ('bool_', bool),
+               'timestamp': (('timestamp', 'us'), _to_timestamp)}
+
+
+def _arrow_type(name):
+    if isinstance(name, tuple):
+        return getattr(pa, name[0])(*name[1:])
+    return getattr(pa, name)()
+
+
+class ParquetTableWriter:
+    """
+    Writes the rows of one table to a Parquet file. The rows are buffered and written as a row group whenever the
+    buffer is full, so the memory used stays bounded.
+    """
+    def __init__(self, path, columns, row_group_size):
+        """
+        :param path: path of the Parquet file
+        :param columns: list of (column name, PostgreSQL type) tuples of the table
+        :param row_group_size: number of rows buffered before they are written as a row group
+        """
+        self.path = path
+        self.row_group_size = row_group_size
+        self.schema = pa.schema([(name, _arrow_type(ARROW_TYPES.get(column_type, ('string', None))[0]))
+                                 for name, column_type in columns])
+        self.converters = [ARROW_TYPES.get(column_type, (None, _to_text))[1] for _, column_type in columns]
+        self.rows = []
+        self.writer = None
+
+    def writerow(self, row):
+        """
+        Write a row.
+        :param row: tuple of values, one per column
+        :return: None
+        """
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def writerows(self, rows):
+        """
+        Write several rows.
+        :param rows: iterable of rows
+        :return: None
+        """
+        for row in rows:
+            self.writerow(row)
+
+    def flush(self):
+        """
+        Write the buffered rows as a record batch.
+        :return: None
+        """
+        if self.writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.writer = pq.ParquetWriter(f'{self.path}.part', self.schema, compression='zstd')
+        columns = zip(*self.rows) if self.rows else [()] * len(self.schema)
+        arrays = [pa.array([None if value is None else convert(value) for value in column], type=field.type)
+                  for column, convert, field in zip(columns, self.converters, self.schema)]
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        """
+        Write the remaining rows and close the file. The file only appears under its name once it is complete.
+        :return: None
+        """
+        if self.rows or self.writer is None:
+            self.flush()
+        self.writer.close()
+        os.replace(f'{self.path}.part', self.path)
+
+
+class ParquetWriters:
+    """
+    Class to manage Parquet writers, an alternative to CSVWriters for analyses that do not need the database. The
+    tables are written to `<data path>/parquet/<table>/date=<YYYY-MM-DD>/<table>-<hour>.parquet`, partitioned by day
+    in the layout DuckDB, Polars and pyarrow read as a hive partitioned dataset, with one file per hour. The column
+    types are taken from `sql/create_tables.sql`. Requires pyarrow.
+    """
+    file_names = CSVWriters.file_names
+    file_extension = 'parquet'
+    # the files are not loaded into the database
+    copy_format = None
+    # number of rows of a table buffered before they are written as a row group
+    row_group_size = 64 * 1024
+
+    def __init__(self, date, data_path, in_memory=False, partitioned=False):
+        """
+        Create a Parquet writer for each table/file
+        :param date: date of the data to be written
+        :param in_memory: unused, the files are the output
+        :param partitioned: write the columns of `sql/create_partitioned_tables.sql`
+        """
+        if pa is None:
+            raise ImportError('Writing Parquet files requires pyarrow, install it with `pip3 install pyarrow`')
+        columns = read_table_columns('create_partitioned_tables.sql' if partitioned else 'create_tables.sql')
+        self.date = date
+        self.in_memory = False
+        self.writers = {name: ParquetTableWriter(ParquetWriters.file_path(data_path, name, date), columns[name],
+                                                 ParquetWriters.row_group_size)
+                        for name in ParquetWriters.file_names}
+
+    @staticmethod
+    def file_path(data_path, table, date):
+        """
+        Get the path of the file of a table.
+        :param data_path: directory of the files
+        :param table: table name
+        :param date: date of the hour
+        :return: path of the file
+        """
+        return f'{data_path}/parquet/{table}/date={date[:10]}/{table}-{date}.parquet'
+
+    def close(self):
+        """
+        Close all writers.
+        :return: None
+        """
+        for writer in self.writers.values():
+            writer.close()
+
+    @staticmethod
+    def filter_rows(path, table, is_duplicate):
+        """
+        Rewrite a Parquet file without the rows matching `is_duplicate`. The function gets the values of a row as
+        strings, like a csv reader would return them.
+        :param path: path of the file
+        :param table: table name
+        :param is_duplicate: function returning True for rows to remove
+        :return: None
+        """
+        data = pq.read_table(path)
+        keep = [not is_duplicate(['' if value is None else str(value) for value in row.values()])
+                for row in data.to_pylist()]
+        pq.write_table(data.filter(pa.array(keep, type=pa.bool_())), f'{path}.part', compression='zstd')
+        os.replace(f'{path}.part', path)
@@ -1,20 +1,33 @@
-import requests
-import json
 import os.path
-import time
+import asyncio
 import pycountry
 import pandas as pd
 from tqdm import tqdm
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut
 from git import Repo 
+from github_client import API_URL, GitHubClient, GitHubAPIError
+from http_cache import HTTPCache, NullHTTPCache
 
 class Processing:
     """
-    Additional commands for GH Elephant: process csv data and enrich it with additional data.
+    Additional commands for GH Elephant: process csv data and enrich it with additional data. The csv file is read in
+    chunks, the unique keys of the rows (logins, commits, locations) are resolved once, and the results are joined back
+    to the rows chunk by chunk.
     """
-    def __init__(self, filename, auth_token=None, repo_path=None):
-        self.headers = {'Authorization': 'Token ' + auth_token} if auth_token else None
+    def __init__(self, filename, auth_token=None, repo_path=None, api_url=API_URL, api_concurrency=16, cache_path=None,
+                 cache_ttl=24 * 3600, cache_size=512 * 1024 * 1024, use_graphql=True, chunksize=100000):
+        # one token or a list of tokens, the requests are spread over them
+        self.auth_tokens = [auth_token] if isinstance(auth_token, str) else list(auth_token or [])
+        self.api_url = api_url
+        self.api_concurrency = api_concurrency
+        # responses of the GitHub API are cached in a sqlite database, None to disable the cache
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.use_graphql = use_graphql
+        # rows of the csv file read at a time
+        self.chunksize = chunksize
         self.repo_path = repo_path if repo_path else '.'
         if not filename.endswith('.csv'):
             print('File must be a csv file.')
@@ -29,40 +42,23 @@ class Processing:
         Add commit details to a csv file.
         :return: None
         """
-        df = pd.read_csv(self.filename)
-        seen = dict()
-        if not ('repo_name' in df.columns and 'sha' in df.columns):
+        if not {'repo_name', 'sha'} <= self.__columns():
             print('File must have columns "repo_name" and "sha".')
             return
-        for index, d in tqdm(df.iterrows(), total=df.shape[0]):
-            repo = d['repo_name']
-            sha = d['sha']
-            if (repo, sha) not in seen:
-                print('Fetching commit details for', repo, sha)
-                seen[(repo, sha)] = self.fetch_commit_details(repo, sha)
-            df.at[index, 'commit details'] = seen[(repo, sha)]
-        df.to_csv(self.filename, index=False)
+        seen = self.fetch_commits_details(self.__unique_keys(['repo_name', 'sha']))
+        self.__join(['repo_name', 'sha'], pd.DataFrame({'commit details': pd.Series(seen, dtype=object)}))
 
     def add_user_details(self):
         """
         Add user details to a csv file.
         :return: None
         """
-        df = pd.read_csv(self.filename)
-        seen = dict()
-        if not ('actor_login' in df.columns):
+        if 'actor_login' not in self.__columns():
             print('File must have column "actor_login".')
             return
-        for index, d in tqdm(df.iterrows(), total=df.shape[0]):
-            actor = d['actor_login']
-            if actor not in seen:
-                seen[actor] = self.fetch_user_details(actor)
-            df.at[index, 'bio'] = seen[actor].get('bio', '')
-            df.at[index, 'location'] = seen[actor].get('location', '')
-            df.at[index, 'blog'] = seen[actor].get('blog', '')
-            df.at[index, 'company'] = seen[actor].get('company', '')      
-
-        df.to_csv(self.filename, index=False)
+        seen = self.fetch_users_details(self.__unique_keys(['actor_login']))
+        self.__join(['actor_login'], pd.DataFrame.from_dict(seen, orient='index',
+                                                            columns=['bio', 'location', 'blog', 'company']))
 
     def clone_repos(self):
         """
@@ -75,15 +71,62 @@ class Processing:
             print('Repo path must be a directory.')
             return
         
-        df = pd.read_csv(self.filename)
-        if not ('repo_name' in df.columns):
+        if 'repo_name' not in self.__columns():
             print('File must have column "repo_name".')
             return
-        seen = set()
-        for _, d in tqdm(df.iterrows(), total=df.shape[0]):
-            if d['repo_name'] not in seen:
-                seen.add(d['repo_name'])
-                self.clone_repo(d['repo_name'])
+        for repo_name in tqdm(self.__unique_keys(['repo_name'])):
+            self.clone_repo(repo_name)
+
+    def __columns(self):
+        """
+        Read the header of the csv file.
+        :return: set of the column names
+        """
+        return set(pd.read_csv(self.filename, nrows=0).columns)
+
+    def __read_chunks(self, columns=None):
+        """
+        Read the csv file in chunks of `chunksize` rows. All values are read as text, so that the columns that are not
+        enriched are written back unchanged.
+        :param columns: columns to read, None for all columns
+        :return: iterator of DataFrames
+        """
+        return pd.read_csv(self.filename, usecols=columns, dtype=str, keep_default_na=False, chunksize=self.chunksize)
+
+    def __unique_keys(self, columns):
+        """
+        Collect the unique keys of the csv file, reading only their columns. Rows with an empty key are skipped.
+        :param columns: columns of the key
+        :return: list of the keys, tuples for keys of several columns
+        """
+        keys = dict()
+        for chunk in self.__read_chunks(columns):
+            chunk = chunk[(chunk[columns] != '').all(axis=1)].drop_duplicates()
+            keys.update(dict.fromkeys(zip(*(chunk[column] for column in columns)) if len(columns) > 1
+                                      else chunk[columns[0]]))
+        return list(keys)
+
+    def __join(self, columns, values):
+        """
+        Join values to the rows of the csv file by key, chunk by chunk, writing the chunks to a temporary file that
+        replaces the csv file once complete. Columns that already exist are overwritten in place.
+        :param columns: columns of the key
+        :param values: DataFrame of the values to join, indexed by key
+        :return: None
+        """
+        path = f'{self.filename}.tmp'
+        try:
+            with open(path, 'w', newline='') as f:
+                for i, chunk in enumerate(tqdm(self.__read_chunks(), desc='Writing chunks')):
+                    keys = pd.MultiIndex.from_frame(chunk[columns]) if len(columns) > 1 else pd.Index(chunk[columns[0]])
+                    matched = values.reindex(keys)
+                    for column in values.columns:
+                        chunk[column] = matched[column].to_numpy()
+                    chunk.to_csv(f, header=i == 0, index=False)
+            os.replace(path, self.filename)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
 
     def clone_repo(self, repo_name):
         """
@@ -94,33 +137,33 @@ class Processing:
         # subprocess.run(['git', '-C', self.repo_path, 'clone', f'https://github.com/{repo_name}.git'])
         Repo.clone(f'https://github.com/{repo_name}.git', self.repo_path)
 
+    def fetch_users_details(self, usernames):
+        """
+        Fetch user details like bio, location, blog, company from GitHub API, sending the requests concurrently.
+        With a token, the users are queried in batches from the GraphQL API, which requires authentication.
+        :param usernames: usernames of the users to fetch details for.
+        :return: dict of the user details by username
+        """
+        if self.auth_tokens and self.use_graphql:
+            return self.__fetch_all(lambda client: client.fetch_users, usernames, 'Fetching user details', batched=True)
+        return self.__fetch_all(lambda client: client.fetch_user, usernames, 'Fetching user details')
+
     def fetch_user_details(self, username):
         """
         Fetch user details like bio, location, blog, company from GitHub API.
         :param username: username of the user to fetch details for.
         :return: user details
         """
-        url = f'https://api.github.com/users/{username}'
-        response = requests.get(url, headers=self.headers)
-        if response.status_code == 200:
-            user_details = response.json()
-        elif response.status_code == 403:
-            if int(response.headers['X-RateLimit-Remaining']) == 0:
-                # sleep until reset
-                target_timestamp = int(response.headers['X-RateLimit-Reset'])
-                current_timestamp = int(time.time())  # get the current Unix timestamp
-                seconds_to_sleep = target_timestamp - current_timestamp  # calculate the time difference
-                print(f'Rate limit of {response.headers["X-RateLimit-Limit"]} reached, sleeping until {target_timestamp + 1}')
-                if seconds_to_sleep > 0:
-                    time.sleep(seconds_to_sleep + 1)
-                return self.fetch_user_details(username)
-            else:
-                print(response.text)
-                exit(1)
-        else:
-            user_details = {'bio': '', 'location': '', 'blog': '', 'company': ''}
-        return user_details
-    
+        return self.fetch_users_details([username])[username]
+
+    def fetch_commits_details(self, commits):
+        """
+        Fetch commit details from GitHub API in JSON format, sending the requests concurrently.
+        :param commits: tuples of the repo name in the format "owner/repo" and the commit sha
+        :return: dict of the commit details in JSON format by (repo, sha)
+        """
+        return self.__fetch_all(lambda client: client.fetch_commit, commits, 'Fetching commit details')
+
     def fetch_commit_details(self, repo, sha):
         """
         Fetch commit details from GitHub API in JSON format.
@@ -128,36 +171,41 @@ class Processing:
         :param sha: the commit sha
         :return: commit details in JSON format
         """
-        url = f'https://api.github.com/repos/{repo}/commits/{sha}'
-        response = requests.get(url, headers=self.headers)
-        if response.status_code == 200 and 'files' in response.json():
-            commit_details = json.dumps(response.json()['files'])
-        elif response.status_code == 403:
-            if int(response.headers['X-RateLimit-Remaining']) == 0:
-                # sleep until reset
-                target_timestamp = int(response.headers['X-RateLimit-Reset'])
-                current_timestamp = int(time.time())  # get the current Unix timestamp
-                seconds_to_sleep = target_timestamp - current_timestamp  # calculate the time difference
-                print(f'Rate limit of {response.headers["X-RateLimit-Limit"]} reached, sleeping until {target_timestamp + 1}')
-                if seconds_to_sleep > 0:
-                    time.sleep(seconds_to_sleep + 1)
-                return self.fetch_commit_details(repo, sha)
-            else:
-                print(response.text)
-                exit(1)
-        else:
-            commit_details = f'Commit for not found.'
-
-        return commit_details
-    
+        return self.fetch_commits_details([(repo, sha)])[(repo, sha)]
+
+    def __fetch_all(self, fetch, keys, description, batched=False):
+        """
+        Fetch the values of keys with a GitHubClient.
+        :param fetch: function returning the coroutine function of the client fetching a key, or all keys if batched
+        :param keys: keys to fetch
+        :param description: description of the progress bar
+        :param batched: whether the coroutine function fetches all keys at once
+        :return: dict of the values by key
+        """
+        cache = HTTPCache(self.cache_path, ttl=self.cache_ttl, max_size=self.cache_size) if self.cache_path \
+            else NullHTTPCache()
+
+        async def run():
+            async with GitHubClient(tokens=self.auth_tokens, api_url=self.api_url, concurrency=self.api_concurrency,
+                                    cache=cache) as client:
+                if batched:
+                    return await fetch(client)(keys, description)
+                return await client.map(fetch(client), keys, description)
+        try:
+            return asyncio.run(run())
+        except GitHubAPIError as e:
+            print(e.text)
+            exit(1)
+        finally:
+            cache.close()
+
     def add_country_details(self):
         """
         Add country details to a csv file. This function uses the Nominatim API to get the country alpha_2 code from
         the location string.
         :return: None
         """
-        df = pd.read_csv(self.filename)
-        if not ('location' in df.columns):
+        if 'location' not in self.__columns():
             print('File must have column "location". Run with option --add-user-details first.')
             return
 
@@ -185,23 +233,9 @@ class Processing:
             except AttributeError:
                 return None
 
-        df['country_code_alpha3'] = None
-        df['country_code_alpha2'] = None
-        cache_alpha2 = {}
-        cache_alpha3 = {}
-        for index, row in tqdm(df.iterrows(), total=df.shape[0]):
-            if pd.notna(row['location']):
-                location = row['location']
-                if location not in cache_alpha2:
-                    cache_alpha2[location] = get_country_alpha2(location)
-                alpha2_code = cache_alpha2[location]
-
-                df.at[index, 'country_code_alpha2'] = alpha2_code
-                if alpha2_code:
-                    if alpha2_code not in cache_alpha3:
-                        cache_alpha3[alpha2_code] = alpha2_to_alpha3(alpha2_code)
-                    alpha3_code = cache_alpha3[alpha2_code]
-                    df.at[index, 'country_code_alpha3'] = alpha3_code
-
-        df.to_csv(self.filename, index=False)
-
+        countries = {}
+        for location in tqdm(self.__unique_keys(['location'])):
+            alpha2_code = get_country_alpha2(location)
+            countries[location] = (alpha2_to_alpha3(alpha2_code) if alpha2_code else None, alpha2_code)
+        self.__join(['location'], pd.DataFrame.from_dict(countries, orient='index',
+                                                         columns=['country_code_alpha3', 'country_code_alpha2']))
@@ -0,0 +1,97 @@
+import os
+import json
+import time
+import cProfile
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from json_to_csv_converter import JSONToCSVConverter
+
+# handlers of JSONToCSVConverter writing the rows of an event, timed by event type
+EVENT_HANDLERS = [name for name in vars(JSONToCSVConverter) if name.startswith('write_') and name.endswith('_event')]
+
+
+class HourProfiler:
+    """
+    Profiles the conversion and the loading of each hour with cProfile and writes the statistics to
+    `<data path>/profiles/<stage>-<hour>.prof`, to be read with `python3 -m pstats` or turned into a flame graph
+    with tools like snakeviz or flameprof. The event handlers of a converter are timed by event type as well, and the
+    shares of the conversion time are logged and written to `<data path>/profiles/convert-<hour>.json`.
+
+    cProfile only sees the thread it runs in: with several loader threads, the COPY calls of the pool are not in the
+    load profiles.
+    """
+    def __init__(self, data_path):
+        """
+        :param data_path: directory the `profiles` folder is created in
+        """
+        self.path = f'{data_path}/profiles'
+        os.makedirs(self.path, exist_ok=True)
+
+    @contextmanager
+    def profile(self, date, stage, converter=None):
+        """
+        Profile a stage of an hour.
+        :param date: date of the hour
+        :param stage: name of the stage, "convert" or "load"
+        :param converter: JSONToCSVConverter whose event handlers are timed by event type, None for other stages
+        :return: None
+        """
+        times = Counter()
+        if converter is not None:
+            for name in EVENT_HANDLERS:
+                setattr(converter, name, HourProfiler.__timed(getattr(converter, name), times))
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # only one profiler can be active at a time from Python 3.12 on
+            logging.warning(f'Another profiler is active, not profiling {stage} of {date}')
+            profile = None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(f'{self.path}/{stage}-{date}.prof')
+            if converter is not None:
+                for name in EVENT_HANDLERS:
+                    delattr(converter, name)
+                self.__report(date, elapsed, times, converter.events_by_type)
+
+    def __report(self, date, elapsed, times, events):
+        """
+        Log and write the shares of the conversion time spent in the handlers of each event type. The rest is spent
+        reading, decoding and deduplicating the events.
+        :param date: date of the hour
+        :param elapsed: seconds of the conversion
+        :param times: seconds spent in the handlers by event type
+        :param events: number of events written by event type
+        :return: None
+        """
+        elapsed = max(elapsed, 1e-9)
+        shares = ', '.join(f'{event_type} {seconds / elapsed:.1%}' for event_type, seconds in times.most_common())
+        logging.info(f'Conversion time of {date} ({elapsed:.1f}s): {shares}, '
+                     f'reading, decoding and deduplicating {1 - sum(times.values()) / elapsed:.1%}')
+        with open(f'{self.path}/convert-{date}.json', 'w') as f:
+            json.dump({'seconds': elapsed, 'event_types': {
+                event_type: {'events': events.get(event_type, 0), 'seconds': seconds, 'share': seconds / elapsed}
+                for event_type, seconds in times.most_common()}}, f, indent=2)
+
+    @staticmethod
+    def __timed(handler, times):
+        """
+        Wrap an event handler to add its time to the time of the type of the event it writes.
+        :param handler: bound handler of a converter
+        :param times: seconds by event type
+        :return: wrapped handler
+        """
+        def timed(record):
+            start = time.perf_counter()
+            try:
+                return handler(record)
+            finally:
+                times[record.type] += time.perf_counter() - start
+        return timed
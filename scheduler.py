@@ -0,0 +1,217 @@
+import os
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+
+class DiskBudgetScheduler:
+    """
+    Admits hours into the download and decompression stages based on a byte budget for the data path, measured from
+    the sizes of the files on disk, instead of fixed queue sizes. The files an admitted hour has yet to write are
+    reserved with an estimate taken from the hours seen so far.
+
+    The number of concurrent downloads follows Little's law: to keep the conversion stage busy, the downloads in
+    flight should be its throughput times the latency of a download. The throughput is measured from the rate at which
+    hours are converted, so while downloads are the bottleneck one more download is allowed each time, and once
+    the conversion stage is the bottleneck the concurrency settles at what it can absorb.
+    """
+    def __init__(self, data_path, budget, max_downloads, download_size=128 << 20, expansion=10.0, window=8,
+                 interval=0.5):
+        """
+        :param data_path: directory whose files count towards the budget
+        :param budget: maximum number of bytes of the files in the data path
+        :param max_downloads: upper bound of the number of concurrent downloads
+        :param download_size: estimated size of a `.json.gz` file until one has been downloaded, in bytes
+        :param expansion: estimated ratio of decompressed to compressed size until a file has been decompressed
+        :param window: number of recent conversions the throughput is measured over
+        :param interval: seconds between checks of the disk usage while an hour waits for admission
+        """
+        self.data_path = data_path
+        self.budget = budget
+        self.max_downloads = max_downloads
+        self.download_size = download_size
+        self.expansion = expansion
+        self.interval = interval
+        self.concurrency = max_downloads
+        # date -> stage, of the hours admitted and not yet finished
+        self.stages = {}
+        self.download_started = {}
+        self.compressed_sizes = {}
+        self.download_latency = None
+        self.conversions = deque(maxlen=window)
+        self.condition = threading.Condition()
+
+    def usage(self):
+        """
+        Get the number of bytes used by the files in the data path.
+        :return: number of bytes
+        """
+        used = 0
+        with os.scandir(self.data_path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        used += entry.stat(follow_symlinks=False).st_size
+                except FileNotFoundError:
+                    # removed by another stage while scanning
+                    pass
+        return used
+
+    def admit_download(self, date):
+        """
+        Admit an hour into the download stage if fewer downloads than the current concurrency are in flight and its
+        file fits into the budget. An hour is always admitted when no other hour is in the pipeline, so that a budget
+        smaller than a single file still makes progress.
+        :param date: date of the hour
+        :return: True if the hour is admitted, False if it has to wait
+        """
+        with self.condition:
+            downloading = sum(stage == 'downloading' for stage in self.stages.values())
+            if self.stages and (downloading >= self.concurrency
+                                or not self.__fits(self.download_size)):
+                return False
+            self.stages[date] = 'downloading'
+            self.download_started[date] = time.monotonic()
+            return True
+
+    def downloaded(self, date, success):
+        """
+        Record a finished download and update the estimates of the file size and of the download latency.
+        :param date: date of the hour
+        :param success: whether the file was downloaded
+        :return: None
+        """
+        with self.condition:
+            latency = time.monotonic() - self.download_started.pop(date, time.monotonic())
+            if not success:
+                self.__finish(date)
+                return
+            self.stages[date] = 'downloaded'
+            path = f'{self.data_path}/{date}.json.gz'
+            if os.path.isfile(path):
+                size = os.path.getsize(path)
+                self.compressed_sizes[date] = size
+                self.download_size = DiskBudgetScheduler.__average(self.download_size, size)
+                self.download_latency = DiskBudgetScheduler.__average(self.download_latency, latency)
+            self.condition.notify_all()
+
+    def admit_decompression(self, date):
+        """
+        Wait until the decompressed file of an hour fits into the budget. The hour is admitted regardless if no
+        decompressed hour is waiting for or in conversion or loading, as the space is then held by files that can only
+        be freed by letting it through.
+        :param date: date of the hour
+        :return: None
+        """
+        with self.condition:
+            size = self.compressed_sizes.get(date, self.download_size) * self.expansion
+            while not self.__fits(size) and any(stage in ('decompressed', 'converting')
+                                                for stage in self.stages.values()):
+                self.condition.wait(self.interval)
+            self.stages[date] = 'decompressing'
+
+    def decompressed(self, date, success):
+        """
+        Record a finished decompression and update the estimate of the expansion ratio.
+        :param date: date of the hour
+        :param success: whether the file was decompressed
+        :return: None
+        """
+        with self.condition:
+            if not success:
+                self.__finish(date)
+                return
+            self.stages[date] = 'decompressed'
+            path = f'{self.data_path}/{date}.json'
+            if date in self.compressed_sizes and os.path.isfile(path):
+                self.expansion = DiskBudgetScheduler.__average(
+                    self.expansion, os.path.getsize(path) / max(self.compressed_sizes[date], 1))
+            self.condition.notify_all()
+
+    def converting(self, date):
+        """
+        Record that the conversion stage took an hour.
+        :param date: date of the hour
+        :return: None
+        """
+        with self.condition:
+            if date in self.stages:
+                self.stages[date] = 'converting'
+
+    def converted(self, date):
+        """
+        Record a converted hour and adapt the number of concurrent downloads to the throughput of the conversion
+        stage.
+        :param date: date of the hour
+        :return: None
+        """
+        with self.condition:
+            self.conversions.append(time.monotonic())
+            if len(self.conversions) < 2 or self.download_latency is None:
+                return
+            elapsed = self.conversions[-1] - self.conversions[0]
+            throughput = (len(self.conversions) - 1) / elapsed if elapsed > 0 else math.inf
+            # one download more than the conversion stage absorbs, to detect when it can absorb more
+            concurrency = max(1, min(self.max_downloads, math.ceil(throughput * self.download_latency) + 1)) \
+                if throughput < math.inf else self.max_downloads
+            if concurrency != self.concurrency:
+                logging.info(f'Adjusting concurrent downloads from {self.concurrency} to {concurrency}')
+                self.concurrency = concurrency
+
+    def finish(self, date):
+        """
+        Record that an hour left the pipeline and its files were removed.
+        :param date: date of the hour
+        :return: None
+        """
+        with self.condition:
+            self.__finish(date)
+
+    def __finish(self, date):
+        self.stages.pop(date, None)
+        self.compressed_sizes.pop(date, None)
+        self.condition.notify_all()
+
+    def __fits(self, size):
+        """
+        Check whether a file of the given size fits into the budget, next to the files on disk and the remaining
+        sizes of the files being downloaded and decompressed.
+        :param size: size of the file, in bytes
+        :return: True if the file fits
+        """
+        return self.usage() + self.__reserved() + size <= self.budget
+
+    def __reserved(self):
+        """
+        Get the number of bytes the downloads and decompressions in flight have yet to write.
+        :return: number of bytes
+        """
+        reserved = 0
+        for date, stage in self.stages.items():
+            path = f'{self.data_path}/{date}'
+            if stage == 'downloading':
+                reserved += max(0, self.download_size - DiskBudgetScheduler.__size(f'{path}.json.gz.part'))
+            elif stage == 'decompressing':
+                expected = self.compressed_sizes.get(date, self.download_size) * self.expansion
+                reserved += max(0, expected - DiskBudgetScheduler.__size(f'{path}.json.part'))
+        return reserved
+
+    @staticmethod
+    def __size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def __average(average, value, weight=0.3):
+        """
+        Update an exponential moving average.
+        :param average: current average, None if there is none yet
+        :param value: new value
+        :param weight: weight of the new value
+        :return: updated average
+        """
+        return value if average is None else (1 - weight) * average + weight * value
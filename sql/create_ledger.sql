@@ -0,0 +1,12 @@
+-- records which hours went through which stage of the pipeline, so that an interrupted run can be resumed.
+-- unlogged like the data tables, so that both are emptied together if the database crashes.
+
+CREATE UNLOGGED TABLE IF NOT EXISTS ingest_ledger (
+    hour VARCHAR(16),
+    -- downloaded, converted, table (one row per loaded table) or loaded
+    stage VARCHAR(16),
+    table_name VARCHAR(63) DEFAULT '',
+    rows BIGINT,
+    updated_at TIMESTAMP DEFAULT now(),
+    PRIMARY KEY (hour, stage, table_name)
+) WITHOUT OIDS;
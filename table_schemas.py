@@ -0,0 +1,34 @@
+import os
+import re
+
+SQL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sql')
+
+
+def read_table_columns(file_name='create_tables.sql'):
+    """
+    Read the columns of the tables created by a schema file.
+    :param file_name: name of the schema file in the `sql` folder
+    :return: dict of table name -> list of (column name, column type) tuples, with types in lower case
+    """
+    with open(os.path.join(SQL_PATH, file_name), 'r') as f:
+        sql = re.sub(r'--[^\n]*', '', f.read())
+    tables = {}
+    for table, body in re.findall(r'CREATE (?:UNLOGGED )?TABLE IF NOT EXISTS (\w+) \((.*?)\)\s*(?:WITHOUT OIDS|PARTITION BY|;)',
+                                  sql, re.DOTALL):
+        columns = []
+        for definition in body.split(',\n'):
+            name, column_type = definition.split(None, 1)
+            columns.append((name, column_type.strip().lower()))
+        tables[table] = columns
+    return tables
+
+
+def read_partitioned_tables(file_name='create_partitioned_tables.sql'):
+    """
+    Read the tables a schema file partitions by range.
+    :param file_name: name of the schema file in the `sql` folder
+    :return: dict of table name -> partition key column
+    """
+    with open(os.path.join(SQL_PATH, file_name), 'r') as f:
+        sql = re.sub(r'--[^\n]*', '', f.read())
+    return dict(re.findall(r'CREATE TABLE IF NOT EXISTS (\w+) \(.*?\)\s*PARTITION BY RANGE \((\w+)\);', sql, re.DOTALL))
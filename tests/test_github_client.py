@@ -0,0 +1,163 @@
+import json
+import tempfile
+import time
+import unittest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from github_client import COMMIT_NOT_FOUND, USER_DETAILS, GitHubAPIError, GitHubClient
+from http_cache import HTTPCache
+
+USER = {'login': 'octocat', 'bio': 'bio', 'location': 'Bern', 'blog': 'https://github.blog', 'company': 'GitHub'}
+
+
+def rate_limit_headers(remaining):
+    return {'X-RateLimit-Limit': '5000', 'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset': str(int(time.time()) + 3600)}
+
+
+class TestGitHubClient(unittest.IsolatedAsyncioTestCase):
+    """
+    Runs the client against a local server answering with the responses of the GitHub API.
+    """
+    async def asyncSetUp(self):
+        # handler of each request, called with the request and the number of earlier requests to the same path
+        self.responses = {}
+        # (method, path, token) of each request
+        self.requests = []
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', self.handle)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.addAsyncCleanup(self.server.close)
+        self.api_url = str(self.server.make_url('')).rstrip('/')
+
+    async def handle(self, request):
+        token = request.headers.get('Authorization', '').removeprefix('Token ') or None
+        attempt = sum(1 for _, path, _ in self.requests if path == request.path)
+        self.requests.append((request.method, request.path, token))
+        return await self.responses.get(request.path, self.not_found)(request, attempt)
+
+    @staticmethod
+    async def not_found(request, attempt):
+        return web.json_response({'message': 'Not Found'}, status=404, headers=rate_limit_headers(4999))
+
+    def client(self, **kwargs):
+        return GitHubClient(api_url=self.api_url, backoff=0, **kwargs)
+
+    async def test_exhausted_token_is_rotated(self):
+        async def user(request, attempt):
+            if request.headers['Authorization'] == 'Token a':
+                return web.json_response({'message': 'API rate limit exceeded'}, status=403,
+                                         headers=rate_limit_headers(0))
+            return web.json_response(USER, headers=rate_limit_headers(4999))
+        self.responses['/users/octocat'] = user
+        async with self.client(tokens=['a', 'b']) as client:
+            details = await client.fetch_user('octocat')
+            self.assertEqual(details, {key: USER[key] for key in USER_DETAILS})
+            self.assertEqual([token for _, _, token in self.requests], ['a', 'b'])
+            self.assertEqual(client.pool.buckets[0].remaining, 0)
+            # the exhausted token is not used while the other one has requests left
+            await client.fetch_user('octocat')
+            self.assertEqual(self.requests[-1][2], 'b')
+
+    async def test_secondary_rate_limit_waits_for_retry_after(self):
+        async def user(request, attempt):
+            if attempt == 0:
+                return web.Response(status=403, text='You have exceeded a secondary rate limit',
+                                    headers={**rate_limit_headers(4999), 'Retry-After': '0'})
+            return web.json_response(USER, headers=rate_limit_headers(4998))
+        self.responses['/users/octocat'] = user
+        async with self.client(tokens=['a'], retries=0) as client:
+            # secondary rate limits do not count as failures, even without retries
+            self.assertEqual((await client.fetch_user('octocat'))['bio'], 'bio')
+        self.assertEqual(len(self.requests), 2)
+
+    async def test_server_errors_are_retried(self):
+        async def user(request, attempt):
+            if attempt < 2:
+                return web.Response(status=502, headers=rate_limit_headers(4999))
+            return web.json_response(USER, headers=rate_limit_headers(4999))
+        self.responses['/users/octocat'] = user
+        async with self.client(retries=2) as client:
+            self.assertEqual((await client.fetch_user('octocat'))['location'], 'Bern')
+        self.assertEqual(len(self.requests), 3)
+
+    async def test_error_is_raised_after_the_retries(self):
+        async def user(request, attempt):
+            return web.Response(status=502, headers=rate_limit_headers(4999))
+        self.responses['/users/octocat'] = user
+        async with self.client(retries=2) as client:
+            with self.assertRaises(GitHubAPIError) as raised:
+                await client.fetch_user('octocat')
+        self.assertEqual(raised.exception.status, 502)
+        self.assertEqual(len(self.requests), 3)
+
+    async def test_bad_credentials_raise(self):
+        async def user(request, attempt):
+            return web.json_response({'message': 'Bad credentials'}, status=401)
+        self.responses['/users/octocat'] = user
+        async with self.client(tokens=['a']) as client:
+            with self.assertRaises(GitHubAPIError):
+                await client.fetch_user('octocat')
+        self.assertEqual(len(self.requests), 1)
+
+    async def test_missing_user_and_commit(self):
+        async with self.client() as client:
+            self.assertEqual(await client.fetch_user('ghost'), USER_DETAILS)
+            self.assertEqual(await client.fetch_commit(('owner/repo', 'a' * 40)), COMMIT_NOT_FOUND)
+
+    async def test_stale_responses_are_revalidated(self):
+        async def user(request, attempt):
+            if request.headers.get('If-None-Match') == '"v1"':
+                return web.Response(status=304, headers=rate_limit_headers(4998))
+            return web.json_response(USER, headers={**rate_limit_headers(4999), 'ETag': '"v1"'})
+        self.responses['/users/octocat'] = user
+        with tempfile.TemporaryDirectory() as directory:
+            cache = HTTPCache(f'{directory}/cache.sqlite', ttl=0)
+            try:
+                async with self.client(tokens=['a'], cache=cache) as client:
+                    first = await client.fetch_user('octocat')
+                    second = await client.fetch_user('octocat')
+                    # the 304 response does not count against the rate limit
+                    self.assertEqual(client.pool.buckets[0].remaining, 4999)
+                self.assertEqual(first, second)
+                self.assertEqual((cache.misses, cache.revalidated), (1, 1))
+            finally:
+                cache.close()
+        self.assertEqual(len(self.requests), 2)
+
+    async def test_users_not_resolved_by_graphql_are_fetched_from_rest(self):
+        async def graphql(request, attempt):
+            variables = (await request.json())['variables']
+            data = {name: None if login == 'ghost' else {'bio': login, 'location': None, 'websiteUrl': None,
+                                                         'company': None}
+                    for name, login in variables.items()}
+            return web.json_response({'data': data}, headers=rate_limit_headers(4999))
+
+        async def ghost(request, attempt):
+            return web.json_response({**USER, 'login': 'ghost'}, headers=rate_limit_headers(4999))
+        self.responses['/graphql'] = graphql
+        self.responses['/users/ghost'] = ghost
+        async with self.client(tokens=['a'], batch_size=2) as client:
+            details = await client.fetch_users(['octocat', 'ghost', 'hubot'])
+        self.assertEqual(details['octocat']['bio'], 'octocat')
+        self.assertEqual(details['hubot']['blog'], '')
+        self.assertEqual(details['ghost']['company'], 'GitHub')
+        self.assertEqual(sorted(path for _, path, _ in self.requests),
+                         ['/graphql', '/graphql', '/users/ghost'])
+
+    async def test_rate_limited_graphql_query_is_sent_again(self):
+        async def graphql(request, attempt):
+            if attempt == 0:
+                return web.json_response({'errors': [{'type': 'RATE_LIMITED', 'message': 'API rate limit exceeded'}]})
+            variables = (await request.json())['variables']
+            return web.json_response({'data': {name: {'bio': '', 'location': '', 'websiteUrl': '', 'company': ''}
+                                               for name in variables}})
+        self.responses['/graphql'] = graphql
+        async with self.client(tokens=['a', 'b']) as client:
+            self.assertEqual(set(await client.fetch_users(['octocat'])), {'octocat'})
+        self.assertEqual([token for _, _, token in self.requests], ['a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import io
+import json
+import unittest
+from collections import defaultdict
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from json_to_csv_converter import JSONToCSVConverter
+
+CREATED_AT = '2023-01-01T15:00:00Z'
+USER = {'id': 3, 'login': 'user', 'type': None, 'site_admin': None}
+REACTIONS = {'total_count': 1, '+1': None, '-1': None, 'laugh': None, 'hooray': None, 'confused': None,
+             'heart': None, 'rocket': None, 'eyes': None}
+ISSUE = {'id': 10, 'number': 7, 'title': None, 'user': USER, 'state': None, 'locked': None, 'comments': None,
+         'created_at': CREATED_AT, 'updated_at': None, 'closed_at': None, 'labels': [{'name': None}],
+         'assignee': {'id': 4, 'login': None, 'type': None, 'site_admin': None}, 'assignees': [], 'milestone': None,
+         'body': None, 'reactions': REACTIONS}
+PULL_REQUEST = {'id': 20, 'number': 8, 'state': 'open', 'locked': False, 'title': 'title',
+                'user': {'id': 5, 'login': 'author', 'type': 'User', 'site_admin': False},
+                'head': {'sha': 'a' * 40, 'repo': None}, 'base': {'sha': 'b' * 40, 'repo': None}}
+
+
+def event(event_id, event_type, payload):
+    return json.dumps({'id': event_id, 'type': event_type, 'actor': {'id': 1, 'login': 'actor'},
+                       'repo': {'id': 2, 'name': 'owner/repo'}, 'public': True, 'created_at': CREATED_AT,
+                       'payload': payload}).encode() + b'\n'
+
+
+class RowRecorder:
+    def __init__(self):
+        self.rows = []
+
+    def writerow(self, row):
+        self.rows.append(row)
+
+
+class TestNullPayloadFields(unittest.TestCase):
+    """
+    The payloads of issues, issue comments and review comments were read as dicts, which accepted null values in
+    any field but the ids. The decoded structs must accept the same events and write the nulls as missing values.
+    """
+    def convert(self, *lines):
+        writer = SimpleNamespace(writers=defaultdict(RowRecorder))
+        converter = JSONToCSVConverter(writer=writer)
+        with self.assertNoLogs(level='ERROR'):
+            converter.write_events(io.BytesIO(b''.join(lines)))
+        self.assertEqual(converter.events_written, len(lines))
+        return {table: recorder.rows for table, recorder in writer.writers.items()}
+
+    def test_issues_event(self):
+        rows = self.convert(event('1', 'IssuesEvent', {'action': None, 'issue': ISSUE}))
+        self.assertEqual(rows['issue'], [(None, 10, 7, None, 'user', 3, None, None, [None], None, None, 4, [], None,
+                                          None, datetime(2023, 1, 1, 15, tzinfo=timezone.utc), None, None, None, None,
+                                          None, None, None, 1, None, None, None, None, None, None, None, None, None,
+                                          None)])
+
+    def test_issue_comment_event(self):
+        comment = {'id': 30, 'user': USER, 'created_at': None, 'updated_at': None, 'body': None,
+                   'reactions': REACTIONS, 'performed_via_github_app': None}
+        rows = self.convert(event('1', 'IssueCommentEvent', {'action': 'created', 'issue': ISSUE,
+                                                             'comment': comment}))
+        self.assertEqual(rows['issuecomment'], [(30, 10, None, None, None, None, None, None, 1, None, None, None, None,
+                                                 None, None, None, None, None)])
+        self.assertEqual(len(rows['issue']), 1)
+
+    def test_pull_request_review_comment_event(self):
+        comment = {'id': 40, 'pull_request_review_id': None, 'diff_hunk': None, 'path': None, 'position': None,
+                   'original_position': None, 'commit_id': None, 'original_commit_id': None, 'user': USER,
+                   'body': None, 'created_at': None, 'updated_at': None, 'reactions': None}
+        rows = self.convert(event('1', 'PullRequestReviewCommentEvent', {'action': 'created', 'comment': comment,
+                                                                         'pull_request': PULL_REQUEST}))
+        # the comment columns, the reactions and the columns of multi-line comments are all null
+        self.assertEqual(rows['pullrequestreviewcomment'], [(40, *(None,) * 7, 3, 'user', *(None,) * 22, 20)])
+        self.assertEqual(len(rows['archive']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import queue
+import tempfile
+import unittest
+from unittest import mock
+from manager import Manager
+
+
+def create_manager(data_path, start=(2023, 1, 1), end=(2023, 1, 1), **kwargs):
+    # the ledger connects to the database, which the options checked here do not need
+    with mock.patch('manager.Ledger'):
+        return Manager(*start, *end, data_path, None, None, None, None, None, None, **kwargs)
+
+
+class TestDedupStore(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_path = directory.name
+
+    def test_database_dedup_on_partitioned_tables_uses_converter_stores(self):
+        manager = create_manager(self.data_path, dedup_store='database', partitioned=True)
+        self.assertFalse(manager.merge)
+        self.assertEqual(manager.dedup_store, 'memory')
+        self.assertTrue(manager.partitioned)
+
+    def test_database_dedup_on_unpartitioned_tables_merges(self):
+        manager = create_manager(self.data_path, dedup_store='database')
+        self.assertTrue(manager.merge)
+        self.assertEqual(manager.dedup_store, 'database')
+
+
+class TestResume(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_path = directory.name
+
+    def insert(self, **kwargs):
+        manager = create_manager(self.data_path, load_mode='memory', **kwargs)
+        db = mock.Mock()
+        db.insert_csvs_into_db.return_value = True
+        manager.insert_into_db(db, '2023-01-01-0', mock.Mock(in_memory=True))
+        return manager.ledger
+
+    def test_no_resume_clears_the_loaded_tables(self):
+        ledger = self.insert(resume=False)
+        ledger.clear.assert_has_calls([mock.call('2023-01-01-0', 'loaded'), mock.call('2023-01-01-0', 'table')])
+        ledger.mark_loaded.assert_called_once_with('2023-01-01-0')
+
+    def test_resume_keeps_the_loaded_tables(self):
+        ledger = self.insert()
+        ledger.clear.assert_not_called()
+
+
+class TestMonthIndexing(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_path = directory.name
+
+    def test_months_are_indexed_once_all_their_hours_are_loaded(self):
+        manager = create_manager(self.data_path, start=(2023, 1, 31), end=(2023, 2, 1), partitioned=True,
+                                 index_loaded_months=True)
+        january = [f'2023-01-31-{h}' for h in range(24)]
+        february = [f'2023-02-01-{h}' for h in range(24)]
+        # an hour of January skipped as loaded, and resumed and downloaded hours of both months interleaved
+        manager.hour_finished(january.pop())
+        manager.written_queue = queue.Queue()
+        for date in [january[0], february[0], *january[1:12], *february[1:], *january[12:]]:
+            manager.written_queue.put(date)
+        manager.written_queue.put(None)
+        loaded = []
+        indexed = []
+        manager.insert_into_db = lambda db, date, writer: loaded.append(date)
+        manager.index_month = lambda indexer, db, month: indexed.append((month, len(loaded)))
+        with mock.patch('manager.DatabaseLink'):
+            manager.run_copy_into_database()
+        self.assertEqual(indexed, [('2023-02', 36), ('2023-01', 47)])
+
+
+if __name__ == '__main__':
+    unittest.main()